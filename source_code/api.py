@@ -9,27 +9,40 @@
 
 from intersection import get_intersection_data, plot_lanes
 from street import insert_street_names
-from guideway import get_left_turn_guideways, get_right_turn_guideways, plot_guideways, \
-    get_through_guideways, get_bicycle_left_turn_guideways, get_u_turn_guideways, relative_cut
+from guideway import plot_guideways, relative_cut, get_guideway_arrays, get_guideway_cache, get_guideway_component, \
+    iter_guideway_component, memoize_guideway_components
 from city import get_city_name_from_address
 from node import get_nodes_dict
 from data import get_data_from_file, get_city_from_osm
 from conflict import get_conflict_zones_per_guideway, plot_conflict_zones, plot_conflict_zone
 from blind import get_blind_zone_data, plot_sector, normalized_to_geo
 from correction import add_missing_highway_tag
+from snapshot import get_file_snapshot_key, get_city_snapshot_key, load_snapshot, save_snapshot
+from border import local_geometry, get_local_projection
 from log import get_logger
 
 
 logger = get_logger()
 
 
-def get_city(city_name):
+def get_city(city_name, cache_dir=None, data_timestamp=None):
     """
     Get city data as a dictionary.
+    If the cache directory is not None, the prepared city data is loaded from a snapshot
+    keyed by the city name and data timestamp, or saved there after the download.
     :param city_name: city name like 'Campbell, California, USA'
+    :param cache_dir: string or None
+    :param data_timestamp: string or None, by default the current date
     :return: city data dictionary
     """
 
+    snapshot_key = None
+    if cache_dir is not None:
+        snapshot_key = get_city_snapshot_key(city_name, data_timestamp)
+        city_data = load_snapshot(cache_dir, snapshot_key)
+        if city_data is not None:
+            return city_data
+
     city_paths_nodes = get_city_from_osm(city_name)
 
     if city_paths_nodes is None:
@@ -45,18 +58,34 @@ def get_city(city_name):
     }
 
     add_missing_highway_tag(city_data['paths'], get_streets(city_data))
+    city_data = insert_street_names(city_data)
+
+    if snapshot_key is not None:
+        save_snapshot(cache_dir, snapshot_key, city_data)
 
-    return insert_street_names(city_data)
+    return city_data
 
 
-def get_selection(file_name):
+def get_selection(file_name, cache_dir=None):
     """
     Get selection from an XML file.  Returns a dictionary with the data from the file 
     or None if unable to read/parse the file.
+    If the cache directory is not None, the prepared selection is loaded from a snapshot
+    keyed by the hash of the file content, or saved there after parsing the file.
     :param file_name: string
+    :param cache_dir: string or None
     :return: selection data dictionary
     """
 
+    snapshot_key = None
+    if cache_dir is not None:
+        snapshot_key = get_file_snapshot_key(file_name)
+        if snapshot_key is not None:
+            selection_data = load_snapshot(cache_dir, snapshot_key)
+            if selection_data is not None:
+                selection_data['name'] = file_name
+                return selection_data
+
     selection = get_data_from_file(file_name)
     if selection is None:
         return None
@@ -71,25 +100,31 @@ def get_selection(file_name):
     }
 
     add_missing_highway_tag(selection_data['paths'], get_streets(selection_data))
+    selection_data = insert_street_names(selection_data)
+
+    if snapshot_key is not None:
+        save_snapshot(cache_dir, snapshot_key, selection_data)
 
-    return insert_street_names(selection_data)
+    return selection_data
 
 
-def get_data(city_name=None, file_name=None):
+def get_data(city_name=None, file_name=None, cache_dir=None):
     """
     Get data either from OSM by city name or from an XML file by file name.
     If the city name is not None, than data will be downloaded from OSM online.
     If the file name is not None, the data will be loaded from the file.
     If both are not None, the file will be ignored and the city name parameter prevails.
     Returns a dictionary with the desired data or None if not found.
+    If the cache directory is not None, prepared data is cached there as binary snapshots.
     :param city_name: city name like 'Campbell, California, USA'
     :param file_name: string
+    :param cache_dir: string or None
     :return: selection data dictionary
     """
     if city_name is not None:
-        return get_city(city_name)
+        return get_city(city_name, cache_dir=cache_dir)
     elif file_name is not None:
-        return get_selection(file_name)
+        return get_selection(file_name, cache_dir=cache_dir)
     else:
         return None
 
@@ -144,27 +179,38 @@ def get_intersecting_streets(city_data):
     return sorted(list(intersecting_streets - duplicates))
 
 
-def get_intersection(street_tuple, city_data, size=500.0, crop_radius=150.0):
+def get_intersection(street_tuple, city_data, size=500.0, crop_radius=150.0, geometry='geodetic'):
     """
     Get a dictionary with all data related to an intersection.
     :param street_tuple: tuple of strings
     :param city_data: dictionary
     :param size: initial size of the surrounding area in meters
     :param crop_radius: the data will be cropped to the specified radius in meters
+    :param geometry: 'geodetic' to compute the geometry on the sphere (default) or 'local' to compute distances,
+                     bearings and shifted borders in the local tangent plane of the intersection
+                     with plain vector math, which is faster.
+                     All coordinates stay in longitude and latitude in both modes, so Shapely polygons,
+                     areas and distances, e.g. in conflict and blind zones, are still in degrees.
+                     The intersection keeps the choice for guideways, conflict zones and blind zones.
     :return: dictionary
     """
     if city_data is None:
         logger.error('City data is None')
         return None
     try:
-        intersection_data = get_intersection_data(street_tuple, city_data, size=size, crop_radius=crop_radius)
+        intersection_data = get_intersection_data(street_tuple,
+                                                  city_data,
+                                                  size=size,
+                                                  crop_radius=crop_radius,
+                                                  geometry=geometry
+                                                  )
     except Exception as e:
         logger.exception('Exception %r, %s, %r' % (street_tuple, city_data['name'], e))
         return None
     return intersection_data
 
 
-def get_intersections(list_of_addresses, size=500.0, crop_radius=150.0):
+def get_intersections(list_of_addresses, size=500.0, crop_radius=150.0, geometry='geodetic'):
     """
     Get a list of intersections defined by their addresses, 
     e.g. ["San Pablo and University, Berkeley, California", "Van Ness and Geary, San Francisco, Califocrnia", ...]
@@ -178,6 +224,7 @@ def get_intersections(list_of_addresses, size=500.0, crop_radius=150.0):
     :param list_of_addresses: list of strings or a string
     :param size: float in meters
     :param crop_radius: float in meters
+    :param geometry: 'geodetic' or 'local', see get_intersection
     :return: list of intersections as dictionaries
     """
 
@@ -194,7 +241,12 @@ def get_intersections(list_of_addresses, size=500.0, crop_radius=150.0):
         for x_tuple in get_intersection_tuples_by_address(cities[city_name], address):
             if x_tuple is None:
                 continue
-            intersection_data = get_intersection(x_tuple, cities[city_name], size=size, crop_radius=crop_radius)
+            intersection_data = get_intersection(x_tuple,
+                                                 cities[city_name],
+                                                 size=size,
+                                                 crop_radius=crop_radius,
+                                                 geometry=geometry
+                                                 )
             if intersection_data is not None:
                 result.append(intersection_data)
 
@@ -342,8 +394,15 @@ def get_guideway_by_approach_id(intersection_data, approach_id):
     :param approach_id: integer
     :return: list of guideways
     """
+    if intersection_data is None:
+        return []
 
-    return [g for g in get_guideways(intersection_data, guideway_type='all') if g['origin_lane']['id'] == approach_id]
+    guideway_cache = get_guideway_cache(intersection_data)
+    if guideway_cache.by_approach_id is None:
+        guideway_cache.by_approach_id = guideway_cache.get_index(get_memoized_guideways(intersection_data, 'all'),
+                                                                 'origin_lane'
+                                                                 )
+    return [g.copy() for g in guideway_cache.by_approach_id.get(approach_id, [])]
 
 
 def get_guideway_by_exit_id(intersection_data, exit_id):
@@ -353,7 +412,15 @@ def get_guideway_by_exit_id(intersection_data, exit_id):
     :param exit_id: integer
     :return: list of guideways
     """
-    return [g for g in get_guideways(intersection_data, guideway_type='all') if g['destination_lane']['id'] == exit_id]
+    if intersection_data is None:
+        return []
+
+    guideway_cache = get_guideway_cache(intersection_data)
+    if guideway_cache.by_exit_id is None:
+        guideway_cache.by_exit_id = guideway_cache.get_index(get_memoized_guideways(intersection_data, 'all'),
+                                                             'destination_lane'
+                                                             )
+    return [g.copy() for g in guideway_cache.by_exit_id.get(exit_id, [])]
 
 
 def get_intersection_image(intersection_data, alpha=1.0):
@@ -407,7 +474,7 @@ def get_intersection_image(intersection_data, alpha=1.0):
     return fig
 
 
-def get_guideways(intersection_data, guideway_type='all'):
+def get_guideways(intersection_data, guideway_type='all', resample_spacing=None, processes=None):
     """
     Get a list of guideways for the intersection by the specified type.
 
@@ -435,60 +502,156 @@ def get_guideways(intersection_data, guideway_type='all'):
      'type',
      'length'
 
+    Guideways are memoized in the intersection dictionary, see get_guideway_cache.
+    Each call returns shallow copies of the memoized guideways, so keys added by the caller,
+    e.g. the reduced borders of conflict zones, do not leak into other calls.
+    If the resample spacing is not None, each guideway has an additional key 'arrays':
+    read-only numpy arrays resampled at the spacing along the median, see guideway.get_guideway_arrays.
+    The arrays are calculated once per guideway and spacing.
+    If the number of processes is not None, the guideways that are not memoized yet are created
+    in a pool of worker processes, see guideway.memoize_guideway_components.  The guideways and their ids are the same.
+
     :param intersection_data: dictionary
     :param guideway_type: string
+    :param resample_spacing: float, distance between resampled points in meters, or None
+    :param processes: integer, number of worker processes, or None to create the guideways in this process
     :return: list of dictionaries
     """
 
     if intersection_data is None:
         return []
 
-    guideway_type = guideway_type.lower()
+    memoized_guideways = get_memoized_guideways(intersection_data, guideway_type, processes=processes)
+    if resample_spacing is None:
+        return [g.copy() for g in memoized_guideways]
+
+    guideway_cache = get_guideway_cache(intersection_data)
+    projection = intersection_data.get('projection')
+    if projection is None:
+        projection = get_local_projection(intersection_data['center_x'], intersection_data['center_y'])
+    arrays = guideway_cache.arrays.setdefault(resample_spacing, {})
     guideways = []
+    for g in memoized_guideways:
+        if id(g) not in arrays:
+            arrays[id(g)] = get_guideway_arrays(g, spacing=resample_spacing, projection=projection)
+        guideway_data = g.copy()
+        guideway_data['arrays'] = arrays[id(g)]
+        guideways.append(guideway_data)
+    return guideways
+
+
+def get_memoized_guideways(intersection_data, guideway_type, processes=None):
+    """
+    Get the memoized list of guideways of a type.  The guideways are shared by all callers and must not be modified.
+    :param intersection_data: dictionary
+    :param guideway_type: string, see get_guideways
+    :param processes: integer, number of worker processes, or None to create the guideways in this process
+    :return: list of dictionaries
+    """
+    guideway_cache = get_guideway_cache(intersection_data)
+    guideway_type = guideway_type.lower()
+    if guideway_type not in guideway_cache.guideways:
+        if processes is not None:
+            memoize_guideway_components(intersection_data, get_guideway_components(guideway_type), processes)
+        guideways = []
+        for component in get_guideway_components(guideway_type):
+            guideways.extend(get_guideway_component(intersection_data, component))
+        guideway_cache.guideways[guideway_type] = guideways
+    return guideway_cache.guideways[guideway_type]
+
+
+def iter_guideways(intersection_data, guideway_type='all', filter=None):
+    """
+    Generate guideways for the intersection by the specified type as they are created.
+    The guideways, their ids and order are the same as in get_guideways, see get_guideways for the valid types.
+    Guideways that are not memoized yet are created origin lane by origin lane and are not memoized,
+    so a caller that stops early or selects a few guideways does not pay for creating all of them.
+
+    The filter is a function of a guideway returning True for the guideways to generate, e.g.
+    lambda g: g['origin_lane']['name'] == 'Main Street'.
+    It is applied before the geometry of a guideway is created and receives a guideway with the keys
+    'id', 'type', 'direction', 'origin_lane' and 'destination_lane' only, see guideway.is_guideway_selected.
+
+    :param intersection_data: dictionary
+    :param guideway_type: string
+    :param filter: function of a guideway returning boolean or None to generate all guideways
+    :return: generator of dictionaries
+    """
+
+    if intersection_data is None:
+        return
+
+    guideway_cache = get_guideway_cache(intersection_data)
+    guideway_type = guideway_type.lower()
+    if guideway_type in guideway_cache.guideways:
+        for g in guideway_cache.guideways[guideway_type]:
+            if filter is None or filter(g):
+                yield g.copy()
+        return
+
+    for component in get_guideway_components(guideway_type):
+        for g in iter_guideway_component(intersection_data, component, guideway_filter=filter):
+            yield g
+
+
+def invalidate_guideways(intersection_data):
+    """
+    Remove memoized guideways of the intersection.
+    Call this function after changing lanes or lane borders of the intersection in place.
+    :param intersection_data: dictionary
+    :return: None
+    """
+    if intersection_data is not None and 'guideway_cache' in intersection_data:
+        intersection_data['guideway_cache'].clear()
+
+
+def get_guideway_components(guideway_type):
+    """
+    Get the list of guideway components for a guideway type in the order of the guideway list.
+    See get_guideways for the valid types.
+    :param guideway_type: string in lower case
+    :return: list of strings
+    """
+    components = []
     if 'vehicle' in guideway_type and 'left' in guideway_type \
             or (guideway_type == 'all vehicle') \
             or (guideway_type == 'all'):
-        guideways.extend(get_left_turn_guideways(intersection_data['merged_lanes'],
-                                                 intersection_data['nodes'],
-                                                 )
-                         )
+        components.append('vehicle left')
+
     if 'vehicle' in guideway_type and 'right' in guideway_type \
             or (guideway_type == 'all vehicle') \
             or (guideway_type == 'all'):
-        guideways.extend(get_right_turn_guideways(intersection_data['merged_lanes']))
+        components.append('vehicle right')
 
     if 'vehicle' in guideway_type and 'through' in guideway_type \
             or (guideway_type == 'all vehicle') \
             or (guideway_type == 'all'):
-        guideways.extend(get_through_guideways(intersection_data['merged_lanes']))
+        components.append('vehicle through')
 
     if 'vehicle' in guideway_type and 'u-turn' in guideway_type \
             or (guideway_type == 'all vehicle') \
             or (guideway_type == 'all'):
-        guideways.extend(get_u_turn_guideways(intersection_data['merged_lanes'], intersection_data))
+        components.append('vehicle u-turn')
 
     if 'rail' in guideway_type or (guideway_type == 'all'):
-        guideways.extend(get_through_guideways(intersection_data['merged_tracks']))
+        components.append('rail')
 
     if ('bicycle' in guideway_type and 'left' in guideway_type) \
             or (guideway_type == 'all bicycle') \
             or (guideway_type == 'all'):
-        guideways.extend(get_bicycle_left_turn_guideways(intersection_data['merged_cycleways'],
-                                                         intersection_data['nodes']
-                                                         )
-                         )
+        components.append('bicycle left')
 
     if ('bicycle' in guideway_type and 'right' in guideway_type) \
             or (guideway_type == 'all bicycle') \
             or (guideway_type == 'all'):
-        guideways.extend(get_right_turn_guideways(intersection_data['merged_cycleways']))
+        components.append('bicycle right')
 
     if ('bicycle' in guideway_type and 'through' in guideway_type) \
             or (guideway_type == 'all bicycle') \
             or (guideway_type == 'all'):
-        guideways.extend(get_through_guideways(intersection_data['merged_cycleways']))
+        components.append('bicycle through')
 
-    return guideways
+    return components
 
 
 def get_reduced_guideway(guideway_data, relative_distance, starting_point_for_cut="b"):
@@ -627,7 +790,11 @@ def get_conflict_zones(guideway_data, all_guideways=None, intersection_data=None
             return []
         all_guideways = get_guideways(intersection_data, guideway_type='all') + get_crosswalks(intersection_data)
 
-    return get_conflict_zones_per_guideway(guideway_data, all_guideways, polygons_dict)
+    projection = None
+    if intersection_data is not None:
+        projection = intersection_data.get('projection')
+    with local_geometry(projection):
+        return get_conflict_zones_per_guideway(guideway_data, all_guideways, polygons_dict)
 
 
 def get_all_conflict_zones(intersection_data, all_guideways=[]):
@@ -643,8 +810,9 @@ def get_all_conflict_zones(intersection_data, all_guideways=[]):
     if not all_guideways:
         all_guideways = get_guideways(intersection_data, guideway_type='all') + get_crosswalks(intersection_data)
     polygons_dict = {}
-    for guideway_data in all_guideways:
-        all_conflict_zones.extend(get_conflict_zones_per_guideway(guideway_data, all_guideways, polygons_dict))
+    with local_geometry(intersection_data.get('projection')):
+        for guideway_data in all_guideways:
+            all_conflict_zones.extend(get_conflict_zones_per_guideway(guideway_data, all_guideways, polygons_dict))
 
     return all_conflict_zones
 
@@ -748,7 +916,8 @@ def get_geo_coordinates(point_of_view, guideway_data, conflict_zone=None):
     return normalized_to_geo(point_of_view, guideway_data, conflict_zone=conflict_zone)
 
 
-def get_blind_zone(point_of_view, current_guideway, conflict_zone, blocking_guideways, all_guideways):
+def get_blind_zone(point_of_view, current_guideway, conflict_zone, blocking_guideways, all_guideways,
+                   intersection_data=None):
     """
     Get a blind zone
     :param point_of_view: normalized coordinates along the current guideway: (x,y), where x and y within [0.0,1.0]
@@ -756,22 +925,29 @@ def get_blind_zone(point_of_view, current_guideway, conflict_zone, blocking_guid
     :param conflict_zone: conflict zone dictionary.  It must belong to the current guideway
     :param blocking_guideways: list of guideway dictionaries representing guideways creating blind zones
     :param all_guideways: list of all guideway dictionaries in the intersection
+    :param intersection_data: intersection dictionary, optional: used to compute the geometry
+                              the same way as for the intersection
     :return: blind zone dictionary
     """
     if point_of_view is None or current_guideway is None or conflict_zone is None \
             or blocking_guideways is None or all_guideways is None:
         return None
 
+    projection = None
+    if intersection_data is not None:
+        projection = intersection_data.get('projection')
+
     try:
-        for guideway_data in all_guideways:
-            if 'reduced_left_border' not in guideway_data:
-                get_conflict_zones_per_guideway(guideway_data, all_guideways, {})
-        blind_zone_data = get_blind_zone_data(point_of_view,
-                                              current_guideway,
-                                              conflict_zone,
-                                              blocking_guideways,
-                                              all_guideways
-                                              )
+        with local_geometry(projection):
+            for guideway_data in all_guideways:
+                if 'reduced_left_border' not in guideway_data:
+                    get_conflict_zones_per_guideway(guideway_data, all_guideways, {})
+            blind_zone_data = get_blind_zone_data(point_of_view,
+                                                  current_guideway,
+                                                  conflict_zone,
+                                                  blocking_guideways,
+                                                  all_guideways
+                                                  )
     except Exception as e:
         logger.error('Blind zone exception: point %r, guideway %d, conflict zone %r'
                          % (point_of_view, current_guideway['id'], conflict_zone['id']))
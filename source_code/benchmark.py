@@ -0,0 +1,267 @@
+#!python
+'''
+Benchmarks for the intelligent intersection pipeline.
+
+Usage:
+    python benchmark.py [osm_file] [scale] [street_1] [street_2]
+
+The loader benchmark compares the incremental OSM loader against the original xmltodict loader
+on the given file and on a synthetic file that repeats its content scale times with shifted ids.
+The subset benchmark compares scanning the whole selection against the grid index query for an intersection box
+on a synthetic file tiling copies of the given file side by side.
+The node store benchmark compares the memory of per-node dictionaries against the columnar NodeStore.
+The intersection benchmark measures time and memory allocated while extracting an intersection
+with the geometry computed on the sphere and in the local tangent plane.
+The snapshot benchmark compares preparing the selection from the file against loading its snapshot.
+The distance benchmark compares per-pair great-circle distances against the vectorized kernel.
+
+'''
+
+import gc
+import os
+import sys
+import time
+import tempfile
+import shutil
+import tracemalloc
+import xml.etree.ElementTree as ElementTree
+from data import get_data_from_file, get_data_from_file_with_xmltodict, get_data_subset, get_grid_index
+from border import get_box, great_circle_vec_check_for_nan, get_distances_to_point
+from api import get_selection, get_intersection
+from node import get_nodes_dict
+
+
+def measure(func, *args, **kwargs):
+    """
+    Run a function and measure its execution time and peak memory allocation
+    :param func: function
+    :return: a tuple: function result, time in seconds, peak allocation in megabytes
+    """
+    tracemalloc.start()
+    start = time.time()
+    result = func(*args, **kwargs)
+    elapsed = time.time() - start
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024.0 / 1024.0
+
+
+def create_synthetic_osm_file(source_file_name, scale=20, lon_offset=0.0):
+    """
+    Create a larger OSM file by repeating the content of the source file with shifted ids
+    :param source_file_name: string
+    :param scale: integer number of copies
+    :param lon_offset: float: longitude shift in degrees between copies, 0.0 to place copies on top of each other
+    :return: file name of the synthetic file
+    """
+    tree = ElementTree.parse(source_file_name)
+    root = tree.getroot()
+    elements = [e for e in root if e.tag in ('node', 'way', 'relation')]
+    id_shift = 1 + max([int(e.attrib['id']) for e in elements])
+
+    synthetic_root = ElementTree.Element(root.tag, root.attrib)
+    for e in root:
+        if e.tag == 'bounds':
+            synthetic_root.append(e)
+
+    for tag in ('node', 'way', 'relation'):
+        for i in range(scale):
+            for e in [x for x in elements if x.tag == tag]:
+                copy_of_e = ElementTree.fromstring(ElementTree.tostring(e))
+                copy_of_e.attrib['id'] = str(int(e.attrib['id']) + i * id_shift)
+                if 'lon' in copy_of_e.attrib:
+                    copy_of_e.attrib['lon'] = repr(float(copy_of_e.attrib['lon']) + i * lon_offset)
+                for child in copy_of_e:
+                    if 'ref' in child.attrib and (child.tag == 'nd' or child.attrib.get('type') == 'node'):
+                        child.attrib['ref'] = str(int(child.attrib['ref']) + i * id_shift)
+                synthetic_root.append(copy_of_e)
+
+    handle, file_name = tempfile.mkstemp(suffix='.osm')
+    os.close(handle)
+    ElementTree.ElementTree(synthetic_root).write(file_name, encoding='utf-8', xml_declaration=True)
+    return file_name
+
+
+def benchmark_loaders(file_name):
+    """
+    Compare the incremental loader with the xmltodict loader
+    :param file_name: string
+    :return: None
+    """
+    size = os.path.getsize(file_name) / 1024.0 / 1024.0
+    streamed, t1, m1 = measure(get_data_from_file, file_name)
+    original, t0, m0 = measure(get_data_from_file_with_xmltodict, file_name)
+
+    print('%s (%.1f MB, %d elements)' % (file_name, size, len(streamed[0]['elements'])))
+    print('    xmltodict:   %8.3f s  %8.1f MB peak' % (t0, m0))
+    print('    incremental: %8.3f s  %8.1f MB peak' % (t1, m1))
+    print('    identical selection: %r' % (streamed == original))
+
+
+def benchmark_data_subset(file_name, scale=20, size=500.0):
+    """
+    Compare the full scan of a selection with the grid index query for subsets of an intersection box
+    :param file_name: string
+    :param scale: integer number of tiled copies
+    :param size: float: half size of the box in meters
+    :return: None
+    """
+    synthetic_file = create_synthetic_osm_file(file_name, scale=scale, lon_offset=0.02)
+    try:
+        selection = get_data_from_file(synthetic_file)
+    finally:
+        os.remove(synthetic_file)
+
+    bounds = selection[0]['bounds']
+    box = get_box((bounds['@minlon'] + bounds['@maxlon']) / 2.0, (bounds['@minlat'] + bounds['@maxlat']) / 2.0, size=size)
+    _grid_index, t, _m = measure(get_grid_index, selection)
+    print('%s subsets (%d elements, %d copies, index built in %.3f s)'
+          % (file_name, len(selection[0]['elements']), scale, t))
+
+    for network_type, infrastructure in [('drive', 'way["highway"]'),
+                                         ('all', 'way["railway"]'),
+                                         ('all', 'node["highway"]')
+                                         ]:
+        full, t0, _m0 = measure(get_data_subset, selection, network_type=network_type, infrastructure=infrastructure)
+        boxed, t1, _m1 = measure(get_data_subset, selection,
+                                 network_type=network_type,
+                                 infrastructure=infrastructure,
+                                 box=box
+                                 )
+        print('    %-16s full scan: %8.3f s %6d elements   grid index: %8.3f s %6d elements'
+              % (infrastructure, t0, len(full[0]['elements']), t1, len(boxed[0]['elements'])))
+
+
+def measure_retained_nodes(file_name, nodes_dict=None):
+    """
+    Build the nodes of a file and measure the memory retained by them after the parsed elements are released
+    :param file_name: string
+    :param nodes_dict: dictionary or None for a NodeStore
+    :return: a tuple: nodes, retained allocation in megabytes
+    """
+    tracemalloc.start()
+    selection = get_data_from_file(file_name)
+    nodes = get_nodes_dict(selection, nodes_dict=nodes_dict)
+    del selection
+    gc.collect()
+    current, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return nodes, current / 1024.0 / 1024.0
+
+
+def benchmark_node_store(file_name):
+    """
+    Compare memory and coordinate lookup of per-node dictionaries and the columnar NodeStore
+    :param file_name: string
+    :return: None
+    """
+    nodes_dict, m0 = measure_retained_nodes(file_name, nodes_dict={})
+    node_store, m1 = measure_retained_nodes(file_name)
+    node_ids = list(nodes_dict.keys())
+
+    _coordinates, t0, _m = measure(lambda: [(nodes_dict[n]['x'], nodes_dict[n]['y']) for n in node_ids])
+    _coordinates, t1, _m = measure(node_store.get_coordinates, node_ids)
+
+    print('%s nodes (%d nodes)' % (file_name, len(node_store)))
+    print('    dictionaries: %8.1f MB retained  %8.3f s coordinate lookup' % (m0, t0))
+    print('    node store:   %8.1f MB retained  %8.3f s coordinate lookup' % (m1, t1))
+    print('    identical nodes: %r' % (dict(node_store.items()) == nodes_dict))
+
+
+def benchmark_intersection(file_name, street_tuple, crop_radius=50.0, geometry='geodetic'):
+    """
+    Measure time, peak and retained memory allocated while extracting an intersection
+    :param file_name: string
+    :param street_tuple: tuple of strings
+    :param crop_radius: float
+    :param geometry: 'geodetic' or 'local'
+    :return: None
+    """
+    selection = get_selection(file_name)
+    tracemalloc.start()
+    start = time.time()
+    intersection = get_intersection(street_tuple, selection, crop_radius=crop_radius, geometry=geometry)
+    elapsed = time.time() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print('%s intersection %r, %s geometry' % (file_name, street_tuple, geometry))
+    print('    %8.3f s  %8.1f MB peak  %8.1f MB retained  %d lanes'
+          % (elapsed, peak / 1024.0 / 1024.0, current / 1024.0 / 1024.0, len(intersection['merged_lanes'])))
+
+
+def benchmark_snapshot(file_name):
+    """
+    Compare preparing a selection from the file with loading it from a snapshot
+    :param file_name: string
+    :return: None
+    """
+    cache_dir = tempfile.mkdtemp()
+    try:
+        prepared, t0, m0 = measure(get_selection, file_name, cache_dir=cache_dir)
+        cached, t1, m1 = measure(get_selection, file_name, cache_dir=cache_dir)
+    finally:
+        shutil.rmtree(cache_dir)
+
+    print('%s snapshot' % file_name)
+    print('    prepare and save: %8.3f s  %8.1f MB peak' % (t0, m0))
+    print('    load snapshot:    %8.3f s  %8.1f MB peak' % (t1, m1))
+    print('    identical selection: %r' % (prepared == cached))
+
+
+def benchmark_distances(file_name):
+    """
+    Compare per-pair great-circle distances from the center of a file to all its nodes with the vectorized kernel
+    :param file_name: string
+    :return: None
+    """
+    node_store = get_nodes_dict(get_data_from_file(file_name))
+    coordinates = node_store.get_coordinates(list(node_store.keys()))
+    x0, y0 = coordinates.mean(axis=0).tolist()
+
+    scalar, t0, _m = measure(lambda: [great_circle_vec_check_for_nan(y0, x0, y, x) for x, y in coordinates.tolist()])
+    vectorized, t1, _m = measure(get_distances_to_point, (x0, y0), coordinates)
+
+    print('%s distances (%d nodes)' % (file_name, len(coordinates)))
+    print('    per pair:   %8.3f s' % t0)
+    print('    vectorized: %8.3f s' % t1)
+    print('    max difference: %r m' % max([abs(a - b) for a, b in zip(scalar, vectorized.tolist())] + [0.0]))
+
+
+# ==============================================================================
+# Main function - for standalone execution.
+# ==============================================================================
+
+def main(argv):
+    print(__doc__)
+
+    osm_file = "maps/ComponentDr_NorthFirstSt_SJ.osm"
+    scale = 20
+    street_tuple = ('North 1st Street', 'Component Drive')
+    if len(argv) > 1:
+        osm_file = argv[1]
+    if len(argv) > 2:
+        scale = int(argv[2])
+    if len(argv) > 4:
+        street_tuple = (argv[3], argv[4])
+
+    benchmark_loaders(osm_file)
+    benchmark_node_store(osm_file)
+    benchmark_snapshot(osm_file)
+    benchmark_distances(osm_file)
+    benchmark_intersection(osm_file, street_tuple)
+    benchmark_intersection(osm_file, street_tuple, geometry='local')
+
+    synthetic_file = create_synthetic_osm_file(osm_file, scale=scale)
+    try:
+        benchmark_loaders(synthetic_file)
+        benchmark_node_store(synthetic_file)
+        benchmark_snapshot(synthetic_file)
+    finally:
+        os.remove(synthetic_file)
+
+    benchmark_data_subset(osm_file, scale=scale)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
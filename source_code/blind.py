@@ -7,64 +7,61 @@
 #######################################################################
 
 
+import numpy as np
 import shapely.geometry as geom
 from matplotlib.patches import Polygon
 from matplotlib.patches import Circle
 from guideway import get_polygon_from_guideway
-from border import get_compass, get_distance_between_points, get_closest_point, cut_border_by_polygon, get_box
+from border import get_closest_point, cut_border_by_polygon, get_box, get_point_by_azimuth, get_bearings_from_point, \
+    get_distances_to_point
 from conflict import get_polygon_from_conflict_zone, cut_guideway_borders_by_conflict_zone, \
     is_conflict_zone_matching_guideway
-import nvector as nv
 from log import get_logger
 
 
 logger = get_logger()
-nv_frame = nv.FrameE(a=6371e3, f=0)
 
 
-def get_sector(point, block):
+def get_nearest_index(point, points, indices):
+    """
+    Get index of the point nearest to the given point among the indexed points, the first one if tied
+    :param point: point coordinates
+    :param points: list of coordinates
+    :param indices: numpy array of indices
+    :return: integer
+    """
+    if len(indices) == 1:
+        return int(indices[0])
+    distances = get_distances_to_point(point, [points[i] for i in indices])
+    return int(indices[int(np.argmin(distances))])
+
+
+def get_sector(point, block, azimuths=None):
     """
     Get visibility sector from a point to a blocking object
     :param point: point coordinates
     :param block: guideway dictionary
+    :param azimuths: precomputed azimuths from the point to the reduced left and right border points, optional
     :return: max and min azimuths and points where sector boundaries crosses the block
     """
-    max_azimuth = -1.0
-    min_azimuth = 361.0
-    for x in block['reduced_left_border'] + block['reduced_right_border']:
-        azimuth = get_compass(point, x)
-
-        if azimuth < min_azimuth:
-            min_point = x
-            min_azimuth = azimuth
-        elif azimuth == min_azimuth:
-            if get_distance_between_points(point, x) < get_distance_between_points(point, min_point):
-                min_point = x
-                min_azimuth = azimuth
-
-        if azimuth > max_azimuth:
-            max_point = x
-            max_azimuth = azimuth
-        elif azimuth == max_azimuth:
-            if get_distance_between_points(point, x) < get_distance_between_points(point, max_point):
-                max_point = x
-                max_azimuth = azimuth
-
-    return min_azimuth, max_azimuth, min_point, max_point
+    points = block['reduced_left_border'] + block['reduced_right_border']
+    if azimuths is None:
+        azimuths = get_bearings_from_point(point, points)
 
+    min_azimuth = azimuths.min()
+    max_azimuth = azimuths.max()
+    min_point = points[get_nearest_index(point, points, np.flatnonzero(azimuths == min_azimuth))]
+    max_point = points[get_nearest_index(point, points, np.flatnonzero(azimuths == max_azimuth))]
 
-def get_point_by_azimuth(point, azimuth, distance=10000.0):
-    pt = nv_frame.GeoPoint(latitude=point[1], longitude=point[0], degrees=True)
-    result, _azimuthb = pt.geo_point(distance=distance, azimuth=azimuth, degrees=True)
-    return result.longitude_deg, result.latitude_deg
+    return float(min_azimuth), float(max_azimuth), min_point, max_point
 
 
 def is_azimuth_in_the_shadow(point, border, azimuth=0.0):
     return geom.LineString(border).intersects(geom.LineString([point, get_point_by_azimuth(point, azimuth)]))
 
 
-def get_sector_polygon(point, block):
-    min_azimuth, max_azimuth, min_point, max_point = get_sector(point, block)
+def get_sector_polygon(point, block, azimuths=None):
+    min_azimuth, max_azimuth, min_point, max_point = get_sector(point, block, azimuths=azimuths)
 
     bissectrice = (min_azimuth + max_azimuth)/2.0
     inverted_bissectrice = (bissectrice + 180.0) % 360.0
@@ -95,14 +92,16 @@ def combine_sector_polygons(point, block):
     polygons = []
     if 'reduced_left_border' not in block:
         return None
-    pt0 = block['reduced_left_border'][0]
-    for pt1 in (block['reduced_left_border'] + block['reduced_right_border'][::-1])[1:]:
+    outline = block['reduced_left_border'] + block['reduced_right_border'][::-1]
+    azimuths = get_bearings_from_point(point, outline)
+    pt0 = outline[0]
+    for i, pt1 in enumerate(outline[1:]):
         temp_block = {'reduced_left_border': [pt0, pt1],
                       'median': block['median'],
                       'reduced_right_border': [],
                       'id': block['id']
                       }
-        pol = get_sector_polygon(point, temp_block)
+        pol = get_sector_polygon(point, temp_block, azimuths=azimuths[i:i + 2])
         pt0 = pt1
         if not isinstance(pol, geom.polygon.Polygon):
             continue
@@ -6,25 +6,171 @@
 #
 #######################################################################
 
-import osmnx as ox
 import math
+import threading
+import contextlib
+import numpy as np
 import shapely.geometry as geom
 import nvector as nv
-import copy
 from log import get_logger, dictionary_to_log
+from node_store import get_node_coordinates
+from polyline import Polyline, get_polyline
 
 
 logger = get_logger()
 
 rhumbs = ['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW']
 nv_frame = nv.FrameE(a=6371e3, f=0)
+earth_radius = 6371009.0
+geometry_state = threading.local()
+
+
+def get_local_projection(center_x, center_y):
+    """
+    Get a local tangent plane (east, north, up) projection centered at the intersection center.
+    Within a few hundred meters from the center the plane differs from the sphere by less than a millimeter,
+    and the projection to and from the plane is a linear scaling of the coordinate differences,
+    so the geometry can be computed with plain vector math instead of trigonometry on the sphere.
+    :param center_x: longitude of the center
+    :param center_y: latitude of the center
+    :return: projection dictionary
+    """
+    return {
+        'center_x': center_x,
+        'center_y': center_y,
+        'meters_per_degree_x': earth_radius * math.cos(math.radians(center_y)) * math.pi / 180.0,
+        'meters_per_degree_y': earth_radius * math.pi / 180.0
+    }
+
+
+def get_active_projection():
+    """
+    Get the local projection of the geometry computed in the current thread
+    :return: projection dictionary or None if the geometry is computed on the sphere
+    """
+    return getattr(geometry_state, 'projection', None)
+
+
+@contextlib.contextmanager
+def local_geometry(projection):
+    """
+    Compute the geometry within the context in a local tangent plane.
+    Distances, bearings and shifts are computed in the plane of the projection,
+    while all coordinates stay in longitude and latitude.  If the projection is None, the geometry is computed
+    on the sphere.  The projection is set per thread, so intersections can be processed concurrently.
+    :param projection: projection dictionary or None
+    :return: None
+    """
+    previous_projection = get_active_projection()
+    geometry_state.projection = projection
+    try:
+        yield
+    finally:
+        geometry_state.projection = previous_projection
+
+
+def to_local(coordinates, projection):
+    """
+    Project coordinates to the local tangent plane
+    :param coordinates: list of coordinates or numpy array of shape (n, 2)
+    :param projection: projection dictionary
+    :return: numpy array of shape (n, 2) with east and north columns in meters
+    """
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    return np.column_stack(((coordinates[:, 0] - projection['center_x']) * projection['meters_per_degree_x'],
+                            (coordinates[:, 1] - projection['center_y']) * projection['meters_per_degree_y']
+                            ))
+
+
+def to_geographic(points, projection):
+    """
+    Project points from the local tangent plane back to longitude and latitude
+    :param points: list of points or numpy array of shape (n, 2) with east and north columns in meters
+    :param projection: projection dictionary
+    :return: list of coordinates
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    x = (points[:, 0] / projection['meters_per_degree_x'] + projection['center_x']).tolist()
+    y = (points[:, 1] / projection['meters_per_degree_y'] + projection['center_y']).tolist()
+    return list(zip(x, y))
+
+
+def get_great_circle_distances(y0, x0, y1, x1):
+    """
+    Vectorized great-circle distance between points or arrays of points using the haversine formula.
+    The arguments can be floats or arrays of any shapes that can be broadcast together.
+    NaN distances are replaced with 0.
+    Within a local geometry context the distance is measured in the local tangent plane.
+    The operations are the same as in osmnx.great_circle_vec, so the distances match osmnx
+    to within 1e-12 relative (about 1e-9 m over a kilometer): the only difference may come from
+    array and scalar NumPy math functions rounding the last bit differently.
+    :param y0: latitude(s) of the first point(s)
+    :param x0: longitude(s) of the first point(s)
+    :param y1: latitude(s) of the second point(s)
+    :param x1: longitude(s) of the second point(s)
+    :return: numpy array of distances in meters
+    """
+    projection = get_active_projection()
+    if projection is not None:
+        return np.hypot((np.asarray(x1) - x0) * projection['meters_per_degree_x'],
+                        (np.asarray(y1) - y0) * projection['meters_per_degree_y']
+                        )
+
+    phi0 = np.deg2rad(y0)
+    phi1 = np.deg2rad(y1)
+    d_phi = phi1 - phi0
+
+    theta0 = np.deg2rad(x0)
+    theta1 = np.deg2rad(x1)
+    d_theta = theta1 - theta0
+
+    h = np.sin(d_phi / 2) ** 2 + np.cos(phi0) * np.cos(phi1) * np.sin(d_theta / 2) ** 2
+    h = np.minimum(1.0, h)
+
+    distance = 2 * np.arcsin(np.sqrt(h)) * earth_radius
+    return np.where(np.isnan(distance), 0.0, distance)
+
+
+def get_distances_to_point(point, coordinates):
+    """
+    Get distances from a point to each point in a list
+    :param point: coordinates
+    :param coordinates: list of coordinates or numpy array of shape (n, 2)
+    :return: numpy array of n distances in meters
+    """
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    return get_great_circle_distances(point[1], point[0], coordinates[:, 1], coordinates[:, 0])
+
+
+def get_segment_lengths(coordinates):
+    """
+    Get lengths of all segments of a polyline
+    :param coordinates: list of coordinates or numpy array of shape (n, 2)
+    :return: numpy array of n-1 lengths in meters
+    """
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    return get_great_circle_distances(coordinates[:-1, 1], coordinates[:-1, 0], coordinates[1:, 1], coordinates[1:, 0])
+
+
+def get_cumulative_lengths(coordinates):
+    """
+    Get length of a polyline from the first point to each point
+    :param coordinates: list of coordinates or numpy array of shape (n, 2)
+    :return: numpy array of n lengths in meters starting with 0
+    """
+    return np.concatenate(([0.0], np.cumsum(get_segment_lengths(coordinates))))
 
 
 def great_circle_vec_check_for_nan(y0, x0, y1, x1):
-    dist = ox.great_circle_vec(y0, x0, y1, x1)
-    if math.isnan(dist):
-        dist = 0.0
-    return dist
+    """
+    Get great-circle distance between two points, 0 if not a number
+    :param y0: latitude of the first point
+    :param x0: longitude of the first point
+    :param y1: latitude of the second point
+    :param x1: longitude of the second point
+    :return: float in meters
+    """
+    return float(get_great_circle_distances(y0, x0, y1, x1))
 
 
 def get_distance_between_nodes(nodes_d, id1, id2):
@@ -56,6 +202,10 @@ def get_distance_from_point_to_line(point, coordinates):
     :param coordinates: list of coordinates
     :return: float in meters
     """
+    projection = get_active_projection()
+    if projection is not None:
+        return geom.LineString(to_local(coordinates, projection)).distance(geom.Point(to_local([point], projection)[0]))
+
     line = geom.LineString(coordinates)
     return get_distance_between_points(point, list(line.interpolate(line.project(geom.Point(point))).coords)[0])
 
@@ -67,7 +217,7 @@ def get_border_length(border):
     :return: length in meters
     """
     if border and len(border) > 1:
-        return sum([get_distance_between_points(border[i-1], border[i]) for i in range(1, len(border))])
+        return sum(get_segment_lengths(border).tolist())
     return 0
 
 
@@ -82,12 +232,113 @@ def shift_by_bearing_and_distance(point, distance, direction_reference, bearing_
     :param bearing_delta: float in degrees
     :return: coordinates of a point
     """
-    starting_point = nv_frame.GeoPoint(latitude=point[1], longitude=point[0], degrees=True)
+    projection = get_active_projection()
+    if projection is not None:
+        # Rotate the direction of the reference vector clockwise by the bearing delta within the plane
+        dx = (direction_reference[1][0] - direction_reference[0][0]) * projection['meters_per_degree_x']
+        dy = (direction_reference[1][1] - direction_reference[0][1]) * projection['meters_per_degree_y']
+        norm = math.hypot(dx, dy)
+        if norm == 0.0:
+            return get_point_by_azimuth(point, bearing_delta % 360, distance=abs(distance))
+        sin_delta = math.sin(math.radians(bearing_delta))
+        cos_delta = math.cos(math.radians(bearing_delta))
+        scale = abs(distance) / norm
+        return (point[0] + (dx * cos_delta + dy * sin_delta) * scale / projection['meters_per_degree_x'],
+                point[1] + (dy * cos_delta - dx * sin_delta) * scale / projection['meters_per_degree_y']
+                )
+
     azimuth = (360.0 + get_compass(direction_reference[0], direction_reference[1]) + bearing_delta) % 360
-    result, _azimuthb = starting_point.geo_point(distance=abs(distance), azimuth=azimuth, degrees=True)
+    return get_point_by_azimuth(point, azimuth, distance=abs(distance))
+
+
+def shift_points_by_bearing_and_distance(points, distances, direction_references, bearing_delta=90.0):
+    """
+    Vectorized version of shift_by_bearing_and_distance.
+    Every point has its own distance and direction reference, the bearing delta is common for all points.
+    :param points: numpy array of shape (n, 2) with longitudes and latitudes
+    :param distances: numpy array of n distances in meters
+    :param direction_references: numpy array of shape (n, 2, 2), a vector for each point
+    :param bearing_delta: float in degrees
+    :return: numpy array of shape (n, 2) with longitudes and latitudes
+    """
+    distances = np.abs(distances)
+    projection = get_active_projection()
+    if projection is not None:
+        dx = (direction_references[:, 1, 0] - direction_references[:, 0, 0]) * projection['meters_per_degree_x']
+        dy = (direction_references[:, 1, 1] - direction_references[:, 0, 1]) * projection['meters_per_degree_y']
+        norm = np.hypot(dx, dy)
+        degenerate = norm == 0.0
+        sin_delta = math.sin(math.radians(bearing_delta))
+        cos_delta = math.cos(math.radians(bearing_delta))
+        scale = distances / np.where(degenerate, 1.0, norm)
+        result = np.column_stack((points[:, 0] + (dx * cos_delta + dy * sin_delta) * scale
+                                  / projection['meters_per_degree_x'],
+                                  points[:, 1] + (dy * cos_delta - dx * sin_delta) * scale
+                                  / projection['meters_per_degree_y']
+                                  ))
+        if degenerate.any():
+            result[degenerate] = get_points_by_azimuth(points[degenerate],
+                                                       np.full(int(degenerate.sum()), bearing_delta % 360),
+                                                       distances[degenerate]
+                                                       )
+        return result
+
+    azimuths = (360.0 + get_compass_bearings(direction_references[:, 0], direction_references[:, 1])
+                + bearing_delta) % 360
+    return get_points_by_azimuth(points, azimuths, distances)
+
+
+def get_point_by_azimuth(point, azimuth, distance=10000.0):
+    """
+    Find coordinates of a point located at a distance from the starting point to the specified azimuth
+    :param point: point coordinates
+    :param azimuth: float in degrees
+    :param distance: float in meters
+    :return: coordinates of a point
+    """
+    projection = get_active_projection()
+    if projection is not None:
+        return (point[0] + distance * math.sin(math.radians(azimuth)) / projection['meters_per_degree_x'],
+                point[1] + distance * math.cos(math.radians(azimuth)) / projection['meters_per_degree_y']
+                )
+
+    starting_point = nv_frame.GeoPoint(latitude=point[1], longitude=point[0], degrees=True)
+    result, _azimuthb = starting_point.geo_point(distance=distance, azimuth=azimuth, degrees=True)
     return result.longitude_deg, result.latitude_deg
 
 
+def get_points_by_azimuth(points, azimuths, distances):
+    """
+    Vectorized version of get_point_by_azimuth.
+    On the sphere the points are found with the spherical direct formula,
+    which agrees with the nvector geodesic calculation to within 1e-12 degrees.
+    :param points: numpy array of shape (n, 2) with longitudes and latitudes
+    :param azimuths: numpy array of n azimuths in degrees
+    :param distances: numpy array of n distances in meters
+    :return: numpy array of shape (n, 2) with longitudes and latitudes
+    """
+    projection = get_active_projection()
+    if projection is not None:
+        azimuths = np.radians(azimuths)
+        return np.column_stack((points[:, 0] + distances * np.sin(azimuths) / projection['meters_per_degree_x'],
+                                points[:, 1] + distances * np.cos(azimuths) / projection['meters_per_degree_y']
+                                ))
+
+    lat = np.radians(points[:, 1])
+    lon = np.radians(points[:, 0])
+    azimuths = np.radians(azimuths)
+    angular_distance = np.asarray(distances, dtype=np.float64) / nv_frame.a
+    sin_lat = np.sin(lat)
+    cos_lat = np.cos(lat)
+    sin_distance = np.sin(angular_distance)
+    cos_distance = np.cos(angular_distance)
+
+    lat2 = np.arcsin(sin_lat * cos_distance + cos_lat * sin_distance * np.cos(azimuths))
+    lon2 = lon + np.arctan2(np.sin(azimuths) * sin_distance * cos_lat, cos_distance - sin_lat * np.sin(lat2))
+    lon2 = (lon2 + np.pi) % (2 * np.pi) - np.pi
+    return np.column_stack((np.degrees(lon2), np.degrees(lat2)))
+
+
 def shift_vector(node_coordinates, width, direction_reference=None):
     """
     Parallel shift a vector to the distance of width.  
@@ -103,7 +354,7 @@ def shift_vector(node_coordinates, width, direction_reference=None):
     if direction_reference is not None:
         direction_vec = direction_reference
     else:
-        direction_vec = copy.deepcopy(node_coordinates)
+        direction_vec = node_coordinates
 
     if width > 0.0:
         bearing_delta = 90.0
@@ -202,21 +453,144 @@ def shift_list_of_nodes(node_coordinates, widths, direction_reference=None):
     :param direction_reference: reference vector used to define shift direction
     :return: shifted list of coordinates
     """
+    return shift_list_of_nodes_by_widths(node_coordinates, [widths], direction_reference)[0]
 
-    if len(node_coordinates) < 2 or len(node_coordinates) > len(widths):
-        return node_coordinates
 
-    shifted_list = [shift_vector(node_coordinates, widths[0], direction_reference)[0]]
-    x0 = node_coordinates[0][0]
-    y0 = node_coordinates[0][1]
-    i = 1
-    for x1, y1 in node_coordinates[1:]:
-        shifted_list.append(shift_vector([(x0, y0), (x1, y1)], widths[i], direction_reference)[1])
-        x0 = x1
-        y0 = y1
-        i += 1
+def shift_list_of_nodes_by_widths(node_coordinates, list_of_widths, direction_reference=None):
+    """
+    Shift a list of nodes by several lists of widths at once.
+    The shift directions are calculated once for all lists of widths,
+    and the result for each list is the same as from shift_list_of_nodes.
+    :param node_coordinates: list of coordinates
+    :param list_of_widths: list of lists of widths
+    :param direction_reference: reference vector used to define shift direction
+    :return: list of shifted lists of coordinates, one per list of widths
+    """
+    n = len(node_coordinates)
+    if n < 2:
+        return [node_coordinates for widths in list_of_widths]
+
+    valid = [n <= len(widths) for widths in list_of_widths]
+    curves = get_offset_curves(node_coordinates,
+                               [widths[:n] for widths, v in zip(list_of_widths, valid) if v],
+                               direction_reference
+                               )
+    result = []
+    for widths, v in zip(list_of_widths, valid):
+        if not v:
+            result.append(node_coordinates)
+            continue
+        shifted = curves.pop(0)
+        shifted_list = list(zip(shifted[:, 0].tolist(), shifted[:, 1].tolist()))
+
+        # Nodes with zero width are not shifted
+        for i, width in enumerate(widths[:n]):
+            if width == 0.0:
+                shifted_list[i] = node_coordinates[i]
+        result.append(shifted_list)
+
+    return result
+
+
+def get_offset_curve(node_coordinates, widths, direction_reference=None):
+    """
+    Shift each node of a polyline to the distance of its width in one vectorized pass.
+    Each node is shifted orthogonally to the segment ending at the node (the first node - to the first segment)
+    or to the direction reference: to the right if the width is positive and to the left if negative.
+    :param node_coordinates: list of coordinates
+    :param widths: list of widths, one per node
+    :param direction_reference: reference vector used to define shift direction
+    :return: numpy array of shape (n, 2) with shifted coordinates
+    """
+    return get_offset_curves(node_coordinates, [widths], direction_reference)[0]
+
+
+def get_offset_curves(node_coordinates, list_of_widths, direction_reference=None):
+    """
+    Shift a polyline by several lists of widths, see get_offset_curve.
+    The segment directions are calculated once and all offsets are done in one vectorized pass.
+    :param node_coordinates: list of coordinates
+    :param list_of_widths: list of lists of widths, one width per node in each list
+    :param direction_reference: reference vector used to define shift direction
+    :return: list of numpy arrays of shape (n, 2) with shifted coordinates
+    """
+    if not list_of_widths:
+        return []
+
+    points = np.asarray(node_coordinates, dtype=np.float64).reshape(-1, 2)
+    n = len(points)
+    m = len(list_of_widths)
+    widths = np.asarray(list_of_widths, dtype=np.float64).reshape(-1)
+    if direction_reference is not None:
+        reference = np.asarray(direction_reference[:2], dtype=np.float64)
+        starts = np.repeat(reference[:1], n, axis=0)
+        ends = np.repeat(reference[1:], n, axis=0)
+    else:
+        starts = np.concatenate((points[:1], points[:-1]))
+        ends = np.concatenate((points[1:2], points[1:]))
+    bearing_delta = np.where(widths > 0.0, 90.0, -90.0)
+    all_points = np.tile(points, (m, 1))
+
+    projection = get_active_projection()
+    if projection is not None:
+        # Rotate the direction of each segment clockwise by the bearing delta within the plane
+        dx = (ends[:, 0] - starts[:, 0]) * projection['meters_per_degree_x']
+        dy = (ends[:, 1] - starts[:, 1]) * projection['meters_per_degree_y']
+        norm = np.hypot(dx, dy)
+        degenerate = norm == 0.0
+        dx = np.tile(np.where(degenerate, 0.0, dx), m)
+        dy = np.tile(np.where(degenerate, 1.0, dy), m)
+        norm = np.tile(np.where(degenerate, 1.0, norm), m)
+        sin_delta = np.sin(np.radians(bearing_delta))
+        cos_delta = np.cos(np.radians(bearing_delta))
+        scale = np.abs(widths) / norm
+        shifted = np.column_stack((all_points[:, 0] + (dx * cos_delta + dy * sin_delta) * scale
+                                   / projection['meters_per_degree_x'],
+                                   all_points[:, 1] + (dy * cos_delta - dx * sin_delta) * scale
+                                   / projection['meters_per_degree_y']
+                                   ))
+    else:
+        azimuths = (360.0 + np.tile(get_compass_bearings(starts, ends), m) + bearing_delta) % 360
+        shifted = get_points_by_azimuth(all_points, azimuths, np.abs(widths))
 
-    return shifted_list
+    return [shifted[i * n:(i + 1) * n] for i in range(m)]
+
+
+def get_lane_borders(border, widths, median_from_far_border=False):
+    """
+    Get borders and medians of adjacent lanes built outward from a border, lane by lane.
+    Each next border is the previous one shifted by the lane width: to the right if the width is positive,
+    to the left if negative.  The median of a lane is shifted by half of the lane width to the right
+    from the left border of the lane, which is the near border for positive widths and the far one for negative.
+    The shifts from the same border share one calculation of the shift directions.
+    :param border: list of coordinates
+    :param widths: list of signed lane widths
+    :param median_from_far_border: True if the medians are shifted from the far borders of the lanes
+    :return: tuple of a list of len(widths) + 1 borders starting with the given one and a list of len(widths) medians
+    """
+    borders = [border]
+    medians = [None] * len(widths)
+    for k in range(len(widths) + 1):
+        list_of_widths = []
+        if median_from_far_border and k > 0:
+            list_of_widths.append(-widths[k - 1] / 2.0)
+        if not median_from_far_border and k < len(widths):
+            list_of_widths.append(widths[k] / 2.0)
+        if k < len(widths):
+            list_of_widths.append(widths[k])
+        if not list_of_widths:
+            continue
+
+        n = len(borders[k])
+        shifted = shift_list_of_nodes_by_widths(borders[k], [[w] * n for w in list_of_widths])
+        if median_from_far_border and k > 0:
+            medians[k - 1] = shifted.pop(0)
+        if not median_from_far_border and k < len(widths):
+            medians[k] = shifted.pop(0)
+        if k < len(widths):
+            borders.append(shifted.pop(0))
+
+    return borders, medians
 
 
 def shift_border(path_data, nodes_dict, shift):
@@ -229,7 +603,7 @@ def shift_border(path_data, nodes_dict, shift):
     """
     if len(path_data['nodes']) < 2:
         return None
-    node_coordinates = [(nodes_dict[n]['x'], nodes_dict[n]['y']) for n in path_data['nodes']]
+    node_coordinates = get_node_coordinates(nodes_dict, path_data['nodes'])
     return shift_list_of_nodes(node_coordinates, [shift] * len(node_coordinates))
 
 
@@ -249,39 +623,28 @@ def get_vertices(node_coordinates, width):
 
 def cut_border_by_distance(line, distance):
     """
-    Cut a border in two pieces at a specified distance from the beginning
-    :param line: LineString
+    Cut a border in two pieces at a specified distance from the beginning.
+    The cut point is found by a binary search over the cumulative lengths of the polyline.
+    :param line: LineString or Polyline
     :param distance: float
-    :return: list of two LineStrings
-    """
-    if distance <= 0.0 or distance >= line.length:
-        return [geom.LineString(line)]
-    coords = list(line.coords)
-    for i, p in enumerate(coords):
-        pd = line.project(geom.Point(p))
-        if pd == distance:
-            return [
-                geom.LineString(coords[:i+1]),
-                geom.LineString(coords[i:])]
-        if pd > distance:
-            cp = line.interpolate(distance)
-            return [
-                geom.LineString(coords[:i] + [(cp.x, cp.y)]),
-                geom.LineString([(cp.x, cp.y)] + coords[i:])]
+    :return: list of two LineStrings or Polylines, the same type as the input line
+    """
+    if isinstance(line, Polyline):
+        return line.cut(distance)
+    return [geom.LineString(piece.coords) for piece in Polyline(line).cut(distance)]
 
 
 def cut_line_by_relative_distance(coordinates, relative_distance):
-    line = geom.LineString(coordinates)
-    point = line.interpolate(relative_distance, normalized=True)
-    reduced_line = cut_border_by_distance(line, line.project(point))[0]
+    polyline = get_polyline(coordinates)
+    reduced_line = polyline.cut(polyline.project(polyline.interpolate(relative_distance, normalized=True)))[0]
     return list(reduced_line.coords)
 
 
 def cut_border_by_point(border, point_coordinate, ind=0):
     if len(border) < 2:
         return []
-    line = geom.LineString(border)
-    reduced_line = cut_border_by_distance(line, line.project(geom.Point(point_coordinate)))[ind]
+    polyline = get_polyline(border)
+    reduced_line = polyline.cut(polyline.project(point_coordinate))[ind]
     return list(reduced_line.coords)
 
 
@@ -289,11 +652,11 @@ def get_closest_point(point, coordinates):
     """
     Get closest point on a line to a point somewhere
     :param point: coordinates
-    :param coordinates: list of coordinates
+    :param coordinates: list of coordinates or Polyline
     :return: coordinates
     """
-    line = geom.LineString(coordinates)
-    return line.interpolate(line.project(geom.Point(point))).coords[0]
+    polyline = get_polyline(coordinates)
+    return polyline.interpolate(polyline.project(point))
 
 
 def get_compass(x, y):
@@ -325,6 +688,12 @@ def get_compass_bearing(point_a, point_b):
     if (type(point_a) != tuple) or (type(point_b) != tuple):
         raise TypeError("Only tuples are supported as arguments")
 
+    projection = get_active_projection()
+    if projection is not None:
+        dx = (point_b[1] - point_a[1]) * projection['meters_per_degree_x']
+        dy = (point_b[0] - point_a[0]) * projection['meters_per_degree_y']
+        return (math.degrees(math.atan2(dx, dy)) + 360) % 360
+
     lat1 = math.radians(point_a[0])
     lat2 = math.radians(point_b[0])
 
@@ -345,6 +714,71 @@ def get_compass_bearing(point_a, point_b):
     return compass_bearing
 
 
+def get_compass_bearings(points_a, points_b):
+    """
+    Vectorized compass bearings between pairs of points, see get_compass_bearing
+    :param points_a: numpy array of shape (n, 2) with longitudes and latitudes
+    :param points_b: numpy array of shape (n, 2) with longitudes and latitudes
+    :return: numpy array of n bearings in degrees
+    """
+    projection = get_active_projection()
+    if projection is not None:
+        dx = (points_b[:, 0] - points_a[:, 0]) * projection['meters_per_degree_x']
+        dy = (points_b[:, 1] - points_a[:, 1]) * projection['meters_per_degree_y']
+        return (np.degrees(np.arctan2(dx, dy)) + 360) % 360
+
+    lat1 = np.radians(points_a[:, 1])
+    lat2 = np.radians(points_b[:, 1])
+    diff_long = np.radians(points_b[:, 0] - points_a[:, 0])
+
+    x = np.sin(diff_long) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - (np.sin(lat1) * np.cos(lat2) * np.cos(diff_long))
+
+    return (np.degrees(np.arctan2(x, y)) + 360) % 360
+
+
+def get_bearings_from_point(point, coordinates):
+    """
+    Get compass bearings from a point to each point in a list
+    :param point: coordinates
+    :param coordinates: list of coordinates or numpy array of shape (n, 2)
+    :return: numpy array of n bearings in degrees
+    """
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    return get_compass_bearings(np.repeat(np.asarray([point], dtype=np.float64), len(coordinates), axis=0),
+                                coordinates
+                                )
+
+
+def get_segment_bearings(coordinates):
+    """
+    Get compass bearings of all segments of a polyline.
+    The bearings of a Polyline are cached in the polyline per geometry projection.
+    :param coordinates: list of coordinates or Polyline
+    :return: numpy array of n-1 bearings in degrees
+    """
+    projection = get_active_projection()
+    if isinstance(coordinates, Polyline):
+        key = None if projection is None else (projection['center_x'], projection['center_y'])
+        if key not in coordinates.bearings:
+            coordinates.bearings[key] = get_compass_bearings(coordinates.points[:-1], coordinates.points[1:])
+        return coordinates.bearings[key]
+
+    points = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    return get_compass_bearings(points[:-1], points[1:])
+
+
+def get_angles_between_bearings(bearings1, bearings2):
+    """
+    Vectorized version of get_angle_between_bearings
+    :param bearings1: numpy array of bearings in degrees
+    :param bearings2: numpy array of bearings in degrees
+    :return: numpy array of angles in the +/- 180 range
+    """
+    angles = (bearings2 - bearings1 + 360.0) % 360
+    return np.where(angles >= 180.0, angles - 360.0, angles)
+
+
 def get_lane_bearing(lane):
     """
     Get compass bearing of a lane
@@ -404,12 +838,10 @@ def is_almost_parallel(border1, border2, threshold=30.0):
     :param threshold: float in degrees
     :return: True if angle is less then treshold, False otherwise
     """
-    bearing = get_compass(border1[0], border1[-1])
-    if abs(get_angle_between_bearings(get_compass(border2[0], border2[-1]), bearing)) < threshold \
-            or abs(get_angle_between_bearings(get_compass(border2[-1], border2[0]), bearing)) < threshold:
-        return True
-
-    return False
+    bearings = get_compass_bearings(np.array([border1[0], border2[0], border2[-1]], dtype=np.float64),
+                                    np.array([border1[-1], border2[-1], border2[0]], dtype=np.float64)
+                                    )
+    return bool(np.any(np.abs(get_angles_between_bearings(bearings[1:], bearings[0])) < threshold))
 
 
 def set_lane_bearing(lanes):
@@ -418,8 +850,14 @@ def set_lane_bearing(lanes):
     :param lanes: list of dictionaries
     :return: None
     """
-    for lane in lanes:
-        lane['bearing'] = get_lane_bearing(lane)
+    if not lanes:
+        return
+
+    bearings = get_compass_bearings(np.array([lane['left_border'][0] for lane in lanes], dtype=np.float64),
+                                    np.array([lane['left_border'][-1] for lane in lanes], dtype=np.float64)
+                                    ).tolist()
+    for lane, bearing in zip(lanes, bearings):
+        lane['bearing'] = bearing
         lane['compass'] = get_compass_rhumb(lane['bearing'])
 
 
@@ -507,16 +945,57 @@ def border_within_box(x0, y0, border, size):
     :param size: float in meters
     :return: list of coordinates
     """
-    try:
-        north, south, east, west = get_box(x0, y0, size=size)
-        polygon = geom.Polygon([(west, north), (east, north), (east, south), (west, south)])
-        line = geom.LineString(border)
-        line = line.intersection(polygon)
-        result = list(line.coords)
-    except:
-        logger.error('Cannot find a portion of type %s within a box: %r' % (type(line), border))
+    return clip_border_to_box(border, get_box(x0, y0, size=size))
+
+
+def clip_border_to_box(border, box):
+    """
+    Find a portion of a line within a box by clipping all segments against the box at once (Liang-Barsky).
+    The result is the same as the intersection of the line with the box polygon in Shapely:
+    zero length segments are dropped, and if the line leaves the box and enters it again or crosses itself,
+    there is no single portion and the result is empty.
+    :param border: list of coordinates
+    :param box: tuple of north, south, east, west boundaries as returned by get_box
+    :return: list of coordinates
+    """
+    if len(border) < 2:
         return []
-    return result
+
+    north, south, east, west = box
+    points = np.asarray(border, dtype=np.float64).reshape(-1, 2)
+    x0 = points[:-1, 0]
+    y0 = points[:-1, 1]
+    dx = points[1:, 0] - x0
+    dy = points[1:, 1] - y0
+
+    # Parameters of the segment ends within the box: 0 - the segment start, 1 - the segment end
+    t0 = np.zeros(len(dx))
+    t1 = np.ones(len(dx))
+    visible = np.ones(len(dx), dtype=bool)
+    for p, q in ((-dx, x0 - west), (dx, east - x0), (-dy, y0 - south), (dy, north - y0)):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r = q / p
+        visible &= ~((p == 0.0) & (q < 0.0))
+        t0 = np.where((p < 0.0) & (r > t0), r, t0)
+        t1 = np.where((p > 0.0) & (r < t1), r, t1)
+    visible &= t0 <= t1
+
+    pieces = []
+    for i in np.flatnonzero(visible).tolist():
+        a = tuple(border[i]) if t0[i] == 0.0 else (float(x0[i] + t0[i] * dx[i]), float(y0[i] + t0[i] * dy[i]))
+        b = tuple(border[i + 1]) if t1[i] == 1.0 else (float(x0[i] + t1[i] * dx[i]), float(y0[i] + t1[i] * dy[i]))
+        if pieces and pieces[-1][-1] == a:
+            if b != a:
+                pieces[-1].append(b)
+        else:
+            pieces.append([a] if a == b else [a, b])
+
+    if not pieces:
+        return []
+    if len(pieces) > 1 or (len(pieces[0]) > 2 and not geom.LineString(pieces[0]).is_simple):
+        logger.error('Cannot find a single portion within a box: %r' % border)
+        return []
+    return pieces[0]
 
 
 def polygon_within_box(x0, y0, shapely_polygon, size):
@@ -628,13 +1107,29 @@ def get_intersection_with_circle(vector, center, radius, margin=0.01):
     Get an intersection between a vector and a circle.
     Assuming vector[0] is within the circle and vector[1] is outside.
     Applying a margin to make sure the intersection is within the circle.
-    Can not use the standard Shapely method because we are in lon-lat coordinates
+    Can not use the standard Shapely method because we are in lon-lat coordinates.
+    Within a local geometry context the intersection is solved exactly in the local tangent plane.
     :param vector: list of two points
     :param center: coordinates of the center
     :param radius: float in meters
     :param margin: float: relative to 1.  applied to make sure the intersection is within the circle.
     :return: coordinates of the intersection
     """
+    projection = get_active_projection()
+    if projection is not None:
+        # Solve |p1 + t*(p0 - p1) - center| = radius for the smallest t in the plane
+        p0, p1, c = to_local([vector[0], vector[1], center], projection)
+        d = p0 - p1
+        f = p1 - c
+        a = float(d.dot(d))
+        b = 2.0 * float(f.dot(d))
+        discriminant = b ** 2 - 4.0 * a * (float(f.dot(f)) - radius ** 2)
+        if a > 0.0 and discriminant >= 0.0:
+            relative_distance = (-b - math.sqrt(discriminant)) / (2.0 * a) * (1.0 + margin)
+            return (vector[1][0] + (vector[0][0] - vector[1][0]) * relative_distance,
+                    vector[1][1] + (vector[0][1] - vector[1][1]) * relative_distance
+                    )
+
     bearing1 = get_compass(vector[1], vector[0])
     bearing2 = get_compass(vector[1], center)
     angle = (abs(bearing2 - bearing1) + 360) % 360
@@ -685,12 +1180,8 @@ def get_border_curvature(border):
     if len(border) < 3:
         return 0.0
 
-    curvature = 0.0
-    for i in range(1, len(border) - 1):
-        bearing1 = get_compass(border[i - 1], border[i])
-        bearing2 = get_compass(border[i], border[i+1])
-        curvature += abs(get_angle_between_bearings(bearing1, bearing2))
-
+    bearings = get_segment_bearings(border)
+    curvature = sum(np.abs(get_angles_between_bearings(bearings[:-1], bearings[1:])).tolist())
     return curvature / get_border_length(border)
 
 
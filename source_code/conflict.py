@@ -9,7 +9,7 @@
 
 import shapely.geometry as geom
 from matplotlib.patches import Polygon
-from border import cut_border_by_polygon, cut_border_by_distance
+from border import cut_border_by_polygon, cut_border_by_point
 from log import get_logger
 
 
@@ -191,12 +191,10 @@ def cut_guideway_borders_by_conflict_zone(guideway_data, conflict_zone):
 
     reduced_median = cut_border_by_polygon(guideway_data['median'], conflict_zone['polygon'])
 
-    left_line = geom.LineString(guideway_data['left_border'])
-    reduced_left_line = cut_border_by_distance(left_line, left_line.project(geom.Point(reduced_median[-1])))[0]
-    right_line = geom.LineString(guideway_data['right_border'])
-    reduced_right_line = cut_border_by_distance(right_line, right_line.project(geom.Point(reduced_median[-1])))[0]
+    reduced_left_border = cut_border_by_point(guideway_data['left_border'], reduced_median[-1])
+    reduced_right_border = cut_border_by_point(guideway_data['right_border'], reduced_median[-1])
 
-    return list(reduced_left_line.coords), reduced_median, list(reduced_right_line.coords)
+    return reduced_left_border, reduced_median, reduced_right_border
 
 
 def get_conflict_zones_per_guideway(guideway_data, all_guideways, polygons_dict):
@@ -223,11 +221,9 @@ def get_conflict_zones_per_guideway(guideway_data, all_guideways, polygons_dict)
     if len(conflict_zones) > 0:
         guideway_data['reduced_median'] = cut_border_by_polygon(guideway_data['median'], conflict_zones[-1]['polygon'])
         for key in ['left_border', 'right_border']:
-            border_line = geom.LineString(guideway_data[key])
-            reduced_line = cut_border_by_distance(border_line,
-                                                  border_line.project(geom.Point(guideway_data['reduced_median'][-1]))
-                                                  )[0]
-            guideway_data['reduced_' + key] = list(reduced_line.coords)
+            guideway_data['reduced_' + key] = cut_border_by_point(guideway_data[key],
+                                                                  guideway_data['reduced_median'][-1]
+                                                                  )
 
     return conflict_zones
 
@@ -8,10 +8,12 @@
 
 
 import xmltodict
+import xml.etree.ElementTree as ElementTree
 import osmnx as ox
 import json
 import time
-import copy
+import math
+from border import get_box
 from log import get_logger, dictionary_to_log
 
 
@@ -50,10 +52,101 @@ exclude = {
 
 exclude_keywords = ['landuse']
 
+grid_cell_size = 0.005
+
+pipeline_partitions = [('drive', 'way["highway"]'),
+                       ('all', 'way["highway"]'),
+                       ('all', 'way["railway"]'),
+                       ('all', 'node["highway"]')
+                       ]
+
 
 def get_data_from_file(file_name):
     """
-    Get data from an XML file and covert to a dictionary
+    Get data from an XML file and covert to a dictionary.
+    The file is parsed incrementally: each node, way and relation is converted as soon as it is read
+    and then released, so the whole XML tree is never held in memory.
+    :param file_name: string
+    :return: dictionary with data
+    """
+    ways = []
+    nodes = []
+    relations = []
+    header = {}
+    bounds = ''
+    try:
+        context = ElementTree.iterparse(file_name, events=('start', 'end'))
+        _event, root = next(context)
+        header = dict(root.attrib)
+        for event, elem in context:
+            if event != 'end':
+                continue
+            if elem.tag == 'way':
+                way = get_element_from_xml(elem)
+                if filter_out(way):
+                    ways.append(way)
+            elif elem.tag == 'node':
+                nodes.append(get_element_from_xml(elem))
+            elif elem.tag == 'relation':
+                relations.append(get_element_from_xml(elem))
+            elif elem.tag == 'bounds':
+                bounds = {'@' + key: float(elem.attrib[key]) for key in elem.attrib}
+            else:
+                continue
+            root.clear()
+    except (IOError, ElementTree.ParseError, StopIteration) as e:
+        logger.exception('Unable to read %s: %r' % (file_name, e))
+        return None
+
+    return [{'version': header.get('version', ''),
+             'osm3s': header.get('copyright', ''),
+             'generator': header.get('generator', ''),
+             'bounds': bounds,
+             'elements': ways + nodes + relations
+             }
+            ]
+
+
+def get_element_from_xml(elem):
+    """
+    Convert a node, way or relation XML element into the same dictionary as clean_element does,
+    but directly from the element attributes without an intermediate dictionary.
+    :param elem: xml.etree.ElementTree.Element
+    :return: dictionary
+    """
+    cleaned = {'type': elem.tag, 'tags': {}}
+    for key, value in elem.attrib.items():
+        if key == 'id':
+            cleaned['id'] = int(value)
+        elif key == 'lat' or key == 'lon':
+            cleaned[key] = float(value)
+        else:
+            cleaned[key] = value
+
+    node_ids = []
+    members = []
+    for child in elem:
+        if child.tag == 'nd':
+            node_ids.append(int(child.attrib['ref']))
+        elif child.tag == 'tag':
+            cleaned['tags'][child.attrib['k']] = child.attrib['v']
+        elif child.tag == 'member':
+            members.append({'@' + key: value for key, value in child.attrib.items()})
+
+    if node_ids:
+        cleaned['nodes'] = node_ids
+    if len(members) == 1:
+        cleaned['member'] = members[0]
+    elif members:
+        cleaned['member'] = members
+
+    return cleaned
+
+
+def get_data_from_file_with_xmltodict(file_name):
+    """
+    Get data from an XML file by converting the entire file to a dictionary.
+    This is the original non-incremental loader.  It is kept as a reference for validation and benchmarks.
     :param file_name: string
     :return: dictionary with data
     """
@@ -187,32 +280,179 @@ def check_infrastructure(infrastructure, data):
         return True
 
 
-def get_data_subset(selection, network_type='drive', infrastructure='way["highway"]'):
+def get_grid_cell(x, y, cell_size=grid_cell_size):
+    """
+    Get the grid cell containing a point
+    :param x: longitude
+    :param y: latitude
+    :param cell_size: cell size in degrees
+    :return: tuple of integers
+    """
+    return int(math.floor(x / cell_size)), int(math.floor(y / cell_size))
+
+
+def get_grid_cells_in_box(box, cell_size=grid_cell_size):
+    """
+    Get all grid cells overlapping a box
+    :param box: tuple of floats: north, south, east, west
+    :param cell_size: cell size in degrees
+    :return: list of tuples
+    """
+    north, south, east, west = box
+    x0, y0 = get_grid_cell(west, south, cell_size)
+    x1, y1 = get_grid_cell(east, north, cell_size)
+    return [(i, j) for i in range(x0, x1 + 1) for j in range(y0, y1 + 1)]
+
+
+def boxes_overlap(box1, box2):
     """
-    Get data subset for a specified infrastructure
+    Check if two boxes overlap
+    :param box1: tuple of floats: north, south, east, west
+    :param box2: tuple of floats: north, south, east, west
+    :return: True if overlap, False otherwise
+    """
+    return box1[1] <= box2[0] and box2[1] <= box1[0] and box1[3] <= box2[2] and box2[3] <= box1[2]
+
+
+def get_grid_index(selection, cell_size=grid_cell_size):
+    """
+    Get a uniform grid index of the selection elements.
+    The index is built on the first call and kept in the selection, so it is built once per selection.
+    Nodes are registered in the cell containing the node, ways are registered in all cells overlapping
+    the bounding box of the way.  Elements are referenced by their position in the selection,
+    so that the subsets keep the original order of elements.
+    :param selection: osmnx data structure
+    :param cell_size: cell size in degrees
+    :return: dictionary
+    """
+    if 'grid_index' in selection[0] and selection[0]['grid_index']['cell_size'] == cell_size:
+        return selection[0]['grid_index']
+
+    elements = selection[0]['elements']
+    node_positions = {}
+    node_cells = {}
+    for i, e in enumerate(elements):
+        if e['type'] == 'node':
+            node_positions[e['id']] = i
+            node_cells.setdefault(get_grid_cell(e['lon'], e['lat'], cell_size), []).append(i)
+
+    way_boxes = {}
+    way_cells = {}
+    for i, e in enumerate(elements):
+        if e['type'] != 'way' or 'nodes' not in e:
+            continue
+        lons = [elements[node_positions[n]]['lon'] for n in e['nodes'] if n in node_positions]
+        lats = [elements[node_positions[n]]['lat'] for n in e['nodes'] if n in node_positions]
+        if not lons:
+            continue
+        way_boxes[i] = (max(lats), min(lats), max(lons), min(lons))
+        for cell in get_grid_cells_in_box(way_boxes[i], cell_size):
+            way_cells.setdefault(cell, []).append(i)
+
+    grid_index = {
+        'cell_size': cell_size,
+        'node_positions': node_positions,
+        'node_cells': node_cells,
+        'way_boxes': way_boxes,
+        'way_cells': way_cells
+    }
+    selection[0]['grid_index'] = grid_index
+    return grid_index
+
+
+def get_positions_in_box(selection, box, element_type='way'):
+    """
+    Get positions of elements within a box using the grid index of the selection.
+    A way is within the box if its bounding box overlaps the box.
+    :param selection: osmnx data structure
+    :param box: tuple of floats: north, south, east, west
+    :param element_type: string: 'way' or 'node'
+    :return: sorted list of element positions in the selection
+    """
+    grid_index = get_grid_index(selection)
+    elements = selection[0]['elements']
+    north, south, east, west = box
+    positions = set()
+    for cell in get_grid_cells_in_box(box, grid_index['cell_size']):
+        if element_type == 'node':
+            positions.update([i for i in grid_index['node_cells'].get(cell, [])
+                              if south <= elements[i]['lat'] <= north and west <= elements[i]['lon'] <= east
+                              ])
+        else:
+            positions.update([i for i in grid_index['way_cells'].get(cell, [])
+                              if boxes_overlap(grid_index['way_boxes'][i], box)
+                              ])
+
+    return sorted(positions)
+
+
+def partition_selection(selection, partitions=None):
+    """
+    Partition the selection elements by network type and infrastructure in a single pass.
+    The partitions are kept in the selection, so that each selection is partitioned once.
+    :param selection: osmnx data structure
+    :param partitions: list of tuples (network type, infrastructure), by default the partitions used by the pipeline
+    :return: dictionary of sets of element positions keyed by (network type, infrastructure)
+    """
+    if partitions is None:
+        partitions = pipeline_partitions
+
+    if 'partitions' not in selection[0]:
+        selection[0]['partitions'] = {}
+
+    missing = [k for k in partitions if k not in selection[0]['partitions']]
+    if not missing:
+        return selection[0]['partitions']
+
+    result = dict((k, set()) for k in missing)
+    for i, e in enumerate(selection[0]['elements']):
+        for network_type, infrastructure in missing:
+            if infrastructure == 'node["highway"]':
+                if e['type'] == 'node' and 'tags' in e and 'highway' in e['tags']:
+                    result[(network_type, infrastructure)].add(i)
+            elif e['type'] == 'way' and check_infrastructure(infrastructure, e) and check_network(network_type, e):
+                result[(network_type, infrastructure)].add(i)
+
+    selection[0]['partitions'].update(result)
+    return selection[0]['partitions']
+
+
+def get_data_subset(selection, network_type='drive', infrastructure='way["highway"]', box=None):
+    """
+    Get data subset for a specified infrastructure.
+    The elements of the subset are shared with the selection, i.e. the subset is a read-only view of the selection.
+    Use copy_element to obtain a copy of an element for modification.
     :param selection: osmnx data structure
     :param network_type: string
     :param infrastructure: string
+    :param box: tuple of floats: north, south, east, west or None for the whole selection
     :return: osmnx data structure
     """
+    elements = selection[0]['elements']
+    partition = partition_selection(selection, partitions=[(network_type, infrastructure)])[(network_type,
+                                                                                            infrastructure)]
+    if box is None:
+        positions = sorted(partition)
+    else:
+        element_type = 'node' if infrastructure == 'node["highway"]' else 'way'
+        positions = [i for i in get_positions_in_box(selection, box, element_type=element_type) if i in partition]
+
     paths = []
     nodes = []
     if infrastructure == 'node["highway"]':
-        nodes = [n for n in selection[0]['elements'] if n['type'] == 'node' and 'tags' in n and 'highway' in n['tags']]
+        nodes = [elements[i] for i in positions]
     else:
-        paths = [p for p in selection[0]['elements'] if p['type'] == 'way'
-                 and check_infrastructure(infrastructure, p)
-                 and check_network(network_type, p)
-                 ]
+        paths = [elements[i] for i in positions]
 
     if not nodes:
-        node_ids = []
+        node_ids = set()
         for p in paths:
             if 'nodes' not in p:
                 continue
-            node_ids.extend(p['nodes'])
+            node_ids.update(p['nodes'])
 
-        nodes = [n for n in selection[0]['elements'] if n['id'] in node_ids]
+        node_positions = get_grid_index(selection)['node_positions']
+        nodes = [elements[i] for i in sorted([node_positions[n] for n in node_ids if n in node_positions])]
 
     return [{'version': selection[0]['version'],
              'osm3s': selection[0]['osm3s'],
@@ -223,6 +463,22 @@ def get_data_subset(selection, network_type='drive', infrastructure='way["highwa
             ]
 
 
+def copy_element(element):
+    """
+    Copy an OSM element for modification.  Tags, list of nodes and other containers are copied,
+    while the values inside them are immutable and shared with the original element.
+    :param element: dictionary
+    :return: dictionary
+    """
+    element_copy = dict(element)
+    for key, value in element.items():
+        if isinstance(value, dict):
+            element_copy[key] = dict(value)
+        elif isinstance(value, list):
+            element_copy[key] = list(value)
+    return element_copy
+
+
 def parse_xml_parameter(par, raw_dict):
     """
     Parse a single parameter from XML converted to a dictionary
@@ -274,8 +530,11 @@ def get_city_from_osm(city_name, network_type="drive"):
 def get_box_data(x_data, selection, network_type='all', infrastructure='way["highway"]'):
     """
     Get data for an intersection within a box.  
-    If the city data came from a file, return a subset of nodes and paths based on the network type and infrastructure,
-    otherwise download data from OSM online.
+    If the city data came from a file, return a subset of nodes and paths within the box based on the network type
+    and infrastructure, otherwise download data from OSM online.  The box is centered at the intersection and has
+    the initial size of the intersection data as for the online download.
+    The elements of a subset from a file are shared with the selection and must not be modified,
+    use copy_element to obtain a modifiable copy.
     :param x_data: intersection dictionary
     :param selection: osmnx data structure obtained from the XML file.  
     :param network_type: string
@@ -283,7 +542,8 @@ def get_box_data(x_data, selection, network_type='all', infrastructure='way["hig
     :return: osmnx data structure
     """
     if x_data['from_file'] == 'yes':
-        return copy.deepcopy(get_data_subset(selection, network_type=network_type, infrastructure=infrastructure))
+        box = get_box(x_data['center_x'], x_data['center_y'], size=max(x_data['size'], x_data['crop_radius']))
+        return get_data_subset(selection, network_type=network_type, infrastructure=infrastructure, box=box)
     else:
         try:
             return ox.osm_net_download(north=x_data['north'],
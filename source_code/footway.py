@@ -8,12 +8,13 @@
 
 
 import copy
-from lane import add_node_tags_to_lane, insert_referenced_nodes
+from lane import add_node_tags_to_lane, insert_referenced_nodes, CrosswalkIndex
 from border import shift_list_of_nodes, shift_vector, get_compass, get_compass_rhumb, extend_origin_border, \
     get_line_intersection, cut_border_by_point, get_border_length
 from turn import shorten_border_for_crosswalk
 import shapely.geometry as geom
 from log import get_logger, dictionary_to_log
+from node_store import get_node_coordinates
 
 
 logger = get_logger()
@@ -43,7 +44,7 @@ def get_crosswalk_from_path(path_data, nodes_dict, width=1.8):
         'lane_type': 'crosswalk',
         'direction': 'undefined',
         'nodes': path_data['nodes'],
-        'nodes_coordinates': [(nodes_dict[n]['x'], nodes_dict[n]['y']) for n in path_data['nodes']],
+        'nodes_coordinates': get_node_coordinates(nodes_dict, path_data['nodes']),
         'width': width,
         'type': 'footway'
     }
@@ -157,19 +158,23 @@ def get_simulated_crosswalk(street_data, streets, width=1.8):
     :param width: float, crosswalk width in meters
     :return: crosswalk dictionary
     """
+    near_crosswalk_index = CrosswalkIndex(streets, 2)
+    far_crosswalk_index = CrosswalkIndex(streets, 2 + width)
     right_border = shorten_border_for_crosswalk(street_data['right_border'],
                                                 street_data['name'],
                                                 streets,
                                                 crosswalk_width=2,
                                                 destination='to_intersection',
-                                                exclude_parallel=False
+                                                exclude_parallel=False,
+                                                crosswalk_index=near_crosswalk_index
                                                 )
     left_border = shorten_border_for_crosswalk(street_data['left_border'],
                                                street_data['name'],
                                                streets,
                                                crosswalk_width=2,
                                                destination='to_intersection',
-                                               exclude_parallel=False
+                                               exclude_parallel=False,
+                                               crosswalk_index=near_crosswalk_index
                                                )
 
     right_border2 = shorten_border_for_crosswalk(street_data['right_border'],
@@ -177,14 +182,16 @@ def get_simulated_crosswalk(street_data, streets, width=1.8):
                                                  streets,
                                                  crosswalk_width=2 + width,
                                                  destination='to_intersection',
-                                                 exclude_parallel=False
+                                                 exclude_parallel=False,
+                                                 crosswalk_index=far_crosswalk_index
                                                  )
     left_border2 = shorten_border_for_crosswalk(street_data['left_border'],
                                                 street_data['name'],
                                                 streets,
                                                 crosswalk_width=2 + width,
                                                 destination='to_intersection',
-                                                exclude_parallel=False
+                                                exclude_parallel=False,
+                                                crosswalk_index=far_crosswalk_index
                                                 )
 
     crosswalk = {
@@ -8,68 +8,191 @@
 #######################################################################
 
 
-import copy
-from border import get_bicycle_border, cut_line_by_relative_distance, cut_border_by_point, get_border_length
+import multiprocessing
+import numpy as np
+from functools import partial
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+from border import get_bicycle_border, get_border_length, get_active_projection, get_local_projection, to_local, \
+    to_geographic, local_geometry
+from polyline import get_polyline
 from matplotlib.patches import Polygon
 from right_turn import get_right_turn_border, get_link, get_link_destination_lane, is_right_turn_allowed, \
     get_destination_lanes_for_right_turn
 from left_turn import is_left_turn_allowed, get_destination_lanes_for_left_turn
 from through import is_through_allowed, get_destination_lane
 from u_turn import is_u_turn_allowed, get_destination_lanes_for_u_turn, get_u_turn_border
-from turn import get_turn_border
+from turn import get_turn_borders
+from lane import LaneGraph
+from record import Guideway
 from log import get_logger, dictionary_to_log
 from footway import crosswalk_intersects_median, get_crosswalk_to_crosswalk_distance
 
 
 logger = get_logger()
+guideway_lane_keys = ('origin_lane', 'destination_lane', 'link_lane')
+worker_state = {}
 
 
-def get_bicycle_left_turn_guideways(all_lanes, nodes_dict):
+def get_bicycle_left_turn_guideways(all_lanes, nodes_dict, lane_graph=None, through_guideways=None):
     """
     Compile a list of bicycle guideways for all legal left turns
     :param all_lanes: list of dictionaries
     :param nodes_dict: dictionary
+    :param lane_graph: LaneGraph of all lanes or None
+    :param through_guideways: list of through guideways of all lanes or None
     :return: list of dictionaries
     """
     logger.info('Starting bicycle left turn guideways')
     guideways = []
-    through_guideways = get_through_guideways(all_lanes)
+    if lane_graph is None:
+        lane_graph = LaneGraph(all_lanes)
+    if through_guideways is None:
+        through_guideways = get_through_guideways(all_lanes, lane_graph=lane_graph)
 
+    through_index = ThroughGuidewayIndex(all_lanes, lane_graph, through_guideways=through_guideways)
     for origin_lane in all_lanes:
-        if is_left_turn_allowed(origin_lane):
-            for destination_lane in get_destination_lanes_for_left_turn(origin_lane, all_lanes, nodes_dict):
-                origin_candidates = [g for g in through_guideways if g['origin_lane']['id'] == origin_lane['id']]
-                destination_candidates = [g for g in through_guideways
-                                          if g['destination_lane']['id'] == destination_lane['id']
-                                          ]
-                if origin_candidates and destination_candidates:
-                    logger.debug('Origin Lane ' + dictionary_to_log(origin_candidates[0]))
-                    logger.debug('Destin Lane ' + dictionary_to_log(destination_candidates[0]))
-                    try:
-                        guideway_data = get_bicycle_left_guideway(origin_lane,
-                                                                  destination_lane,
-                                                                  origin_candidates[0],
-                                                                  destination_candidates[0]
-                                                                  )
-                        set_guideway_id(guideway_data)
-                    except Exception as e:
-                        logger.exception(e)
-                        guideway_data = None
-
-                else:
-                    guideway_data = None
-
-                if guideway_data is not None \
-                        and guideway_data['left_border'] is not None \
-                        and guideway_data['median'] is not None \
-                        and guideway_data['right_border'] is not None:
-                    logger.debug('Guideway ' + dictionary_to_log(guideway_data))
-                    guideways.append(guideway_data)
+        guideways.extend(get_bicycle_left_turn_guideways_from_origin(origin_lane,
+                                                                     all_lanes,
+                                                                     nodes_dict,
+                                                                     through_index,
+                                                                     lane_graph=lane_graph
+                                                                     ))
 
     logger.info('Created %d guideways' % len(guideways))
     return guideways
 
 
+class ThroughGuidewayIndex(object):
+    """
+    The first through guideway for each origin and destination lane.
+    If the through guideways of all lanes are not given, a through guideway is created only when it is requested,
+    so that bicycle left turns selected by a filter do not need the geometry of all through guideways.
+    The lookups return the same guideways as the full list of through guideways.
+    """
+
+    def __init__(self, all_lanes, lane_graph, through_guideways=None):
+        """
+        :param all_lanes: list of dictionaries
+        :param lane_graph: LaneGraph of all lanes
+        :param through_guideways: list of through guideways of all lanes or None
+        """
+        self.all_lanes = all_lanes
+        self.lane_graph = lane_graph
+        self.by_origin = None
+        self.by_destination = None
+        self.origins_by_destination = None
+        self.created = {}
+        if through_guideways is not None:
+            self.by_origin = {}
+            self.by_destination = {}
+            for g in through_guideways:
+                self.by_origin.setdefault(g['origin_lane']['id'], g)
+                self.by_destination.setdefault(g['destination_lane']['id'], g)
+
+    def get_by_origin(self, origin_lane):
+        """
+        Get the through guideway from an origin lane
+        :param origin_lane: dictionary
+        :return: dictionary or None
+        """
+        if self.by_origin is not None:
+            return self.by_origin.get(origin_lane['id'])
+        return self.create(origin_lane)
+
+    def get_by_destination(self, destination_lane):
+        """
+        Get the first through guideway to a destination lane
+        :param destination_lane: dictionary
+        :return: dictionary or None
+        """
+        if self.by_destination is not None:
+            return self.by_destination.get(destination_lane['id'])
+        if self.origins_by_destination is None:
+            # Destinations are found from the lane graph without creating any geometry
+            self.origins_by_destination = {}
+            for l in self.all_lanes:
+                if is_through_allowed(l):
+                    d = get_destination_lane(l, self.all_lanes, lane_graph=self.lane_graph)
+                    if d is not None:
+                        self.origins_by_destination.setdefault(d['id'], []).append(l)
+        for l in self.origins_by_destination.get(destination_lane['id'], []):
+            guideway_data = self.create(l)
+            if guideway_data is not None and guideway_data['destination_lane']['id'] == destination_lane['id']:
+                return guideway_data
+        return None
+
+    def create(self, origin_lane):
+        """
+        Create the through guideway from an origin lane once
+        :param origin_lane: dictionary
+        :return: dictionary or None
+        """
+        if origin_lane['id'] not in self.created:
+            guideways = get_through_guideways_from_origin(origin_lane, self.all_lanes, lane_graph=self.lane_graph)
+            self.created[origin_lane['id']] = guideways[0] if guideways else None
+        return self.created[origin_lane['id']]
+
+
+def get_bicycle_left_turn_guideways_from_origin(origin_lane,
+                                                all_lanes,
+                                                nodes_dict,
+                                                through_index,
+                                                lane_graph=None,
+                                                guideway_filter=None
+                                                ):
+    """
+    Compile a list of bicycle guideways for all legal left turns from an origin lane
+    :param origin_lane: dictionary
+    :param all_lanes: list of dictionaries
+    :param nodes_dict: dictionary
+    :param through_index: ThroughGuidewayIndex of all lanes
+    :param lane_graph: LaneGraph of all lanes or None
+    :param guideway_filter: function of a guideway without geometry returning boolean or None, see is_guideway_selected
+    :return: list of dictionaries
+    """
+    guideways = []
+    if not is_left_turn_allowed(origin_lane):
+        return guideways
+
+    for destination_lane in get_destination_lanes_for_left_turn(origin_lane,
+                                                                all_lanes,
+                                                                nodes_dict,
+                                                                lane_graph=lane_graph
+                                                                ):
+        if not is_guideway_selected(guideway_filter, origin_lane, destination_lane, 'left'):
+            continue
+        origin_through = through_index.get_by_origin(origin_lane)
+        destination_through = through_index.get_by_destination(destination_lane)
+        if origin_through is not None and destination_through is not None:
+            logger.debug('Origin Lane ' + dictionary_to_log(origin_through))
+            logger.debug('Destin Lane ' + dictionary_to_log(destination_through))
+            try:
+                guideway_data = get_bicycle_left_guideway(origin_lane,
+                                                          destination_lane,
+                                                          origin_through,
+                                                          destination_through
+                                                          )
+                set_guideway_id(guideway_data)
+            except Exception as e:
+                logger.exception(e)
+                guideway_data = None
+
+        else:
+            guideway_data = None
+
+        if guideway_data is not None \
+                and guideway_data['left_border'] is not None \
+                and guideway_data['median'] is not None \
+                and guideway_data['right_border'] is not None:
+            logger.debug('Guideway ' + dictionary_to_log(guideway_data))
+            guideways.append(guideway_data)
+
+    return guideways
+
+
 def get_bicycle_left_guideway(origin_lane, destination_lane, origin_through, destination_through):
     """
     Get a bicycle guideway for the left turn assuming that the bicyclist making the left turn as pedestrian, 
@@ -81,72 +204,145 @@ def get_bicycle_left_guideway(origin_lane, destination_lane, origin_through, des
     :param destination_through: dictionary
     :return: dictionary
     """
-    return {
+    return Guideway({
         'direction': 'left',
         'origin_lane': origin_lane,
         'destination_lane': destination_lane,
         'left_border':  get_bicycle_border(origin_through['left_border'], destination_through['left_border']),
         'median':       get_bicycle_border(origin_through['median'], destination_through['median']),
         'right_border': get_bicycle_border(origin_through['right_border'], destination_through['right_border'])
-    }
+    })
 
 
-def get_left_turn_guideways(all_lanes, nodes_dict):
+def get_left_turn_guideways(all_lanes, nodes_dict, number_of_points=12, lane_graph=None):
     """
     Compile a list of guideways for all legal left turns
     :param all_lanes: list of dictionaries
     :param nodes_dict: dictionary
+    :param number_of_points: integer, number of turn arc segments
+    :param lane_graph: LaneGraph of all lanes or None
     :return: list of dictionaries
     """
     logger.info('Starting left turn guideways')
+    if lane_graph is None:
+        lane_graph = LaneGraph(all_lanes)
     guideways = []
     for origin_lane in all_lanes:
-        if is_left_turn_allowed(origin_lane):
-            logger.debug('Origin Lane ' + dictionary_to_log(origin_lane))
-            for destination_lane in get_destination_lanes_for_left_turn(origin_lane, all_lanes, nodes_dict):
-                logger.debug('Destin Lane ' + dictionary_to_log(destination_lane))
-                try:
-                    guideway_data = get_direct_turn_guideway(origin_lane, destination_lane, all_lanes, turn_type='left')
-                    set_guideway_id(guideway_data)
-                except Exception as e:
-                    logger.exception(e)
-                    guideway_data = None
-
-                if guideway_data is not None:
-                    logger.debug('Guideway ' + dictionary_to_log(guideway_data))
-                    guideways.append(guideway_data)
-
+        guideways.extend(get_left_turn_guideways_from_origin(origin_lane,
+                                                             all_lanes,
+                                                             nodes_dict,
+                                                             number_of_points=number_of_points,
+                                                             lane_graph=lane_graph
+                                                             ))
     logger.info('Created %d guideways' % len(guideways))
     return guideways
 
 
-def create_right_turn_guideway(origin_lane, all_lanes):
+def get_left_turn_guideways_from_origin(origin_lane,
+                                        all_lanes,
+                                        nodes_dict,
+                                        number_of_points=12,
+                                        lane_graph=None,
+                                        guideway_filter=None
+                                        ):
+    """
+    Compile a list of guideways for all legal left turns from an origin lane
+    :param origin_lane: dictionary
+    :param all_lanes: list of dictionaries
+    :param nodes_dict: dictionary
+    :param number_of_points: integer, number of turn arc segments
+    :param lane_graph: LaneGraph of all lanes or None
+    :param guideway_filter: function of a guideway without geometry returning boolean or None, see is_guideway_selected
+    :return: list of dictionaries
+    """
+    guideways = []
+    if not is_left_turn_allowed(origin_lane):
+        return guideways
+
+    logger.debug('Origin Lane ' + dictionary_to_log(origin_lane))
+    for destination_lane in get_destination_lanes_for_left_turn(origin_lane,
+                                                                all_lanes,
+                                                                nodes_dict,
+                                                                lane_graph=lane_graph
+                                                                ):
+        if not is_guideway_selected(guideway_filter, origin_lane, destination_lane, 'left'):
+            continue
+        logger.debug('Destin Lane ' + dictionary_to_log(destination_lane))
+        try:
+            guideway_data = get_direct_turn_guideway(origin_lane,
+                                                     destination_lane,
+                                                     all_lanes,
+                                                     turn_type='left',
+                                                     number_of_points=number_of_points,
+                                                     lane_graph=lane_graph
+                                                     )
+            set_guideway_id(guideway_data)
+        except Exception as e:
+            logger.exception(e)
+            guideway_data = None
+
+        if guideway_data is not None:
+            logger.debug('Guideway ' + dictionary_to_log(guideway_data))
+            guideways.append(guideway_data)
+
+    return guideways
+
+
+def call_in_local_geometry(function, projection, *args):
+    """
+    Call a function within a local geometry context, see border.local_geometry
+    :param function: function
+    :param projection: projection dictionary or None
+    :param args: arguments of the function
+    :return: result of the function
+    """
+    with local_geometry(projection):
+        return function(*args)
+
+
+def create_right_turn_guideway(origin_lane, all_lanes, number_of_points=12, lane_graph=None, guideway_filter=None):
     """
     Calculate the right border and create a guideway
     :param origin_lane: dictionary
     :param all_lanes: list of dictionary
-    :return: dictionary
+    :param number_of_points: integer, number of turn arc segments if there is no link lane
+    :param lane_graph: LaneGraph of all lanes or None
+    :param guideway_filter: function of a guideway without geometry returning boolean or None, see is_guideway_selected
+    :return: dictionary or None if there is no guideway or it is not selected by the filter
     """
 
-    guideway = {
+    guideway = Guideway({
         'direction': 'right',
         'origin_lane': origin_lane,
-    }
+    })
+
+    if lane_graph is None:
+        lane_graph = LaneGraph(all_lanes)
 
-    link_lane = get_link(origin_lane, all_lanes)
+    link_lane = get_link(origin_lane, all_lanes, lane_graph=lane_graph)
     if link_lane is None:
-        destination_lanes = get_destination_lanes_for_right_turn(origin_lane, all_lanes)
+        destination_lanes = get_destination_lanes_for_right_turn(origin_lane, all_lanes, lane_graph=lane_graph)
         if len(destination_lanes) > 0:
-            return get_direct_turn_guideway(origin_lane, destination_lanes[0], all_lanes, turn_type='right')
+            if not is_guideway_selected(guideway_filter, origin_lane, destination_lanes[0], 'right'):
+                return None
+            return get_direct_turn_guideway(origin_lane,
+                                            destination_lanes[0],
+                                            all_lanes,
+                                            turn_type='right',
+                                            number_of_points=number_of_points,
+                                            lane_graph=lane_graph
+                                            )
         else:
             return None
 
     guideway['link_lane'] = link_lane
 
-    destination_lane = get_link_destination_lane(link_lane, all_lanes)
+    destination_lane = get_link_destination_lane(link_lane, all_lanes, lane_graph=lane_graph)
     if destination_lane is None:
         logger.debug('Link destination not found. Origin id %d' % origin_lane['id'])
         return None
+    if not is_guideway_selected(guideway_filter, origin_lane, destination_lane, 'right'):
+        return None
 
     if origin_lane['left_shaped_border'] is None:
         left_border_type = 'left_border'
@@ -187,95 +383,146 @@ def get_through_guideway(origin_lane, destination_lane):
     :param destination_lane: dictionary
     :return: dictionary
     """
-    return {
+    return Guideway({
         'direction': 'through',
         'origin_lane': origin_lane,
         'destination_lane': destination_lane,
         'left_border': origin_lane['left_border'][:-1] + destination_lane['left_border'][1:],
         'median': origin_lane['median'][:-1] + destination_lane['median'][1:],
         'right_border': origin_lane['right_border'][:-1] + destination_lane['right_border'][1:]
-    }
+    })
 
 
-def get_u_turn_guideways(all_lanes, x_data):
+def get_u_turn_guideways(all_lanes, x_data, lane_graph=None):
     """
     Compile a list of bicycle guideways for all legal u-turns
     :param all_lanes: list of dictionaries
     :param x_data: intersection dictionary
+    :param lane_graph: LaneGraph of all lanes or None
     :return: list of dictionaries
     """
 
     logger.info('Starting U-turn guideways')
+    if lane_graph is None:
+        lane_graph = LaneGraph(all_lanes)
     guideways = []
-
     for origin_lane in all_lanes:
-        if is_u_turn_allowed(origin_lane, x_data):
-            logger.debug('Origin Lane ' + dictionary_to_log(origin_lane))
-            for destination_lane in get_destination_lanes_for_u_turn(origin_lane, all_lanes):
-                logger.debug('Destin Lane ' + dictionary_to_log(destination_lane))
-                try:
-                    guideway_data = get_u_turn_guideway(origin_lane, destination_lane, all_lanes)
-                    set_guideway_id(guideway_data)
-                except Exception as e:
-                    logger.exception(e)
-                    guideway_data = None
-
-                if guideway_data is not None \
-                        and guideway_data['left_border'] is not None \
-                        and guideway_data['median'] is not None \
-                        and guideway_data['right_border'] is not None:
-                    logger.debug('Guideway ' + dictionary_to_log(guideway_data))
-                    guideways.append(guideway_data)
-
+        guideways.extend(get_u_turn_guideways_from_origin(origin_lane,
+                                                          all_lanes,
+                                                          x_data,
+                                                          lane_graph=lane_graph
+                                                          ))
     logger.info('Created %d guideways' % len(guideways))
     return guideways
 
 
-def get_u_turn_guideway(origin_lane, destination_lane, all_lanes):
+def get_u_turn_guideways_from_origin(origin_lane, all_lanes, x_data, lane_graph=None, guideway_filter=None):
+    """
+    Compile a list of guideways for all legal u-turns from an origin lane
+    :param origin_lane: dictionary
+    :param all_lanes: list of dictionaries
+    :param x_data: intersection dictionary
+    :param lane_graph: LaneGraph of all lanes or None
+    :param guideway_filter: function of a guideway without geometry returning boolean or None, see is_guideway_selected
+    :return: list of dictionaries
+    """
+    guideways = []
+    if not is_u_turn_allowed(origin_lane, x_data):
+        return guideways
+
+    logger.debug('Origin Lane ' + dictionary_to_log(origin_lane))
+    for destination_lane in get_destination_lanes_for_u_turn(origin_lane, all_lanes, lane_graph=lane_graph):
+        if not is_guideway_selected(guideway_filter, origin_lane, destination_lane, 'u_turn'):
+            continue
+        logger.debug('Destin Lane ' + dictionary_to_log(destination_lane))
+        try:
+            guideway_data = get_u_turn_guideway(origin_lane, destination_lane, all_lanes, lane_graph=lane_graph)
+            set_guideway_id(guideway_data)
+        except Exception as e:
+            logger.exception(e)
+            guideway_data = None
+
+        if guideway_data is not None \
+                and guideway_data['left_border'] is not None \
+                and guideway_data['median'] is not None \
+                and guideway_data['right_border'] is not None:
+            logger.debug('Guideway ' + dictionary_to_log(guideway_data))
+            guideways.append(guideway_data)
+
+    return guideways
+
+
+def get_u_turn_guideway(origin_lane, destination_lane, all_lanes, lane_graph=None):
     """
     Create a u-turn guideway from an origin and destination lanes
     :param origin_lane: dictionary
     :param destination_lane: dictionary
     :param all_lanes: list of dictionaries
+    :param lane_graph: LaneGraph of all lanes or None
     :return: dictionary
     """
-    return {
+    if lane_graph is None:
+        lane_graph = LaneGraph(all_lanes)
+    return Guideway({
         'direction': 'u_turn',
         'origin_lane': origin_lane,
         'destination_lane': destination_lane,
-        'left_border': get_u_turn_border(origin_lane, destination_lane, all_lanes, 'left'),
-        'median': get_u_turn_border(origin_lane, destination_lane, all_lanes, 'median'),
-        'right_border': get_u_turn_border(origin_lane, destination_lane, all_lanes, 'right')
-    }
+        'left_border': get_u_turn_border(origin_lane, destination_lane, all_lanes, 'left', lane_graph=lane_graph),
+        'median': get_u_turn_border(origin_lane, destination_lane, all_lanes, 'median', lane_graph=lane_graph),
+        'right_border': get_u_turn_border(origin_lane, destination_lane, all_lanes, 'right', lane_graph=lane_graph)
+    })
 
 
-def get_through_guideways(all_lanes):
+def get_through_guideways(all_lanes, lane_graph=None):
     """
     Create through guideways from a list of merged lanes
     :param all_lanes: list of dictionaries
+    :param lane_graph: LaneGraph of all lanes or None
     :return: list of dictionaries
     """
 
     logger.info('Starting through guideways')
+    if lane_graph is None:
+        lane_graph = LaneGraph(all_lanes)
     guideways = []
     for origin_lane in all_lanes:
-        if is_through_allowed(origin_lane):
-            logger.debug('Origin Lane ' + dictionary_to_log(origin_lane))
-            destination_lane = get_destination_lane(origin_lane, all_lanes)
-            if destination_lane is not None:
-                logger.debug('Destin Lane ' + dictionary_to_log(destination_lane))
-                try:
-                    guideway_data = get_through_guideway(origin_lane, destination_lane)
-                    set_guideway_id(guideway_data)
-                    guideways.append(guideway_data)
-                    logger.debug('Guideway ' + dictionary_to_log(guideway_data))
-                except Exception as e:
-                    logger.exception(e)
-
+        guideways.extend(get_through_guideways_from_origin(origin_lane,
+                                                           all_lanes,
+                                                           lane_graph=lane_graph
+                                                           ))
     logger.info('Created %d guideways' % len(guideways))
     return guideways
 
 
+def get_through_guideways_from_origin(origin_lane, all_lanes, lane_graph=None, guideway_filter=None):
+    """
+    Create a through guideway from an origin lane
+    :param origin_lane: dictionary
+    :param all_lanes: list of dictionaries
+    :param lane_graph: LaneGraph of all lanes or None
+    :param guideway_filter: function of a guideway without geometry returning boolean or None, see is_guideway_selected
+    :return: list of at most one dictionary
+    """
+    guideways = []
+    if not is_through_allowed(origin_lane):
+        return guideways
+
+    logger.debug('Origin Lane ' + dictionary_to_log(origin_lane))
+    destination_lane = get_destination_lane(origin_lane, all_lanes, lane_graph=lane_graph)
+    if destination_lane is not None \
+            and is_guideway_selected(guideway_filter, origin_lane, destination_lane, 'through'):
+        logger.debug('Destin Lane ' + dictionary_to_log(destination_lane))
+        try:
+            guideway_data = get_through_guideway(origin_lane, destination_lane)
+            set_guideway_id(guideway_data)
+            guideways.append(guideway_data)
+            logger.debug('Guideway ' + dictionary_to_log(guideway_data))
+        except Exception as e:
+            logger.exception(e)
+
+    return guideways
+
+
 def get_crosswalk_to_crosswalk_distance_along_guideway(guideway_data, crosswalks):
     """
     Calculate max distance between crosswalks along a guideway
@@ -310,18 +557,26 @@ def get_crosswalk_to_crosswalk_distance_along_guideway(guideway_data, crosswalks
                )
 
 
-def get_direct_turn_guideway(origin_lane, destination_lane, all_lanes, turn_type='right'):
+def get_direct_turn_guideway(origin_lane,
+                             destination_lane,
+                             all_lanes,
+                             turn_type='right',
+                             number_of_points=12,
+                             lane_graph=None
+                             ):
     """
     Create a right or left turn guideway if there is no link lane connecting origin and destination
     :param origin_lane: dictionary
     :param destination_lane: dictionary
     :param all_lanes: list of dictionaries
     :param turn_type: string: 'right' for a right turn, left' a for left one
+    :param number_of_points: integer, number of turn arc segments
+    :param lane_graph: LaneGraph of all lanes or None
     :return: dictionary
     """
 
     if turn_type == 'right':
-        if not is_right_turn_allowed(origin_lane, all_lanes):
+        if not is_right_turn_allowed(origin_lane, all_lanes, lane_graph=lane_graph):
             logger.debug('Right turn not allowed. Origin id %d' % origin_lane['id'])
             return None
         turn_direction = 1
@@ -331,38 +586,28 @@ def get_direct_turn_guideway(origin_lane, destination_lane, all_lanes, turn_type
             return None
         turn_direction = -1
 
-    guideway = {
+    guideway = Guideway({
         'direction': turn_type,
         'origin_lane': origin_lane,
         'destination_lane': destination_lane,
-    }
-
-    left_border = get_turn_border(origin_lane,
-                                  destination_lane,
-                                  all_lanes,
-                                  border_type='left',
-                                  turn_direction=turn_direction
-                                  )
+    })
+
+    left_border, right_border, median = get_turn_borders(origin_lane,
+                                                         destination_lane,
+                                                         all_lanes,
+                                                         border_types=('left', 'right', 'median'),
+                                                         turn_direction=turn_direction,
+                                                         number_of_points=number_of_points,
+                                                         lane_graph=lane_graph
+                                                         )
     if left_border is None:
         logger.debug('Left border failed. Origin id %d, Dest id %d' % (origin_lane['id'], destination_lane['id']))
         return None
 
-    right_border = get_turn_border(origin_lane,
-                                   destination_lane,
-                                   all_lanes,
-                                   border_type='right',
-                                   turn_direction=turn_direction
-                                   )
     if right_border is None:
         logger.debug('Right border failed. Origin id %d, Dest id %d' % (origin_lane['id'], destination_lane['id']))
         return None
 
-    median = get_turn_border(origin_lane,
-                             destination_lane,
-                             all_lanes,
-                             border_type='median',
-                             turn_direction=turn_direction
-                             )
     if median is None:
         logger.debug('Median failed. Origin id %d, Dest id %d' % (origin_lane['id'], destination_lane['id']))
         return None
@@ -373,30 +618,65 @@ def get_direct_turn_guideway(origin_lane, destination_lane, all_lanes, turn_type
     return guideway
 
 
-def get_right_turn_guideways(all_lanes):
+def get_right_turn_guideways(all_lanes, number_of_points=12, lane_graph=None):
     """
     Create a list of right turn guideways for lanes having an additional link to the destination
     :param all_lanes: list of dictionaries
+    :param number_of_points: integer, number of turn arc segments
+    :param lane_graph: LaneGraph of all lanes or None
     :return: list of dictionaries
     """
 
     logger.info('Starting right guideways')
+    if lane_graph is None:
+        lane_graph = LaneGraph(all_lanes)
     guideways = []
     for origin_lane in all_lanes:
-        if is_right_turn_allowed(origin_lane, all_lanes):
-            logger.debug('Origin Lane ' + dictionary_to_log(origin_lane))
-            try:
-                guideway_data = create_right_turn_guideway(origin_lane, all_lanes)
-                set_guideway_id(guideway_data)
-            except Exception as e:
-                logger.exception(e)
-                guideway_data = None
+        guideways.extend(get_right_turn_guideways_from_origin(origin_lane,
+                                                              all_lanes,
+                                                              number_of_points=number_of_points,
+                                                              lane_graph=lane_graph
+                                                              ))
+    logger.info('Created %d guideways' % len(guideways))
+    return guideways
 
-            if guideway_data is not None:
-                logger.debug('Guideway ' + dictionary_to_log(guideway_data))
-                guideways.append(guideway_data)
 
-    logger.info('Created %d guideways' % len(guideways))
+def get_right_turn_guideways_from_origin(origin_lane,
+                                         all_lanes,
+                                         number_of_points=12,
+                                         lane_graph=None,
+                                         guideway_filter=None
+                                         ):
+    """
+    Create a right turn guideway from an origin lane
+    :param origin_lane: dictionary
+    :param all_lanes: list of dictionaries
+    :param number_of_points: integer, number of turn arc segments
+    :param lane_graph: LaneGraph of all lanes or None
+    :param guideway_filter: function of a guideway without geometry returning boolean or None, see is_guideway_selected
+    :return: list of at most one dictionary
+    """
+    guideways = []
+    if not is_right_turn_allowed(origin_lane, all_lanes, lane_graph=lane_graph):
+        return guideways
+
+    logger.debug('Origin Lane ' + dictionary_to_log(origin_lane))
+    try:
+        guideway_data = create_right_turn_guideway(origin_lane,
+                                                   all_lanes,
+                                                   number_of_points=number_of_points,
+                                                   lane_graph=lane_graph,
+                                                   guideway_filter=guideway_filter
+                                                   )
+        set_guideway_id(guideway_data)
+    except Exception as e:
+        logger.exception(e)
+        guideway_data = None
+
+    if guideway_data is not None:
+        logger.debug('Guideway ' + dictionary_to_log(guideway_data))
+        guideways.append(guideway_data)
+
     return guideways
 
 
@@ -429,6 +709,83 @@ def set_guideway_length(g):
         logger.debug('Guideway id %d length %r' % (g['id'], g['length']))
 
 
+def get_guideway_arrays(guideway_data, spacing=1.0, projection=None):
+    """
+    Resample a guideway at a fixed spacing along the median.
+    The arrays are calculated in the local tangent plane of the projection,
+    or of the first median point if there is neither a projection nor an active local geometry.
+    The arrays are read-only, so they can be shared by all consumers of the guideway.
+    :param guideway_data: guideway dictionary
+    :param spacing: float, distance between the resampled points in meters
+    :param projection: projection dictionary or None
+    :return: dictionary of numpy arrays of the same size:
+        'x' and 'y' - longitudes and latitudes of the resampled median points,
+        'distance' - distance along the median in meters,
+        'heading' - compass bearing of the median in degrees,
+        'curvature' - change of the heading per meter in radians, positive for clockwise turns,
+        'left_half_width' and 'right_half_width' - distance from the median to the left and right border in meters
+    """
+    if projection is None:
+        projection = get_active_projection()
+    if projection is None:
+        projection = get_local_projection(*guideway_data['median'][0])
+
+    median = to_local(guideway_data['median'], projection)
+    segment_lengths = np.hypot(*np.diff(median, axis=0).T)
+    median = np.concatenate((median[:1], median[1:][segment_lengths > 0.0]))
+    cumulative_lengths = np.concatenate(([0.0], np.cumsum(segment_lengths[segment_lengths > 0.0])))
+
+    distance = np.arange(0.0, cumulative_lengths[-1], spacing)
+    distance = np.append(distance, cumulative_lengths[-1]) if len(distance) > 0 else cumulative_lengths[-1:]
+    points = np.column_stack((np.interp(distance, cumulative_lengths, median[:, 0]),
+                              np.interp(distance, cumulative_lengths, median[:, 1])
+                              ))
+
+    if len(distance) > 1:
+        dx = np.gradient(points[:, 0], distance)
+        dy = np.gradient(points[:, 1], distance)
+        angles = np.unwrap(np.arctan2(dx, dy))
+        curvature = np.gradient(angles, distance)
+    else:
+        angles = np.zeros(1)
+        curvature = np.zeros(1)
+
+    x, y = np.array(to_geographic(points, projection)).reshape(-1, 2).T
+    arrays = {
+        'x': x,
+        'y': y,
+        'distance': distance,
+        'heading': np.degrees(angles) % 360.0,
+        'curvature': curvature,
+        'left_half_width': get_distances_to_polyline(points, to_local(guideway_data['left_border'], projection)),
+        'right_half_width': get_distances_to_polyline(points, to_local(guideway_data['right_border'], projection))
+    }
+    for a in arrays.values():
+        a.flags.writeable = False
+    return arrays
+
+
+def get_distances_to_polyline(points, polyline_points):
+    """
+    Get distances from points to a polyline in a plane
+    :param points: numpy array of shape (n, 2)
+    :param polyline_points: numpy array of shape (m, 2)
+    :return: numpy array of n distances
+    """
+    if len(polyline_points) < 2:
+        return np.hypot(*(points - polyline_points[:1]).T)
+
+    p0 = polyline_points[:-1]
+    d = polyline_points[1:] - p0
+    squared_lengths = d[:, 0] * d[:, 0] + d[:, 1] * d[:, 1]
+    dx = points[:, :1] - p0[:, 0]
+    dy = points[:, 1:] - p0[:, 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fractions = np.where(squared_lengths > 0.0, (dx * d[:, 0] + dy * d[:, 1]) / squared_lengths, 0.0)
+    fractions = np.clip(fractions, 0.0, 1.0)
+    return np.sqrt(np.min((dx - fractions * d[:, 0]) ** 2 + (dy - fractions * d[:, 1]) ** 2, axis=1))
+
+
 def set_guideway_id(g):
     """
     Set guideway id as a combination of the origin and destination ids.
@@ -439,18 +796,49 @@ def set_guideway_id(g):
     """
 
     if g is not None:
-        g['id'] = 100*g['origin_lane']['id'] + g['destination_lane']['id']
-        if g['origin_lane']['lane_type'] == 'cycleway':
-            g['type'] = 'bicycle'
-        elif 'rail' in g['origin_lane']['lane_type']:
-            g['type'] = 'railway'
-        elif g['origin_lane']['lane_type'] == 'crosswalk':
-            g['type'] = 'footway'
-        else:
-            g['type'] = 'drive'
+        set_guideway_id_and_type(g)
         set_guideway_length(g)
 
 
+def set_guideway_id_and_type(g):
+    """
+    Set guideway id and type from the origin and destination lanes without using the guideway geometry
+    :param g: guideway dictionary
+    :return: None
+    """
+    g['id'] = 100*g['origin_lane']['id'] + g['destination_lane']['id']
+    if g['origin_lane']['lane_type'] == 'cycleway':
+        g['type'] = 'bicycle'
+    elif 'rail' in g['origin_lane']['lane_type']:
+        g['type'] = 'railway'
+    elif g['origin_lane']['lane_type'] == 'crosswalk':
+        g['type'] = 'footway'
+    else:
+        g['type'] = 'drive'
+
+
+def is_guideway_selected(guideway_filter, origin_lane, destination_lane, direction):
+    """
+    Check a guideway against a filter before its geometry is created.
+    The filter is called with a guideway having only the id, type, direction, origin and destination lanes,
+    so the filter must not use the borders or the length.
+    :param guideway_filter: function of a guideway returning boolean or None to select all guideways
+    :param origin_lane: dictionary
+    :param destination_lane: dictionary
+    :param direction: string: 'left', 'right', 'through' or 'u_turn'
+    :return: boolean
+    """
+    if guideway_filter is None:
+        return True
+    guideway_data = Guideway({
+        'direction': direction,
+        'origin_lane': origin_lane,
+        'destination_lane': destination_lane,
+    })
+    set_guideway_id_and_type(guideway_data)
+    return bool(guideway_filter(guideway_data))
+
+
 def get_polygon_from_guideway(guideway_data,
                               fc='y',
                               ec='w',
@@ -532,7 +920,7 @@ def relative_cut(guideway_data, relative_distance, starting_point="b"):
     If relative_distance = 0.3 and starting_point_for_cut="e", 
     then the function returns 30% of the original length adjacent to the end of the guideway.
     In addition this function sets the new guideway length.  The origin and destination lane lengths are preserved 
-    in the lane meta data sections.
+    in the lane meta data sections.  The reduced guideway refers to the same origin and destination lanes.
     :param guideway_data: guideway dictionary
     :param relative_distance: relative length
     :param starting_point: string, either 'b' or 'e'
@@ -542,33 +930,523 @@ def relative_cut(guideway_data, relative_distance, starting_point="b"):
     if guideway_data is None:
         return None
 
-    cut_guideway = copy.deepcopy(guideway_data)
-    if 'cut_history' in cut_guideway:
-        cut_guideway['cut_history'].append(str(relative_distance) + '_' + starting_point)
-    else:
-        cut_guideway['cut_history'] = [str(relative_distance) + '_' + starting_point]
-
     if starting_point == "b":
-        median = guideway_data['median']
-        left_border = guideway_data['left_border']
-        right_border = guideway_data['right_border']
+        cut_guideway = GuidewayView(guideway_data, 0.0, relative_distance).to_guideway()
     else:
-        median = guideway_data['median'][::-1]
-        left_border = guideway_data['left_border'][::-1]
-        right_border = guideway_data['right_border'][::-1]
+        cut_guideway = GuidewayView(guideway_data, 1.0 - relative_distance, 1.0).to_guideway()
+    cut_guideway['cut_history'] = guideway_data.get('cut_history', []) + [str(relative_distance) + '_' + starting_point]
+    return cut_guideway
 
-    cut_median = cut_line_by_relative_distance(median, relative_distance)
-    cut_left_border = cut_border_by_point(left_border, cut_median[-1])
-    cut_right_border = cut_border_by_point(right_border, cut_median[-1])
 
-    if starting_point == "b":
-        cut_guideway['median'] = cut_median
-        cut_guideway['left_border'] = cut_left_border
-        cut_guideway['right_border'] = cut_right_border
+def get_guideway_views(guideway_data, windows):
+    """
+    Get views of many windows of one guideway.
+    The views share the polylines of the guideway, so the cumulative lengths are calculated once for all windows.
+    :param guideway_data: guideway dictionary
+    :param windows: list of tuples (start, end), where start and end are fractions of the median length
+    :return: list of GuidewayView
+    """
+    polylines = get_guideway_polylines(guideway_data)
+    return [GuidewayView(guideway_data, start, end, polylines=polylines) for start, end in windows]
+
+
+def get_guideway_polylines(guideway_data):
+    """
+    Get polylines of the left border, median and right border of a guideway
+    :param guideway_data: guideway dictionary
+    :return: dictionary of polylines
+    """
+    return dict((key, get_polyline(guideway_data[key])) for key in ('left_border', 'median', 'right_border'))
+
+
+class GuidewayView(Mapping):
+    """
+    Window of a guideway between two fractions of the median length, e.g. (0.0, 0.3) is the first 30% of the guideway.
+    The view stores only the guideway and the fractions.  The borders and median of the window are cut on the first
+    access, from polylines with cached cumulative lengths.  The borders are cut at the points
+    nearest to the ends of the cut median.
+    The view reads like a guideway dictionary: the left border, median, right border and length are
+    those of the window, all other keys are those of the guideway.
+    """
+
+    __slots__ = ('guideway', 'start', 'end', 'polylines', 'cut')
+    window_keys = ('left_border', 'median', 'right_border', 'length')
+
+    def __init__(self, guideway_data, start=0.0, end=1.0, polylines=None):
+        """
+        :param guideway_data: guideway dictionary
+        :param start: fraction of the median length from the beginning of the guideway
+        :param end: fraction of the median length from the beginning of the guideway
+        :param polylines: dictionary of polylines of the guideway or None, see get_guideway_polylines
+        """
+        self.guideway = guideway_data
+        self.start = start
+        self.end = end
+        self.polylines = polylines
+        self.cut = None
+
+    def __getitem__(self, key):
+        if key in self.window_keys:
+            return self.get_cut()[key]
+        return self.guideway[key]
+
+    def __iter__(self):
+        for key in self.guideway:
+            yield key
+        for key in self.window_keys:
+            if key not in self.guideway:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return 'GuidewayView(%r, %r, %r)' % (self.guideway.get('id'), self.start, self.end)
+
+    def get_cut(self):
+        """
+        Cut the borders and median of the guideway.  The result is calculated once.
+        :return: dictionary of the left border, median, right border and length of the window
+        """
+        if self.cut is not None:
+            return self.cut
+
+        if self.polylines is None:
+            self.polylines = get_guideway_polylines(self.guideway)
+        median = self.polylines['median']
+
+        if self.start > 0.0:
+            start = median.project(median.interpolate(self.start, normalized=True))
+        else:
+            start = 0.0
+        if self.end < 1.0:
+            end = median.project(median.interpolate(self.end, normalized=True))
+        else:
+            end = median.length
+        cut_median = list(median.get_substring(start, end).coords)
+
+        self.cut = {
+            'left_border': self.cut_border(self.polylines['left_border'], cut_median),
+            'median': cut_median,
+            'right_border': self.cut_border(self.polylines['right_border'], cut_median),
+            'length': get_border_length(cut_median)
+        }
+        return self.cut
+
+    def cut_border(self, border, cut_median):
+        """
+        Cut a border at the points nearest to the ends of the cut median
+        :param border: polyline
+        :param cut_median: list of coordinates
+        :return: list of coordinates
+        """
+        if len(border) < 2:
+            return []
+        start = border.project(cut_median[0]) if self.start > 0.0 else 0.0
+        end = border.project(cut_median[-1]) if self.end < 1.0 else border.length
+        return list(border.get_substring(start, end).coords)
+
+    def to_guideway(self):
+        """
+        Create a guideway dictionary for the window.  The guideway refers to the same origin and destination lanes.
+        :return: guideway dictionary
+        """
+        cut_guideway = self.guideway.copy()
+        cut = self.get_cut()
+        cut_guideway['left_border'] = cut['left_border']
+        cut_guideway['median'] = cut['median']
+        cut_guideway['right_border'] = cut['right_border']
+        set_guideway_length(cut_guideway)
+        return cut_guideway
+
+
+class GuidewayCache(object):
+    """
+    Guideways of an intersection memoized by guideway type, with index maps by approach and exit lane ids
+    and resampled guideway arrays by spacing and guideway.
+    The cache is valid as long as the lanes of the intersection are the same:
+    the lists of merged lanes, cycleways and tracks hold the same lane objects with the same borders.
+    Otherwise the cache is cleared on the next lookup.  Changes made to a border in place are not detected,
+    clear the cache explicitly after such changes.
+    Copying or pickling the cache produces an empty cache.
+    """
+
+    lane_keys = ('merged_lanes', 'merged_cycleways', 'merged_tracks')
+
+    def __init__(self):
+        self.lanes = None
+        self.components = {}
+        self.guideways = {}
+        self.lane_graphs = {}
+        self.by_approach_id = None
+        self.by_exit_id = None
+        self.arrays = {}
+
+    def __getstate__(self):
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+    def clear(self):
+        """
+        Remove all memoized guideways
+        :return: None
+        """
+        self.__init__()
+
+    def validate(self, intersection_data):
+        """
+        Clear the cache if the lanes of the intersection have changed since the guideways were memoized
+        :param intersection_data: dictionary
+        :return: None
+        """
+        lanes = get_lane_references(intersection_data, self.lane_keys)
+        if self.lanes is None or len(lanes) != len(self.lanes) or any(a is not b for a, b in zip(lanes, self.lanes)):
+            self.clear()
+            self.lanes = lanes
+
+    def get_index(self, guideways, lane_key):
+        """
+        Build an index of guideways by the id of the origin or destination lane
+        :param guideways: list of dictionaries
+        :param lane_key: string, either 'origin_lane' or 'destination_lane'
+        :return: dictionary of lists of guideways
+        """
+        index = {}
+        for g in guideways:
+            index.setdefault(g[lane_key]['id'], []).append(g)
+        return index
+
+
+def get_lane_references(intersection_data, lane_keys):
+    """
+    Get a flat list of the lane lists, lanes and lane borders of an intersection
+    to compare them by identity with a previous state
+    :param intersection_data: dictionary
+    :param lane_keys: list of keys of lane lists
+    :return: list of objects
+    """
+    references = [intersection_data.get('nodes'), intersection_data.get('projection')]
+    for key in lane_keys:
+        lanes = intersection_data.get(key)
+        references.append(lanes)
+        for l in lanes or []:
+            references.extend([l, l.get('left_border'), l.get('right_border'), l.get('median')])
+    return references
+
+
+def get_guideway_cache(intersection_data):
+    """
+    Get the guideway cache of the intersection.
+    The cache is created on the first use and cleared if the intersection lanes have changed.
+    :param intersection_data: dictionary
+    :return: GuidewayCache
+    """
+    if 'guideway_cache' not in intersection_data:
+        intersection_data['guideway_cache'] = GuidewayCache()
+    intersection_data['guideway_cache'].validate(intersection_data)
+    return intersection_data['guideway_cache']
+
+
+def get_guideway_component(intersection_data, component):
+    """
+    Get guideways of one component, e.g. vehicle left turns.
+    The guideways are created once and memoized in the guideway cache of the intersection.
+    :param intersection_data: dictionary
+    :param component: string, e.g. 'vehicle left', 'rail' or 'bicycle through'
+    :return: list of dictionaries
+    """
+    guideway_cache = get_guideway_cache(intersection_data)
+    if component not in guideway_cache.components:
+        with local_geometry(intersection_data.get('projection')):
+            guideway_cache.components[component] = create_guideway_component(intersection_data,
+                                                                             component,
+                                                                             guideway_cache.lane_graphs
+                                                                             )
+    return guideway_cache.components[component]
+
+
+def create_guideway_component(intersection_data, component, lane_graphs):
+    """
+    Create guideways of one component, e.g. vehicle left turns
+    :param intersection_data: dictionary
+    :param component: string, e.g. 'vehicle left', 'rail' or 'bicycle through'
+    :param lane_graphs: dictionary of lane graphs by lane key
+    :return: list of dictionaries
+    """
+    if component == 'vehicle left':
+        return get_left_turn_guideways(intersection_data['merged_lanes'],
+                                       intersection_data['nodes'],
+                                       lane_graph=get_lane_graph(intersection_data, 'merged_lanes', lane_graphs)
+                                       )
+    if component == 'vehicle right':
+        return get_right_turn_guideways(intersection_data['merged_lanes'],
+                                        lane_graph=get_lane_graph(intersection_data, 'merged_lanes', lane_graphs)
+                                        )
+    if component == 'vehicle through':
+        return get_through_guideways(intersection_data['merged_lanes'],
+                                     lane_graph=get_lane_graph(intersection_data, 'merged_lanes', lane_graphs)
+                                     )
+    if component == 'vehicle u-turn':
+        return get_u_turn_guideways(intersection_data['merged_lanes'],
+                                    intersection_data,
+                                    lane_graph=get_lane_graph(intersection_data, 'merged_lanes', lane_graphs)
+                                    )
+    if component == 'rail':
+        return get_through_guideways(intersection_data['merged_tracks'],
+                                     lane_graph=get_lane_graph(intersection_data, 'merged_tracks', lane_graphs)
+                                     )
+    if component == 'bicycle left':
+        return get_bicycle_left_turn_guideways(intersection_data['merged_cycleways'],
+                                               intersection_data['nodes'],
+                                               lane_graph=get_lane_graph(intersection_data,
+                                                                         'merged_cycleways',
+                                                                         lane_graphs
+                                                                         ),
+                                               through_guideways=get_guideway_component(intersection_data,
+                                                                                        'bicycle through'
+                                                                                        )
+                                               )
+    if component == 'bicycle right':
+        return get_right_turn_guideways(intersection_data['merged_cycleways'],
+                                        lane_graph=get_lane_graph(intersection_data, 'merged_cycleways', lane_graphs)
+                                        )
+    if component == 'bicycle through':
+        return get_through_guideways(intersection_data['merged_cycleways'],
+                                     lane_graph=get_lane_graph(intersection_data, 'merged_cycleways', lane_graphs)
+                                     )
+    return []
+
+
+def memoize_guideway_components(intersection_data, components, processes):
+    """
+    Create the guideways of the components that are not memoized yet in a pool of worker processes
+    and memoize them in the guideway cache of the intersection.
+    The lanes, the nodes they refer to and the projection are sent to each worker once, when the worker starts.
+    A task creates the guideways of one component from one origin lane.  The worker returns the origin lane index
+    and the guideways referring to the lanes by id, and the guideways are bound back to the lanes of the intersection.
+    The guideways are put in the order of the origin lanes, so they and their ids are the same as in a serial run.
+    :param intersection_data: dictionary
+    :param components: list of strings, e.g. ['vehicle left', 'rail']
+    :param processes: integer, number of worker processes
+    :return: None
+    """
+    guideway_cache = get_guideway_cache(intersection_data)
+    components = [c for c in components
+                  if c not in guideway_cache.components and get_component_lane_key(c) is not None]
+    tasks = [(component, origin_index)
+             for component in components
+             for origin_index in range(len(intersection_data[get_component_lane_key(component)]))
+             ]
+    if not tasks:
+        return
+
+    pool = multiprocessing.Pool(processes,
+                                initializer=init_guideway_worker,
+                                initargs=(get_worker_intersection_data(intersection_data),)
+                                )
+    try:
+        results = list(pool.imap_unordered(create_guideways_in_worker, tasks))
+    finally:
+        pool.terminate()
+        pool.join()
+
+    lanes_by_id = {}
+    for lane_key in GuidewayCache.lane_keys:
+        lanes_by_id[lane_key] = dict((l['id'], l) for l in intersection_data.get(lane_key) or [])
+
+    guideways_by_origin = {}
+    for component, origin_index, guideways in results:
+        lane_key = get_component_lane_key(component)
+        for g in guideways:
+            for key in guideway_lane_keys:
+                if g.get(key) is not None:
+                    g[key] = lanes_by_id[lane_key][g[key]]
+        guideways_by_origin[(component, origin_index)] = guideways
+
+    for component in components:
+        lane_key = get_component_lane_key(component)
+        guideway_cache.components[component] = [g for origin_index in range(len(intersection_data[lane_key]))
+                                                for g in guideways_by_origin[(component, origin_index)]
+                                                ]
+
+
+def get_worker_intersection_data(intersection_data):
+    """
+    Get the part of the intersection needed to create guideways in a worker process
+    :param intersection_data: dictionary
+    :return: dictionary
+    """
+    nodes_dict = intersection_data['nodes']
+    worker_data = {
+        'center_x': intersection_data['center_x'],
+        'center_y': intersection_data['center_y'],
+        'projection': intersection_data.get('projection'),
+        'nodes': {}
+    }
+    for lane_key in GuidewayCache.lane_keys:
+        worker_data[lane_key] = intersection_data.get(lane_key) or []
+        for l in worker_data[lane_key]:
+            for n in l['nodes']:
+                if n in nodes_dict:
+                    worker_data['nodes'][n] = nodes_dict[n]
+    return worker_data
+
+
+def init_guideway_worker(intersection_data):
+    """
+    Initialize a worker process creating guideways, see memoize_guideway_components
+    :param intersection_data: dictionary, see get_worker_intersection_data
+    :return: None
+    """
+    worker_state['intersection_data'] = intersection_data
+    worker_state['lane_graphs'] = {}
+    worker_state['functions'] = {}
+
+
+def create_guideways_in_worker(task):
+    """
+    Create the guideways of a component from an origin lane in a worker process.
+    The lanes of the guideways are replaced by their ids, so that the lanes are not sent back.
+    :param task: tuple of the component and the origin lane index
+    :return: tuple of the component, the origin lane index and a list of dictionaries
+    """
+    component, origin_index = task
+    intersection_data = worker_state['intersection_data']
+    with local_geometry(intersection_data['projection']):
+        if component not in worker_state['functions']:
+            worker_state['functions'][component] = get_origin_lane_function(intersection_data,
+                                                                            component,
+                                                                            worker_state['lane_graphs']
+                                                                            )
+        lane_key, function = worker_state['functions'][component]
+        guideways = function(intersection_data[lane_key][origin_index])
+
+    for g in guideways:
+        for key in guideway_lane_keys:
+            if g.get(key) is not None:
+                g[key] = g[key]['id']
+    return component, origin_index, guideways
+
+
+def iter_guideway_component(intersection_data, component, guideway_filter=None):
+    """
+    Generate guideways of one component origin lane by origin lane.
+    If the component is memoized, copies of the memoized guideways are generated.
+    Otherwise the guideways are created as they are requested and not memoized,
+    and the filter is applied before the geometry of a guideway is created.
+    The guideways and their ids are the same and in the same order as in get_guideway_component.
+    :param intersection_data: dictionary
+    :param component: string, e.g. 'vehicle left', 'rail' or 'bicycle through'
+    :param guideway_filter: function of a guideway returning boolean or None, see is_guideway_selected
+    :return: generator of dictionaries
+    """
+    guideway_cache = get_guideway_cache(intersection_data)
+    if component in guideway_cache.components:
+        for g in guideway_cache.components[component]:
+            if guideway_filter is None or guideway_filter(g):
+                yield g.copy()
+        return
+
+    projection = intersection_data.get('projection')
+    with local_geometry(projection):
+        lane_key, function = get_origin_lane_function(intersection_data,
+                                                      component,
+                                                      guideway_cache.lane_graphs,
+                                                      guideway_filter=guideway_filter
+                                                      )
+    if lane_key is None:
+        return
+
+    for origin_lane in intersection_data[lane_key]:
+        # The local geometry is entered for each origin lane and left before yielding,
+        # so that it does not apply to the caller's code between the guideways
+        for g in call_in_local_geometry(function, projection, origin_lane):
+            yield g
+
+
+def get_origin_lane_function(intersection_data, component, lane_graphs, guideway_filter=None):
+    """
+    Get the lane key and the function creating guideways of one component from an origin lane
+    :param intersection_data: dictionary
+    :param component: string, e.g. 'vehicle left', 'rail' or 'bicycle through'
+    :param lane_graphs: dictionary of lane graphs by lane key
+    :param guideway_filter: function of a guideway returning boolean or None, see is_guideway_selected
+    :return: tuple of the lane key and the function of an origin lane, or (None, None) for an unknown component
+    """
+    lane_key = get_component_lane_key(component)
+    if lane_key is None:
+        return None, None
+
+    all_lanes = intersection_data[lane_key]
+    lane_graph = get_lane_graph(intersection_data, lane_key, lane_graphs)
+    if component == 'vehicle left':
+        function = partial(get_left_turn_guideways_from_origin,
+                           all_lanes=all_lanes,
+                           nodes_dict=intersection_data['nodes'],
+                           lane_graph=lane_graph,
+                           guideway_filter=guideway_filter
+                           )
+    elif component == 'vehicle u-turn':
+        function = partial(get_u_turn_guideways_from_origin,
+                           all_lanes=all_lanes,
+                           x_data=intersection_data,
+                           lane_graph=lane_graph,
+                           guideway_filter=guideway_filter
+                           )
+    elif component == 'bicycle left':
+        # Memoized through guideways are reused, otherwise only the needed ones are created
+        through_index = ThroughGuidewayIndex(all_lanes,
+                                             lane_graph,
+                                             through_guideways=get_guideway_cache(intersection_data).components.get(
+                                                 'bicycle through'
+                                             ))
+        function = partial(get_bicycle_left_turn_guideways_from_origin,
+                           all_lanes=all_lanes,
+                           nodes_dict=intersection_data['nodes'],
+                           through_index=through_index,
+                           lane_graph=lane_graph,
+                           guideway_filter=guideway_filter
+                           )
+    elif component in ('vehicle right', 'bicycle right'):
+        function = partial(get_right_turn_guideways_from_origin,
+                           all_lanes=all_lanes,
+                           lane_graph=lane_graph,
+                           guideway_filter=guideway_filter
+                           )
     else:
-        cut_guideway['median'] = cut_median[::-1]
-        cut_guideway['left_border'] = cut_left_border[::-1]
-        cut_guideway['right_border'] = cut_right_border[::-1]
+        function = partial(get_through_guideways_from_origin,
+                           all_lanes=all_lanes,
+                           lane_graph=lane_graph,
+                           guideway_filter=guideway_filter
+                           )
+    return lane_key, function
 
-    set_guideway_length(cut_guideway)
-    return cut_guideway
+
+def get_component_lane_key(component):
+    """
+    Get the key of the list of origin lanes of a guideway component
+    :param component: string, e.g. 'vehicle left', 'rail' or 'bicycle through'
+    :return: string, e.g. 'merged_lanes', or None for an unknown component
+    """
+    if component in ('vehicle left', 'vehicle right', 'vehicle through', 'vehicle u-turn'):
+        return 'merged_lanes'
+    if component == 'rail':
+        return 'merged_tracks'
+    if component in ('bicycle left', 'bicycle right', 'bicycle through'):
+        return 'merged_cycleways'
+    return None
+
+
+def get_lane_graph(intersection_data, lane_key, lane_graphs):
+    """
+    Get a lane graph for a list of lanes of the intersection.  The graph is built once and kept in lane_graphs.
+    :param intersection_data: dictionary
+    :param lane_key: string, e.g. 'merged_lanes' or 'merged_cycleways'
+    :param lane_graphs: dictionary of lane graphs by lane key
+    :return: LaneGraph
+    """
+    if lane_key not in lane_graphs:
+        lane_graphs[lane_key] = LaneGraph(intersection_data[lane_key])
+    return lane_graphs[lane_key]
@@ -7,20 +7,22 @@
 #######################################################################
 
 import osmnx as ox
-import copy
 from lane import get_lanes, merge_lanes, shorten_lanes, get_bicycle_lanes
 from meta import set_meta_data
 from matplotlib.patches import Polygon
 from path_way import add_borders_to_paths, split_bidirectional_paths, clean_paths, remove_zero_length_paths, \
     set_direction
 from node import get_nodes_dict, get_center, get_node_subset, get_intersection_nodes, \
-    add_nodes_to_dictionary, get_node_dict_subset_from_list_of_lanes, create_a_node_from_coordinates
+    add_nodes_to_dictionary, get_node_dict_subset_from_list_of_lanes, create_a_node_from_coordinates, \
+    get_node_id_allocator
 from street import select_close_nodes, repeat_street_split, get_list_of_streets
 from railway import split_railways, remove_subways
 from footway import get_crosswalks, get_simulated_crosswalks
 from correction import manual_correction, correct_paths
-from border import border_within_box, get_box, get_border_length, great_circle_vec_check_for_nan
-from data import get_box_from_xml, get_box_data
+from border import clip_border_to_box, get_box, get_border_length, great_circle_vec_check_for_nan, \
+    get_distances_to_point, get_local_projection, local_geometry
+from data import get_box_from_xml, get_box_data, copy_element
+from node_store import NodeOverlay, get_coordinates_array
 from log import get_logger, dictionary_to_log
 
 
@@ -101,7 +103,7 @@ def get_max_intersecting_node_distance(x_data):
     if len(nodes) > 1:
         x0 = x_data['center_x']
         y0 = x_data['center_y']
-        dist = [great_circle_vec_check_for_nan(y0, x0, x_data['nodes'][n]['y'], x_data['nodes'][n]['x']) for n in nodes]
+        dist = get_distances_to_point((x0, y0), get_coordinates_array(x_data['nodes'], nodes)).tolist()
         return sum(dist)/len(dist)
     else:
         return 0.0
@@ -120,8 +122,8 @@ def get_street_data(x_data, city_data):
                                       infrastructure='way["highway"]',
                                       network_type='drive'
                                       )
-    x_data['raw_data'] = copy.deepcopy(intersection_jsons)
-    intersection_paths = [e for e in intersection_jsons[0]['elements'] if e['type'] == 'way']
+    x_data['raw_data'] = intersection_jsons
+    intersection_paths = [copy_element(e) for e in intersection_jsons[0]['elements'] if e['type'] == 'way']
     add_nodes_to_dictionary([e for e in intersection_jsons[0]['elements'] if e['type'] == 'node'],
                             nodes_dict,
                             paths=intersection_paths
@@ -163,8 +165,8 @@ def get_railway_data(x_data, city_data):
     nodes_dict = city_data['nodes']
     railway_jsons = get_box_data(x_data, city_data['raw_data'], network_type='all', infrastructure='way["railway"]')
 
-    railway_paths = [e for e in railway_jsons[0]['elements'] if e['type'] == 'way']
-    x_data['railway_paths'] = copy.deepcopy(railway_paths)
+    x_data['railway_paths'] = [e for e in railway_jsons[0]['elements'] if e['type'] == 'way']
+    railway_paths = [copy_element(e) for e in x_data['railway_paths']]
     referenced_nodes = {}
     referenced_nodes = get_node_dict_subset_from_list_of_lanes(x_data['merged_lanes'], nodes_dict, referenced_nodes)
     split_railway_paths = split_railways(remove_subways(railway_paths), referenced_nodes)
@@ -193,13 +195,12 @@ def get_footway_data(x_data, city_data):
     nodes_dict = city_data['nodes']
     footway_jsons = get_box_data(x_data, city_data['raw_data'], network_type='all')
 
-    footway_paths = [e for e in footway_jsons[0]['elements']
-                     if e['type'] == 'way'
-                     and 'highway' in e['tags']
-                     and 'foot' in e['tags']['highway']
-                     ]
-
-    x_data['footway_paths'] = copy.deepcopy(footway_paths)
+    x_data['footway_paths'] = [e for e in footway_jsons[0]['elements']
+                               if e['type'] == 'way'
+                               and 'highway' in e['tags']
+                               and 'foot' in e['tags']['highway']
+                               ]
+    footway_paths = [copy_element(e) for e in x_data['footway_paths']]
 
     add_nodes_to_dictionary([e for e in footway_jsons[0]['elements'] if e['type'] == 'node'],
                             nodes_dict,
@@ -241,13 +242,15 @@ def get_public_transit_data(x_data, city_data):
     return public_transit_nodes
 
 
-def get_intersection_data(street_tuple, city_data, size=500.0, crop_radius=150.0):
+def get_intersection_data(street_tuple, city_data, size=500.0, crop_radius=150.0, geometry='geodetic'):
     """
     Get a dictionary with all data related to an intersection.
+    The city data is not modified, so intersections of the same city can be extracted concurrently.
     :param street_tuple: tuple of strings
     :param city_data: dictionary
     :param size: initial size of the surrounding area in meters
     :param crop_radius: the data will be cropped to the specified radius in meters
+    :param geometry: 'geodetic' to compute the geometry on the sphere or 'local' in the local tangent plane
     :return: dictionary
     """
 
@@ -259,53 +262,65 @@ def get_intersection_data(street_tuple, city_data, size=500.0, crop_radius=150.0
         logger.error('Invalid intersection %r, %r' % (', '.join(street_tuple), city_data['name']))
         return None
 
-    cleaned_intersection_paths, cropped_intersection, raw_data = get_street_data(intersection_data, city_data)
-
-    lanes = get_lanes(cleaned_intersection_paths, city_data['nodes'])
-    merged_lanes = merge_lanes(lanes, city_data['nodes'])
-
-    intersection_data['paths'] = cleaned_intersection_paths
-    intersection_data['lanes'] = lanes
-    intersection_data['merged_lanes'] = merged_lanes
-    intersection_data['cropped_intersection'] = cropped_intersection
-    intersection_data['railway'] = get_railway_data(intersection_data, city_data)
-    intersection_data['rail_tracks'] = get_lanes(intersection_data['railway'], city_data['nodes'], width=2.0)
-    intersection_data['merged_tracks'] = merge_lanes(intersection_data['rail_tracks'], city_data['nodes'])
-    intersection_data['nodes'] = get_node_dict_subset_from_list_of_lanes(intersection_data['rail_tracks'],
-                                                                         city_data['nodes'],
-                                                                         nodes_subset=intersection_data['nodes']
-                                                                         )
-    intersection_data['nodes'] = get_node_dict_subset_from_list_of_lanes(intersection_data['lanes'],
-                                                                         city_data['nodes'],
-                                                                         nodes_subset=intersection_data['nodes']
-                                                                         )
-    intersection_data['cycleway_lanes'] = get_bicycle_lanes(cleaned_intersection_paths, city_data['nodes'])
-    intersection_data['merged_cycleways'] = merge_lanes(intersection_data['cycleway_lanes'], city_data['nodes'])
-    intersection_data['footway'] = get_footway_data(intersection_data, city_data)
-
-    intersection_data['street_data'] = get_list_of_streets(intersection_data)
-    crosswalks = get_crosswalks(intersection_data['footway'], city_data['nodes'], width=1.8)
-    intersection_data['crosswalks'] = crosswalks + get_simulated_crosswalks(intersection_data['street_data'],
-                                                                            crosswalks,
-                                                                            width=1.8
-                                                                            )
-    intersection_data['public_transit_nodes'] = get_public_transit_data(intersection_data, city_data)
-
-    intersection_data['nodes'] = get_node_dict_subset_from_list_of_lanes(intersection_data['cycleway_lanes'],
-                                                                         city_data['nodes'],
-                                                                         nodes_subset=intersection_data['nodes']
-                                                                         )
-    intersection_data['nodes'] = get_node_dict_subset_from_list_of_lanes(intersection_data['footway'],
-                                                                         city_data['nodes'],
-                                                                         nodes_subset=intersection_data['nodes']
-                                                                         )
-
-    set_meta_data(intersection_data['merged_lanes']
-                  + intersection_data['merged_tracks']
-                  + intersection_data['merged_cycleways']
-                  + intersection_data['crosswalks'],
-                  intersection_data
-                  )
+    # The geometry is computed in the local tangent plane of the intersection if requested
+    intersection_data['projection'] = None
+    if geometry == 'local':
+        intersection_data['projection'] = get_local_projection(intersection_data['center_x'],
+                                                               intersection_data['center_y']
+                                                               )
+
+    with local_geometry(intersection_data['projection']):
+        # All nodes created or modified for the intersection go to an overlay, the city nodes are never modified
+        city_data = dict(city_data)
+        city_data['nodes'] = NodeOverlay(city_data['nodes'])
+
+        cleaned_intersection_paths, cropped_intersection, raw_data = get_street_data(intersection_data, city_data)
+
+        lanes = get_lanes(cleaned_intersection_paths, city_data['nodes'])
+        merged_lanes = merge_lanes(lanes, city_data['nodes'])
+
+        intersection_data['paths'] = cleaned_intersection_paths
+        intersection_data['lanes'] = lanes
+        intersection_data['merged_lanes'] = merged_lanes
+        intersection_data['cropped_intersection'] = cropped_intersection
+        intersection_data['railway'] = get_railway_data(intersection_data, city_data)
+        intersection_data['rail_tracks'] = get_lanes(intersection_data['railway'], city_data['nodes'], width=2.0)
+        intersection_data['merged_tracks'] = merge_lanes(intersection_data['rail_tracks'], city_data['nodes'])
+        intersection_data['nodes'] = get_node_dict_subset_from_list_of_lanes(intersection_data['rail_tracks'],
+                                                                             city_data['nodes'],
+                                                                             nodes_subset=intersection_data['nodes']
+                                                                             )
+        intersection_data['nodes'] = get_node_dict_subset_from_list_of_lanes(intersection_data['lanes'],
+                                                                             city_data['nodes'],
+                                                                             nodes_subset=intersection_data['nodes']
+                                                                             )
+        intersection_data['cycleway_lanes'] = get_bicycle_lanes(cleaned_intersection_paths, city_data['nodes'])
+        intersection_data['merged_cycleways'] = merge_lanes(intersection_data['cycleway_lanes'], city_data['nodes'])
+        intersection_data['footway'] = get_footway_data(intersection_data, city_data)
+
+        intersection_data['street_data'] = get_list_of_streets(intersection_data)
+        crosswalks = get_crosswalks(intersection_data['footway'], city_data['nodes'], width=1.8)
+        intersection_data['crosswalks'] = crosswalks + get_simulated_crosswalks(intersection_data['street_data'],
+                                                                                crosswalks,
+                                                                                width=1.8
+                                                                                )
+        intersection_data['public_transit_nodes'] = get_public_transit_data(intersection_data, city_data)
+
+        intersection_data['nodes'] = get_node_dict_subset_from_list_of_lanes(intersection_data['cycleway_lanes'],
+                                                                             city_data['nodes'],
+                                                                             nodes_subset=intersection_data['nodes']
+                                                                             )
+        intersection_data['nodes'] = get_node_dict_subset_from_list_of_lanes(intersection_data['footway'],
+                                                                             city_data['nodes'],
+                                                                             nodes_subset=intersection_data['nodes']
+                                                                             )
+
+        set_meta_data(intersection_data['merged_lanes']
+                      + intersection_data['merged_tracks']
+                      + intersection_data['merged_cycleways']
+                      + intersection_data['crosswalks'],
+                      intersection_data
+                      )
 
     logger.info('Intersection Created')
     return intersection_data
@@ -340,18 +355,16 @@ def crop_selection(selection, x0, y0, nodes_dict=None, radius=150.0):
 
 def smart_crop(elements, nodes_dict, x0, y0, radius):
 
+    box = get_box(x0, y0, size=radius)
     for e in elements:
         if e['type'] != 'node':
-            cropped_node_list = []
-            for n in e['nodes']:
-                dist = great_circle_vec_check_for_nan(y0, x0, nodes_dict[n]['y'], nodes_dict[n]['x'])
-                if dist <= radius:
-                    cropped_node_list.append(n)
+            dist = get_distances_to_point((x0, y0), get_coordinates_array(nodes_dict, e['nodes']))
+            cropped_node_list = [n for n, d in zip(e['nodes'], dist) if d <= radius]
             if 0 < len(cropped_node_list) < len(e['nodes']):
                 if 'left_border' in e:
-                    e['left_border'] = border_within_box(x0, y0, e['left_border'], radius)
+                    e['left_border'] = clip_border_to_box(e['left_border'], box)
                 if 'right_border' in e:
-                    e['right_border'] = border_within_box(x0, y0, e['right_border'], radius)
+                    e['right_border'] = clip_border_to_box(e['right_border'], box)
 
             e['nodes'] = cropped_node_list
 
@@ -367,67 +380,75 @@ def remove_elements_beyond_radius(elements, nodes_dict, x0, y0, radius):
     :return: list of remaining elements
     """
 
-    for e in elements:
-        if e['type'] != 'node':
+    # The clip box and the distances from the center to all nodes of all elements are computed once
+    box = get_box(x0, y0, size=radius)
+    paths = [e for e in elements if e['type'] != 'node']
+    node_ids = [n for e in paths for n in e['nodes']]
+    distances = get_distances_to_point((x0, y0), get_coordinates_array(nodes_dict, node_ids)).tolist()
+    start = 0
+    id_allocator = get_node_id_allocator(nodes_dict)
+
+    for e in paths:
+        e['cropped'] = 'no'
+
+        if 'left_border' in e:
+            e['length'] = get_border_length(e['left_border'])
+        else:
+            e['length'] = 0
 
-            e['cropped'] = 'no'
+        dist = distances[start:start + len(e['nodes'])]
+        start += len(e['nodes'])
+        cropped_node_list = [n for n, d in zip(e['nodes'], dist) if d <= radius]
 
+        if 0 < len(cropped_node_list) < len(e['nodes']):
+            e['cropped'] = 'yes'
             if 'left_border' in e:
+                e['left_border'] = clip_border_to_box(e['left_border'], box)
                 e['length'] = get_border_length(e['left_border'])
+            if 'right_border' in e:
+                e['right_border'] = clip_border_to_box(e['right_border'], box)
+            if 'median' in e:
+                e['median'] = clip_border_to_box(e['median'], box)
+
+            if len(e['left_border']) < 1 or len(e['right_border']) < 1:
+                e['nodes'] = []
+                logger.debug('Unable to obtain the portion of the path %d within radius. Skipping.' % e['id'])
+                continue
+
+            if 'name' in e['tags']:
+                street_name = set([e['tags']['name']])
             else:
-                e['length'] = 0
+                street_name = set(['no_name'])
 
-            cropped_node_list = []
-            for n in e['nodes']:
-                dist = great_circle_vec_check_for_nan(y0, x0, nodes_dict[n]['y'], nodes_dict[n]['x'])
-                if dist <= radius:
-                    cropped_node_list.append(n)
+            if 'tags' in e and 'split' in e['tags'] and e['tags']['split'] == 'no':
+                x = (e['left_border'][-1][0] + e['right_border'][-1][0]) / 2.0
+                y = (e['left_border'][-1][1] + e['right_border'][-1][1]) / 2.0
+            else:
+                x = e['left_border'][-1][0]
+                y = e['left_border'][-1][1]
+            yy = nodes_dict[cropped_node_list[-1]]['y']
+            xx = nodes_dict[cropped_node_list[-1]]['x']
+            if great_circle_vec_check_for_nan(yy, xx, y, x) > 5.0:
+                cropped_node_list.append(create_a_node_from_coordinates((x, y),
+                                                                         nodes_dict,
+                                                                         street_name,
+                                                                         id_allocator=id_allocator
+                                                                         )['osmid'])
+
+            if 'tags' in e and 'split' in e['tags'] and e['tags']['split'] == 'no':
+                x = (e['left_border'][0][0] + e['right_border'][0][0]) / 2.0
+                y = (e['left_border'][0][1] + e['right_border'][0][1]) / 2.0
+            else:
+                x = e['left_border'][0][0]
+                y = e['left_border'][0][1]
 
-            if 0 < len(cropped_node_list) < len(e['nodes']):
-                e['cropped'] = 'yes'
-                if 'left_border' in e:
-                    e['left_border'] = border_within_box(x0, y0, e['left_border'], radius)
-                    e['length'] = get_border_length(e['left_border'])
-                if 'right_border' in e:
-                    e['right_border'] = border_within_box(x0, y0, e['right_border'], radius)
-                if 'median' in e:
-                    e['median'] = border_within_box(x0, y0, e['median'], radius)
-
-                if len(e['left_border']) < 1 or len(e['right_border']) < 1:
-                    e['nodes'] = []
-                    logger.debug('Unable to obtain the portion of the path %d within radius. Skipping.' % e['id'])
-                    continue
-
-                if 'name' in e['tags']:
-                    street_name = set([e['tags']['name']])
-                else:
-                    street_name = set(['no_name'])
-
-                if 'tags' in e and 'split' in e['tags'] and e['tags']['split'] == 'no':
-                    x = (e['left_border'][-1][0] + e['right_border'][-1][0]) / 2.0
-                    y = (e['left_border'][-1][1] + e['right_border'][-1][1]) / 2.0
-                else:
-                    x = e['left_border'][-1][0]
-                    y = e['left_border'][-1][1]
-                yy = nodes_dict[cropped_node_list[-1]]['y']
-                xx = nodes_dict[cropped_node_list[-1]]['x']
-                if great_circle_vec_check_for_nan(yy, xx, y, x) > 5.0:
-                    cropped_node_list.append(create_a_node_from_coordinates((x,y), nodes_dict, street_name)['osmid'])
-
-                if 'tags' in e and 'split' in e['tags'] and e['tags']['split'] == 'no':
-                    x = (e['left_border'][0][0] + e['right_border'][0][0]) / 2.0
-                    y = (e['left_border'][0][1] + e['right_border'][0][1]) / 2.0
-                else:
-                    x = e['left_border'][0][0]
-                    y = e['left_border'][0][1]
-
-                yy = nodes_dict[cropped_node_list[0]]['y']
-                xx = nodes_dict[cropped_node_list[0]]['x']
-                if great_circle_vec_check_for_nan(yy, xx, y, x) > 5.0:
-                    new_node = create_a_node_from_coordinates((x, y), nodes_dict, street_name)
-                    cropped_node_list = [new_node['osmid']] + cropped_node_list
+            yy = nodes_dict[cropped_node_list[0]]['y']
+            xx = nodes_dict[cropped_node_list[0]]['x']
+            if great_circle_vec_check_for_nan(yy, xx, y, x) > 5.0:
+                new_node = create_a_node_from_coordinates((x, y), nodes_dict, street_name, id_allocator=id_allocator)
+                cropped_node_list = [new_node['osmid']] + cropped_node_list
 
-            e['nodes'] = cropped_node_list
+        e['nodes'] = cropped_node_list
 
     return [e for e in elements if e['type'] == 'node' or len(e['nodes']) > 0]
 
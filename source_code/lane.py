@@ -9,15 +9,19 @@
 #######################################################################
 
 
-import copy
 import math
+import numpy as np
 import shapely.geometry as geom
+from shapely.prepared import prep
+from shapely.strtree import STRtree
 from border import shift_list_of_nodes, get_incremental_points, extend_vector, \
     cut_border_by_polygon, set_lane_bearing, get_angle_between_bearings, extend_both_sides_of_a_border, \
-    get_border_length
+    get_border_length, get_lane_borders, get_compass_bearings
 from path_way import get_num_of_lanes, count_lanes, reverse_direction
 from bicycle import key_value_check, get_bicycle_lane_location, is_shared
 from log import get_logger, dictionary_to_log
+from node_store import get_node_coordinates
+from record import Lane
 
 
 logger = get_logger()
@@ -61,6 +65,59 @@ def add_space_for_crosswalk(lane_data, crosswalk_width=1.82):
         shift_list_of_nodes(right_border, [crosswalk_width]*len(right_border))
 
 
+class CrosswalkIndex(object):
+    """
+    Crosswalk clearance polygons of named lanes for one crosswalk width, see add_space_for_crosswalk.
+    The polygons are built once and kept in an STRtree with prepared geometries,
+    so that shortening a border only touches the polygons the border actually crosses.
+    The bearings of the last lane segments are calculated once as well.
+    """
+
+    def __init__(self, lanes, crosswalk_width):
+        """
+        :param lanes: list of dictionaries
+        :param crosswalk_width: float
+        """
+        self.crosswalk_width = crosswalk_width
+        self.lanes = [l for l in lanes if l['name'] != 'no_name']
+        self.polygons = []
+        for l in self.lanes:
+            lb, rb = add_space_for_crosswalk(l, crosswalk_width=crosswalk_width)
+            polygon = geom.Polygon(lb + rb[::-1])
+            if not polygon.is_valid:
+                polygon = polygon.buffer(0)
+            self.polygons.append(polygon)
+        self.prepared_polygons = [prep(p) for p in self.polygons]
+        self.positions = dict((id(p), i) for i, p in enumerate(self.polygons))
+        self.tree = STRtree(self.polygons) if self.polygons else None
+
+        last_segments = [l['median'][-2:] if 'median' in l else l['left_border'][-2:] for l in self.lanes]
+        self.bearings = get_compass_bearings(np.array([p[0] for p in last_segments], dtype=np.float64),
+                                             np.array([p[1] for p in last_segments], dtype=np.float64)
+                                             ) if last_segments else np.zeros(0)
+
+    def get_crossing_lanes(self, street_name, exclude_links=True):
+        """
+        Get positions of lanes with street names other than the given one
+        :param street_name: string
+        :param exclude_links: True if exclude links, False otherwise
+        :return: list of integers in the order of the input lanes
+        """
+        return [i for i, l in enumerate(self.lanes)
+                if l['name'] != street_name and not (exclude_links and 'link' in l['name'])
+                ]
+
+    def query(self, border):
+        """
+        Get positions of polygons whose envelopes intersect the border
+        :param border: list of coordinates
+        :return: set of integers
+        """
+        if self.tree is None:
+            return set()
+        return set(self.positions[id(p)] for p in self.tree.query(geom.LineString(border)))
+
+
 def shorten_lane_for_crosswalk(lane_data, lanes, crosswalk_width=1.82):
     """
     Remove the portion of the lane border overlapping with any crosswalk crossing the lane border.
@@ -240,7 +297,9 @@ def create_lane(p,
                 num_of_left_lanes=0,
                 num_of_right_lanes=0,
                 num_of_trunk_lanes=1,
-                crosswalk_width=1.82
+                crosswalk_width=1.82,
+                opposite_border=None,
+                median=None
                 ):
     """
     Create a lane from a path
@@ -259,13 +318,15 @@ def create_lane(p,
     :param num_of_right_lanes: 
     :param num_of_trunk_lanes: 
     :param crosswalk_width: 
+    :param opposite_border: precalculated right border if the left one is given, or left one if the right is given
+    :param median: precalculated median
     :return: 
     """
-    lane_data = {
+    lane_data = Lane({
         'lane_id': str(lane_id),
         'path_id': p['id'],
         'path': p,
-        'left_border': copy.deepcopy(left_border),
+        'left_border': copy_list(left_border),
         'lane_type': lane_type,
         'direction': direction,
         'width': width,
@@ -275,15 +336,17 @@ def create_lane(p,
         'num_of_right_lanes': num_of_right_lanes,
         'num_of_trunk_lanes': num_of_trunk_lanes,
         'crosswalk_width': crosswalk_width
-    }
+    }, shared_tags=p['tags'])
 
     if lane_type == 'cycleway':
         bicycle_lane_location = get_bicycle_lane_location(p)
         lane_data['bicycle_forward_location'] = bicycle_lane_location['bicycle_forward_location']
         lane_data['bicycle_backward_location'] = bicycle_lane_location['bicycle_backward_location']
 
+    # The path tags are shared by the lanes of the path.  Tags override only the values set above.
     for x in p['tags']:
-        lane_data[x] = p['tags'][x]
+        if x in lane_data.own_keys():
+            lane_data[x] = p['tags'][x]
 
     if lane_type == 'left':
         lane_data['lane_id'] = str(lane_id) + 'L'
@@ -299,16 +362,20 @@ def create_lane(p,
 
     lane_data['name'] = name
     lane_data['nodes'] = p['nodes']
-    lane_data['nodes_coordinates'] = [(nodes_dict[n]['x'], nodes_dict[n]['y']) for n in lane_data['nodes']]
+    lane_data['nodes_coordinates'] = get_node_coordinates(nodes_dict, lane_data['nodes'])
     lane_data['right_shaped_border'] = None
     lane_data['left_shaped_border'] = None
 
     if right_border is None:
-        lane_data['left_border'] = copy.deepcopy(left_border)
-        lane_data['right_border'] = shift_list_of_nodes(left_border, [width]*len(left_border))
+        lane_data['left_border'] = copy_list(left_border)
+        if opposite_border is None:
+            opposite_border = shift_list_of_nodes(left_border, [width]*len(left_border))
+        lane_data['right_border'] = opposite_border
     elif left_border is None:
-        lane_data['right_border'] = copy.deepcopy(right_border)
-        lane_data['left_border'] = shift_list_of_nodes(right_border, [-width]*len(right_border))
+        lane_data['right_border'] = copy_list(right_border)
+        if opposite_border is None:
+            opposite_border = shift_list_of_nodes(right_border, [-width]*len(right_border))
+        lane_data['left_border'] = opposite_border
 
         if 'L' in lane_data['lane_id']:
             right_border_with_inserted_points = add_incremental_points(right_border, n=shape_points, l=shape_length)
@@ -316,32 +383,37 @@ def create_lane(p,
             shaped_widths = get_shaped_lane_width(-width, n=shape_points)
             width_list = shaped_widths[:delta_len] + [-width]*len(right_border)
             if lane_data['lane_id'] == '1L':
-                lane_data['right_shaped_border'] = copy.deepcopy(lane_data['right_border'])
+                lane_data['right_shaped_border'] = copy_list(lane_data['right_border'])
                 lane_data['left_shaped_border'] = shift_list_of_nodes(right_border_with_inserted_points, width_list)
             elif right_shaped_border is not None:
-                lane_data['right_shaped_border'] = copy.deepcopy(right_shaped_border)
+                lane_data['right_shaped_border'] = copy_list(right_shaped_border)
                 lane_data['left_shaped_border'] = shift_list_of_nodes(right_shaped_border, width_list,
                                                                       direction_reference=lane_data['right_border']
                                                                       )
     else:
-        lane_data['right_border'] = copy.deepcopy(right_border)
-        lane_data['left_border'] = copy.deepcopy(left_border)
+        lane_data['right_border'] = copy_list(right_border)
+        lane_data['left_border'] = copy_list(left_border)
 
     if 'L' not in lane_data['lane_id']:
         lane_data['right_shaped_border'] = None
         lane_data['left_shaped_border'] = None
 
-    lane_data['median'] = shift_list_of_nodes(lane_data['left_border'], [width/2.0]*len(lane_data['left_border']))
+    if median is None:
+        median = shift_list_of_nodes(lane_data['left_border'], [width/2.0]*len(lane_data['left_border']))
+    lane_data['median'] = median
     lane_data['length'] = get_border_length(lane_data['median'])
     insert_referenced_nodes(lane_data, nodes_dict)
     return lane_data
 
 
-def add_lane(lane_data, merged_lane=None):
+def add_lane(lane_data, merged_lane=None, update_length=True):
     """
-    Add lane to a merged lane
+    Add lane to a merged lane.
+    The merged lane owns its lists of nodes and coordinates and extends them in place,
+    so adding a chain of lanes takes time proportional to the total number of points.
     :param lane_data: lane dictionary
     :param merged_lane: lane dictionary
+    :param update_length: True if recalculate the length of the merged lane, False if the caller does it once
     :return: merged lane dictionary
     """
     if 'split' in lane_data:
@@ -350,67 +422,81 @@ def add_lane(lane_data, merged_lane=None):
         split = 'no'
 
     if merged_lane is None:
-        merged_lane = {
+        merged_lane = Lane({
             'width': [lane_data['width']],
             'path_id': [lane_data['path_id']],
-            'path': [copy.deepcopy(lane_data['path'])],
-            'nodes': copy.deepcopy(lane_data['nodes']),
-            'left_border': copy.deepcopy(lane_data['left_border']),
-            'median': copy.deepcopy(lane_data['median']),
-            'right_border': copy.deepcopy(lane_data['right_border']),
-            'nodes_coordinates': copy.deepcopy(lane_data['nodes_coordinates']),
-            'right_shaped_border': copy.deepcopy(lane_data['right_shaped_border']),
-            'left_shaped_border': copy.deepcopy(lane_data['left_shaped_border']),
-            'shape_points': copy.deepcopy(lane_data['shape_points']),
-            'shape_length': copy.deepcopy(lane_data['shape_length']),
+            'path': [lane_data['path']],
+            'nodes': list(lane_data['nodes']),
+            'left_border': list(lane_data['left_border']),
+            'median': list(lane_data['median']),
+            'right_border': list(lane_data['right_border']),
+            'nodes_coordinates': list(lane_data['nodes_coordinates']),
+            'right_shaped_border': copy_list(lane_data['right_shaped_border']),
+            'left_shaped_border': copy_list(lane_data['left_shaped_border']),
+            'shape_points': lane_data['shape_points'],
+            'shape_length': lane_data['shape_length'],
             'split': [split],
-        }
+        })
     else:
 
         split_transition = merged_lane['split'][-1] + '2' + split
         # split_transition options: yes2no, no2yes, yes2yes, no2no
         for k in ['left_border', 'right_border', 'median']:
-            if split_transition == 'yes2no':
-                merged_lane[k] = merged_lane[k][:-1] + lane_data[k][1:]
-            elif split_transition == 'no2yes':
-                merged_lane[k] = merged_lane[k][:-1] + lane_data[k][1:]
-            else:
-                merged_lane[k] += lane_data[k][1:]
+            if split_transition == 'yes2no' or split_transition == 'no2yes':
+                del merged_lane[k][-1:]
+            merged_lane[k].extend(lane_data[k][1:])
         for k in ['nodes', 'nodes_coordinates']:
-            merged_lane[k] += lane_data[k][1:]
+            merged_lane[k].extend(lane_data[k][1:])
 
-        merged_lane['split'] += [split]
+        merged_lane['split'].append(split)
 
         for k in ['width', 'path_id', 'path']:
-            merged_lane[k] += [lane_data[k]]
+            merged_lane[k].append(lane_data[k])
 
         if merged_lane['right_shaped_border'] is not None:
-            merged_lane['right_shaped_border'] += lane_data['right_border']
+            merged_lane['right_shaped_border'].extend(lane_data['right_border'])
         if merged_lane['left_shaped_border'] is not None:
-            merged_lane['left_shaped_border'] += lane_data['left_border']
-
-    for k in lane_data:
-        if k not in ['width',
-                     'path_id',
-                     'path',
-                     'nodes',
-                     'left_border',
-                     'right_border',
-                     'median',
-                     'nodes_coordinates',
-                     'right_shaped_border',
-                     'left_shaped_border',
-                     'shape_length',
-                     'shape_points',
-                     'split']:
+            merged_lane['left_shaped_border'].extend(lane_data['left_border'])
+
+    merged_keys = ['width',
+                   'path_id',
+                   'path',
+                   'nodes',
+                   'left_border',
+                   'right_border',
+                   'median',
+                   'nodes_coordinates',
+                   'right_shaped_border',
+                   'left_shaped_border',
+                   'shape_length',
+                   'shape_points',
+                   'split']
+    # The merged lane refers to the tags of the last added lane instead of copying them
+    merged_lane.replace_shared_tags(lane_data.shared_tags, exclude=merged_keys)
+    for k in lane_data.own_keys():
+        if k not in merged_keys:
             merged_lane[k] = lane_data[k]
 
+    if update_length:
         merged_lane['length'] = get_border_length(merged_lane['median'])
 
     return merged_lane
 
 
-def get_next_right_lane(lane, lanes):
+def copy_list(x):
+    """
+    Shallow copy of a list of nodes or coordinates
+    :param x: list or None
+    :return: list or None
+    """
+    if x is None:
+        return None
+    return list(x)
+
+
+def get_next_right_lane(lane, lanes, lane_graph=None):
+    if lane_graph is not None:
+        return lane_graph.get_next_right_lane(lane)
     next_lanes = [l for l in lanes
                   if l['name'] == lane['name']
                   and l['direction'] == lane['direction']
@@ -422,15 +508,16 @@ def get_next_right_lane(lane, lanes):
     return None
 
 
-def reshape_lane(lane_data, lanes):
+def reshape_lane(lane_data, lanes, lane_graph=None):
     """
     Reapply starting shapes to a lane
     :param lane_data: dictionary
     :param lanes: list of dictionaries
+    :param lane_graph: LaneGraph of the lanes or None
     :return: None
     """
     if 'L' in lane_data['lane_id'] and '1L' not in lane_data['lane_id']:
-        next_to_right = get_next_right_lane(lane_data, lanes)
+        next_to_right = get_next_right_lane(lane_data, lanes, lane_graph=lane_graph)
 
         if next_to_right is not None and 'prev' in next_to_right and next_to_right['prev'] is not None:
 
@@ -442,7 +529,7 @@ def reshape_lane(lane_data, lanes):
             shaped_widths = get_shaped_lane_width(-lane_data['width'], n=lane_data['shape_points'])
             width_list = shaped_widths[:delta_len] + [-lane_data['width']] * len(lane_data['right_border'])
             lane_data['left_shaped_border'] = shift_list_of_nodes(right_border_with_inserted_points, width_list)
-            lane_data['right_shaped_border'] = copy.deepcopy(lane_data['right_border'])
+            lane_data['right_shaped_border'] = copy_list(lane_data['right_border'])
 
 
 def reshape_lanes(lanes):
@@ -451,8 +538,9 @@ def reshape_lanes(lanes):
     :param lanes: list of dictionaries
     :return: None
     """
+    lane_graph = LaneGraph(lanes)
     for lane_data in lanes:
-        reshape_lane(lane_data, lanes)
+        reshape_lane(lane_data, lanes, lane_graph=lane_graph)
 
 
 def extend_origin_left_border(lane_data, all_lanes):
@@ -498,6 +586,190 @@ def intersects(origin_lane, destination_lane, all_lanes):
         return False
 
 
+class LaneGraph(object):
+    """
+    Topology of the lanes of an intersection built once and shared by the turn modules.
+    Destination lookups take a hash map query instead of a scan over all lanes:
+    the nodes of each street, exit lanes by index from left and right, by street and by first node,
+    and link lanes by their first node.  Lane indices are calculated on demand and cached.
+    All lists keep the order of the input lanes, so the lookups return the same lanes as the scans.
+    """
+
+    def __init__(self, lanes):
+        """
+        :param lanes: list of dictionaries
+        """
+        self.lanes = lanes
+        self.positions = dict((id(l), i) for i, l in enumerate(lanes))
+        self.index_from_left = {}
+        self.index_from_right = {}
+        self.street_nodes = {}
+        self.exit_lanes = []
+        self.exit_lanes_by_name = {}
+        self.exit_lanes_by_first_node = {}
+        self.exit_lanes_by_node = {}
+        self.links_by_first_node = None
+        self.lanes_by_name_and_direction = {}
+        self.exit_lanes_by_index_from_left = None
+        self.exit_lanes_by_index_from_right = None
+        self.crosswalk_indexes = {}
+
+        for l in lanes:
+            self.street_nodes.setdefault(l['name'], set()).update(l['nodes'])
+            self.lanes_by_name_and_direction.setdefault((l['name'], l['direction']), []).append(l)
+            if l['direction'] == 'from_intersection':
+                self.exit_lanes.append(l)
+                self.exit_lanes_by_name.setdefault(l['name'], []).append(l)
+                if l['nodes']:
+                    self.exit_lanes_by_first_node.setdefault(l['nodes'][0], []).append(l)
+                for n in set(l['nodes']):
+                    self.exit_lanes_by_node.setdefault(n, []).append(l)
+
+    def get_index_from_left(self, lane_data):
+        """
+        Cached lane index from the most left lane, see get_lane_index_from_left
+        :param lane_data: dictionary
+        :return: number
+        """
+        return self.get_cached_index(lane_data, self.index_from_left, get_lane_index_from_left)
+
+    def get_index_from_right(self, lane_data):
+        """
+        Cached lane index from the most right lane, see get_lane_index_from_right
+        :param lane_data: dictionary
+        :return: number
+        """
+        return self.get_cached_index(lane_data, self.index_from_right, get_lane_index_from_right)
+
+    def get_cached_index(self, lane_data, cache, func):
+        """
+        Cache a lane index for the lanes of the graph.  Other lanes are calculated on every call.
+        """
+        if id(lane_data) not in self.positions:
+            return func(lane_data)
+        if id(lane_data) not in cache:
+            cache[id(lane_data)] = func(lane_data)
+        return cache[id(lane_data)]
+
+    def get_exit_lanes_by_index_from_left(self, index):
+        """
+        Get lanes going from the intersection with the given index from left
+        :param index: number
+        :return: list of dictionaries
+        """
+        if self.exit_lanes_by_index_from_left is None:
+            self.exit_lanes_by_index_from_left = {}
+            for l in self.exit_lanes:
+                self.exit_lanes_by_index_from_left.setdefault(self.get_index_from_left(l), []).append(l)
+        return self.exit_lanes_by_index_from_left.get(index, [])
+
+    def get_exit_lanes_by_index_from_right(self, index):
+        """
+        Get lanes going from the intersection with the given index from right
+        :param index: number
+        :return: list of dictionaries
+        """
+        if self.exit_lanes_by_index_from_right is None:
+            self.exit_lanes_by_index_from_right = {}
+            for l in self.exit_lanes:
+                self.exit_lanes_by_index_from_right.setdefault(self.get_index_from_right(l), []).append(l)
+        return self.exit_lanes_by_index_from_right.get(index, [])
+
+    def get_opposite_lanes(self, lane_data):
+        """
+        Get the most left lanes of the same street going from the intersection
+        :param lane_data: dictionary
+        :return: list of dictionaries
+        """
+        return [l for l in self.exit_lanes_by_name.get(lane_data['name'], []) if self.get_index_from_left(l) == 0]
+
+    def intersects(self, origin_lane, destination_lane):
+        """
+        Check if the destination lane has a common node with any lane of the origin street, see intersects
+        :param origin_lane: dictionary
+        :param destination_lane: dictionary
+        :return: True if there is a common node, False otherwise
+        """
+        origin_nodes = self.street_nodes.get(origin_lane['name'])
+        return origin_nodes is not None and not origin_nodes.isdisjoint(destination_lane['nodes'])
+
+    def get_connected_links(self, origin_lane):
+        """
+        Get link lanes starting at any node of the origin lane in the order of the lanes
+        :param origin_lane: dictionary
+        :return: list of dictionaries
+        """
+        if self.links_by_first_node is None:
+            self.links_by_first_node = {}
+            for l in self.lanes:
+                if is_link_lane(l):
+                    self.links_by_first_node.setdefault(l['nodes'][0], []).append(l)
+
+        links = {}
+        for n in set(origin_lane['nodes']):
+            for l in self.links_by_first_node.get(n, []):
+                links[id(l)] = l
+        return sorted(links.values(), key=lambda l: self.positions[id(l)])
+
+    def get_exit_lanes_starting_at_node(self, node):
+        """
+        Get lanes going from the intersection with the first node at the given node in the order of the lanes
+        :param node: node id
+        :return: list of dictionaries
+        """
+        return self.exit_lanes_by_first_node.get(node, [])
+
+    def get_exit_lanes_by_name(self, name):
+        """
+        Get lanes of a street going from the intersection in the order of the lanes
+        :param name: string
+        :return: list of dictionaries
+        """
+        return self.exit_lanes_by_name.get(name, [])
+
+    def get_exit_lanes_through_node(self, node):
+        """
+        Get lanes going from the intersection through the node in the order of the lanes
+        :param node: node id
+        :return: list of dictionaries
+        """
+        return self.exit_lanes_by_node.get(node, [])
+
+    def get_next_right_lane(self, lane_data):
+        """
+        Get the lane next to the right of the given one, see get_next_right_lane
+        :param lane_data: dictionary
+        :return: dictionary or None
+        """
+        for l in self.lanes_by_name_and_direction.get((lane_data['name'], lane_data['direction']), []):
+            if lane_data['nodes'][0] in l['nodes'][:-1] \
+                    and self.get_index_from_left(lane_data) + 1 == self.get_index_from_left(l):
+                return l
+        return None
+
+    def get_crosswalk_index(self, crosswalk_width):
+        """
+        Get crosswalk clearance polygons of the lanes for a crosswalk width.  The index is built on the first use.
+        :param crosswalk_width: float
+        :return: CrosswalkIndex
+        """
+        if crosswalk_width not in self.crosswalk_indexes:
+            self.crosswalk_indexes[crosswalk_width] = CrosswalkIndex(self.lanes, crosswalk_width)
+        return self.crosswalk_indexes[crosswalk_width]
+
+
+def is_link_lane(lane_data):
+    """
+    Check if the lane belongs to a trunk link
+    :param lane_data: dictionary
+    :return: True if link, False otherwise
+    """
+    return 'walk' not in lane_data['lane_type'] \
+        and 'rail' not in lane_data['lane_type'] \
+        and 'highway' in lane_data['path'][0]['tags'] \
+        and 'link' in lane_data['path'][0]['tags']['highway']
+
+
 def get_lanes(paths, nodes_dict, shape_points=16, shape_length=10.0, width=3.08):
     lanes = []
     for p in paths:
@@ -727,13 +999,21 @@ def get_lanes_from_path(path_data, nodes_dict, shape_points=16, shape_length=10.
     num_of_left_lanes, num_of_right_lanes, num_of_trunk_lanes = count_lanes(path_data)
     bicycle_lane_location = get_bicycle_lane_location(path_data)
 
+    # Borders and medians of the lanes to the right of the left path border: trunk lanes,
+    # space for a bike lane and right turn lanes, all calculated at once
+    space_for_bike_lane = get_bicycle_lane_width(bicycle_lane_location, 'right', bicycle_lane_width=bicycle_lane_width)
+    widths = [width] * num_of_trunk_lanes
+    if space_for_bike_lane > 0.0:
+        widths.append(space_for_bike_lane)
+    widths.extend([width] * num_of_right_lanes)
+    borders, medians = get_lane_borders(copy_list(path_data['left_border']), widths)
+
     # Construct trunk lanes
-    left_border = copy.deepcopy(path_data['left_border'])
-    for i in range(num_of_trunk_lanes, 0, -1):
+    for k, i in enumerate(range(num_of_trunk_lanes, 0, -1)):
         lane_type = lane_types[i + num_of_right_lanes - 1]
         lane_data = create_lane(path_data,
                                 nodes_dict,
-                                left_border=left_border,
+                                left_border=borders[k],
                                 lane_id=str(i),
                                 lane_type=lane_type,
                                 direction=path_data['tags']['direction'],
@@ -741,32 +1021,18 @@ def get_lanes_from_path(path_data, nodes_dict, shape_points=16, shape_length=10.
                                 num_of_left_lanes=num_of_left_lanes,
                                 num_of_right_lanes=num_of_right_lanes,
                                 num_of_trunk_lanes=num_of_trunk_lanes,
-                                width=width
+                                width=width,
+                                opposite_border=borders[k + 1],
+                                median=medians[k]
                                 )
         lanes.append(lane_data)
-        left_border = lane_data['right_border']
-
-    space_for_bike_lane = get_bicycle_lane_width(bicycle_lane_location, 'right', bicycle_lane_width=bicycle_lane_width)
-    if space_for_bike_lane > 0.0:
-        space = create_lane(path_data,
-                            nodes_dict,
-                            left_border=left_border,
-                            lane_id='1B',
-                            lane_type='cycleway',
-                            direction=path_data['tags']['direction'],
-                            shape_points=shape_points, shape_length=shape_length,
-                            num_of_left_lanes=num_of_left_lanes,
-                            num_of_right_lanes=num_of_right_lanes,
-                            num_of_trunk_lanes=num_of_trunk_lanes,
-                            width=space_for_bike_lane
-                            )
-        left_border = space['right_border']
 
     # Construct right turn lanes
-    for i in range(num_of_right_lanes, 0, -1):
+    first = len(widths) - num_of_right_lanes
+    for k, i in enumerate(range(num_of_right_lanes, 0, -1), first):
         lane_data = create_lane(path_data,
                                 nodes_dict,
-                                left_border=left_border,
+                                left_border=borders[k],
                                 lane_id=str(i),
                                 lane_type='right',
                                 direction=path_data['tags']['direction'],
@@ -774,15 +1040,22 @@ def get_lanes_from_path(path_data, nodes_dict, shape_points=16, shape_length=10.
                                 num_of_left_lanes=num_of_left_lanes,
                                 num_of_right_lanes=num_of_right_lanes,
                                 num_of_trunk_lanes=num_of_trunk_lanes,
-                                width=width
+                                width=width,
+                                opposite_border=borders[k + 1],
+                                median=medians[k]
                                 )
         lanes.append(lane_data)
-        left_border = lane_data['right_border']
 
-    right_border = copy.deepcopy(path_data['left_border'])
+    # Borders and medians of the lanes to the left of the left path border
+    right_border = copy_list(path_data['left_border'])
     right_shaped_border = right_border
 
     space_for_bike_lane = get_bicycle_lane_width(bicycle_lane_location, 'left', bicycle_lane_width=bicycle_lane_width)
+    widths = [-width] * num_of_left_lanes
+    if space_for_bike_lane > 0.0:
+        widths.insert(0, -space_for_bike_lane)
+    borders, medians = get_lane_borders(right_border, widths, median_from_far_border=True)
+
     if space_for_bike_lane > 0.0:
         space = create_lane(path_data,
                             nodes_dict,
@@ -795,13 +1068,16 @@ def get_lanes_from_path(path_data, nodes_dict, shape_points=16, shape_length=10.
                             num_of_left_lanes=num_of_left_lanes,
                             num_of_right_lanes=num_of_right_lanes,
                             num_of_trunk_lanes=num_of_trunk_lanes,
-                            width=space_for_bike_lane
+                            width=space_for_bike_lane,
+                            opposite_border=borders[1],
+                            median=medians[0]
                             )
         right_border = space['left_border']
         right_shaped_border = space['left_shaped_border']
 
     # Construct left turn lanes
-    for i in range(num_of_left_lanes):
+    first = len(widths) - num_of_left_lanes
+    for k, i in enumerate(range(num_of_left_lanes), first):
         lane_data = create_lane(path_data,
                                 nodes_dict,
                                 right_border=right_border,
@@ -813,7 +1089,9 @@ def get_lanes_from_path(path_data, nodes_dict, shape_points=16, shape_length=10.
                                 num_of_left_lanes=num_of_left_lanes,
                                 num_of_right_lanes=num_of_right_lanes,
                                 num_of_trunk_lanes=num_of_trunk_lanes,
-                                width=width
+                                width=width,
+                                opposite_border=borders[k + 1],
+                                median=medians[k]
                                 )
         lanes.append(lane_data)
         right_border = lane_data['left_border']
@@ -822,6 +1100,33 @@ def get_lanes_from_path(path_data, nodes_dict, shape_points=16, shape_length=10.
     return lanes
 
 
+def set_next_and_prev_lanes(similar_lanes):
+    """
+    Set path ids of the next and previous lanes within a group of lanes with the same name, lane id and direction.
+    The next lane starts at the last node of the lane and the previous lane ends at its first node,
+    both with a bearing within 60 degrees.  Candidates are looked up in hash maps of the first and last nodes
+    and the earliest candidate in the group is taken.
+    :param similar_lanes: list of dictionaries
+    :return: None
+    """
+    by_first_node = {}
+    by_last_node = {}
+    for l in similar_lanes:
+        by_first_node.setdefault(l['nodes'][0], []).append(l)
+        by_last_node.setdefault(l['nodes'][-1], []).append(l)
+
+    for similar_lane in similar_lanes:
+        bearing = similar_lane['path']['bearing']
+        for k, candidates in [('next', by_first_node.get(similar_lane['nodes'][-1], [])),
+                              ('prev', by_last_node.get(similar_lane['nodes'][0], []))]:
+            similar_lane[k] = None
+            for l in candidates:
+                if abs(get_angle_between_bearings(l['path']['bearing'], bearing)) < 60.0:
+                    if l['path_id'] != similar_lane['path_id']:
+                        similar_lane[k] = l['path_id']
+                    break
+
+
 def merge_lanes(lanes, nodes_dict):
     """
     Merge lanes for same street, direction, lane id
@@ -846,60 +1151,31 @@ def merge_lanes(lanes, nodes_dict):
 
     merged_lanes = []
     set_ids(lanes)
-    for lane in [l for l in lanes if l['name'] == 'no_name']:
-        merged_lanes.append(add_lane(lane, merged_lane=None))
-
-    names = sorted(set([l['name'] for l in lanes if l['name'] != 'no_name']))
-
-    for name in names:
-        ids = sorted(set([l['lane_id'] for l in lanes if l['name'] == name]))
-
-        for lane_id in ids:
-            directions = sorted(set([l['direction'] for l in lanes if l['lane_id'] == lane_id and l['name'] == name]))
-
-            for direction in directions:
-                similar_lanes = [l for l in lanes
-                                 if l['lane_id'] == lane_id
-                                 and l['name'] == name
-                                 and l['direction'] == direction
-                                 and len(l['nodes']) > 0
-                                 ]
-
-                for similar_lane in similar_lanes:
-                    bearing = similar_lane['path']['bearing']
-                    next_lanes = [l for l in similar_lanes
-                                  if similar_lane['nodes'][-1] == l['nodes'][0]
-                                  and abs(get_angle_between_bearings(l['path']['bearing'], bearing)) < 60.0
-                                  ]
-                    if len(next_lanes) == 0:
-                        similar_lane['next'] = None
-                    else:
-                        if next_lanes[0]['path_id'] != similar_lane['path_id']:
-                            similar_lane['next'] = next_lanes[0]['path_id']
-                        else:
-                            similar_lane['next'] = None
-
-                    prev_lanes = [l for l in similar_lanes
-                                  if similar_lane['nodes'][0] == l['nodes'][-1]
-                                  and abs(get_angle_between_bearings(l['path']['bearing'], bearing)) < 60.0
-                                  ]
-                    if len(prev_lanes) == 0:
-                        similar_lane['prev'] = None
-                    else:
-                        if prev_lanes[0]['path_id'] != similar_lane['path_id']:
-                            similar_lane['prev'] = prev_lanes[0]['path_id']
-                        else:
-                            similar_lane['prev'] = None
-
-                for start_lane in [l for l in similar_lanes if l['prev'] is None]:
-                    merged_lane = add_lane(start_lane, merged_lane=None)
-                    nxt = start_lane['next']
-                    while nxt is not None:
-                        next_lane = [l for l in similar_lanes if l['path_id'] == nxt][0]
-                        merged_lane = add_lane(next_lane, merged_lane=merged_lane)
-                        nxt = next_lane['next']
-
-                    merged_lanes.append(merged_lane)
+    groups = {}
+    for lane in lanes:
+        if lane['name'] == 'no_name':
+            merged_lanes.append(add_lane(lane, merged_lane=None))
+        elif len(lane['nodes']) > 0:
+            groups.setdefault((lane['name'], lane['lane_id'], lane['direction']), []).append(lane)
+
+    for key in sorted(groups):
+        similar_lanes = groups[key]
+        set_next_and_prev_lanes(similar_lanes)
+
+        by_path_id = {}
+        for l in similar_lanes:
+            by_path_id.setdefault(l['path_id'], l)
+
+        for start_lane in [l for l in similar_lanes if l['prev'] is None]:
+            merged_lane = add_lane(start_lane, merged_lane=None, update_length=False)
+            nxt = start_lane['next']
+            while nxt is not None:
+                next_lane = by_path_id[nxt]
+                merged_lane = add_lane(next_lane, merged_lane=merged_lane, update_length=False)
+                nxt = next_lane['next']
+
+            merged_lane['length'] = get_border_length(merged_lane['median'])
+            merged_lanes.append(merged_lane)
 
     set_lane_bearing(merged_lanes)
     add_node_tags_to_lanes(merged_lanes, nodes_dict)
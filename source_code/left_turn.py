@@ -6,7 +6,7 @@
 #
 #######################################################################
 
-from lane import get_lane_index_from_left, intersects, get_turn_type, is_lane_crossing_another_street
+from lane import get_lane_index_from_left, get_turn_type, is_lane_crossing_another_street, LaneGraph
 
 
 def is_left_turn_allowed(lane_data):
@@ -31,7 +31,7 @@ def is_left_turn_allowed(lane_data):
     return False
 
 
-def get_destination_lanes_for_left_turn(origin_lane, all_lanes, nodes_dict):
+def get_destination_lanes_for_left_turn(origin_lane, all_lanes, nodes_dict, lane_graph=None):
     """
     Identifying destination lanes (possibly more than one).
     Assuming that the origin and destination lanes must have the same lane index from left,
@@ -41,6 +41,7 @@ def get_destination_lanes_for_left_turn(origin_lane, all_lanes, nodes_dict):
     :param origin_lane: lane dictionary of a left turn
     :param all_lanes: list of dictionaries
     :param nodes_dict: dictionary
+    :param lane_graph: LaneGraph of all lanes or None
     :return: list of valid lane destinations for the left turn
     """
 
@@ -48,26 +49,25 @@ def get_destination_lanes_for_left_turn(origin_lane, all_lanes, nodes_dict):
         return []
     if not is_left_turn_allowed(origin_lane):
         return []
+    if lane_graph is None:
+        lane_graph = LaneGraph(all_lanes)
 
     if origin_lane['lane_type'] == 'cycleway':
-        return [l for l in all_lanes
+        return [l for l in lane_graph.exit_lanes
                 if l['name'] != origin_lane['name']
                 and l['name'] != 'no_name'
-                and l['direction'] == 'from_intersection'
-                and intersects(origin_lane, l, all_lanes)
+                and lane_graph.intersects(origin_lane, l)
                 and get_turn_type(origin_lane, l) == 'left_turn'
                 and is_lane_crossing_another_street(origin_lane, l['name'], nodes_dict)
                 and 'link' not in l['name']
                 ]
 
-    destination_index = get_lane_index_from_left(origin_lane)
+    destination_index = lane_graph.get_index_from_left(origin_lane)
 
-    return [l for l in all_lanes
+    return [l for l in lane_graph.get_exit_lanes_by_index_from_left(destination_index)
             if l['name'] != origin_lane['name']
             and l['name'] != 'no_name'
-            and l['direction'] == 'from_intersection'
-            and destination_index == get_lane_index_from_left(l)
-            and intersects(origin_lane, l, all_lanes)
+            and lane_graph.intersects(origin_lane, l)
             and get_turn_type(origin_lane, l) == 'left_turn'
             and 'link' not in l['name']
             #and is_lane_crossing_another_street(origin_lane, l['name'], nodes_dict)
@@ -10,13 +10,14 @@
 import datetime
 from right_turn import get_connected_links
 from bicycle import key_value_check, get_bicycle_lane_location, is_shared
-from lane import set_ids, get_link_from_and_to, is_opposite_lane_exist
+from lane import set_ids, get_link_from_and_to, is_opposite_lane_exist, LaneGraph
 from public_transit import get_public_transit_stop
 from border import get_border_length
 from path_way import get_num_of_lanes
-from border import get_angle_between_bearings, get_border_curvature, great_circle_vec_check_for_nan
+from border import get_angle_between_bearings, get_border_curvature, get_distances_to_point
+from node_store import get_coordinates_array
 from log import get_logger
-from guideway import get_crosswalk_to_crosswalk_distance_along_guideway, get_through_guideways
+from guideway import get_crosswalk_to_crosswalk_distance_along_guideway, get_guideway_component
 
 logger = get_logger()
 meta_keys = ['diameter',
@@ -65,9 +66,15 @@ def set_meta_data(lanes, intersection_data, max_distance=20.0):
     """
 
     set_ids(lanes)
+    lane_graph = LaneGraph(lanes)
     for lane_data in lanes:
         try:
-            lane_data['meta_data'] = get_lane_meta_data(lane_data, lanes, intersection_data, max_distance=max_distance)
+            lane_data['meta_data'] = get_lane_meta_data(lane_data,
+                                                        lanes,
+                                                        intersection_data,
+                                                        max_distance=max_distance,
+                                                        lane_graph=lane_graph
+                                                        )
         except Exception as e:
             lane_data['meta_data'] = 'Exception in the log'
             logger.exception('Lane meta data exception: %r' % e)
@@ -309,13 +316,14 @@ def get_intersection_meta_data(intersection_data):
     return meta_data
 
 
-def get_lane_meta_data(lane_data, all_lanes, intersection_data, max_distance=20.0):
+def get_lane_meta_data(lane_data, all_lanes, intersection_data, max_distance=20.0, lane_graph=None):
     """
     Create meta data dictionary for a lane (i.e. approach or exit)
     :param lane_data: dictionary of all lanes related to the intersection
     :param all_lanes: list of all lanes related to the intersection
     :param max_distance: max distance in meters for a transit stop to belong to a lane
     :param intersection_data: intersection data dictionary
+    :param lane_graph: LaneGraph of all lanes or None
     :return: dictionary
     """
 
@@ -350,7 +358,7 @@ def get_lane_meta_data(lane_data, all_lanes, intersection_data, max_distance=20.
     else:
         meta_data['id'] = None
 
-    if len(get_connected_links(lane_data, all_lanes)) > 0:
+    if len(get_connected_links(lane_data, all_lanes, lane_graph=lane_graph)) > 0:
         meta_data['right_turn_dedicated_link'] = 'yes'
     else:
         meta_data['right_turn_dedicated_link'] = 'no'
@@ -526,11 +534,12 @@ def get_crosswalk_name(crosswalk_data):
 def get_intersection_diameter(x_data):
     """
     Get the diameter of the intersection, which is defined as the max distance to the crosswalk border times 2.
+    The vehicle through guideways are memoized in the intersection and reused by api.get_guideways.
     :param x_data: intersection dictionary
     :return: float distance in meters
     """
 
-    guideways = get_through_guideways(x_data['merged_lanes'])
+    guideways = get_guideway_component(x_data, 'vehicle through')
     if guideways:
         diameter = max([get_crosswalk_to_crosswalk_distance_along_guideway(g, x_data['crosswalks']) for g in guideways])
     else:
@@ -561,7 +570,7 @@ def get_intersection_diameter(x_data):
     else:
         crosswalk_width = 2.538  # 1.8*sqrt(2)
 
-    dist = [great_circle_vec_check_for_nan(y0, x0, p[1], p[0]) for p in edge_points]
+    dist = get_distances_to_point((x0, y0), edge_points).tolist()
     if len(dist) > 0:
         return (max(dist) + crosswalk_width)*2.0
     else:
@@ -584,9 +593,9 @@ def get_distance_to_railway_crossing(x_data):
     edge_points.extend([l['right_border'][-1] for l in x_data['merged_tracks'] if 'to_intersection' in l['direction']])
     edge_points.extend([l['right_border'][0] for l in x_data['merged_tracks'] if 'from_intersection' in l['direction']])
     edge_points.extend([l['left_border'][0] for l in x_data['merged_tracks'] if 'from_intersection' in l['direction']])
-    dist_list = [great_circle_vec_check_for_nan(y0, x0, p[1], p[0]) for p in edge_points]
+    dist_list = get_distances_to_point((x0, y0), edge_points).tolist()
     if dist_list:
-        return min([great_circle_vec_check_for_nan(y0, x0, p[1], p[0]) for p in edge_points])
+        return min(dist_list)
     return -1
 
 
@@ -603,12 +612,15 @@ def get_distance_to_next_intersection(x_data, intersection_diameter):
     x0 = x_data['center_x']
     y0 = x_data['center_y']
 
-    for n in x_data['nodes']:
-        if 'street_name' not in x_data['nodes'][n]:
-            continue
-        if len(x_data['nodes'][n]['street_name']) < 2:
-            continue
-        if great_circle_vec_check_for_nan(y0, x0, x_data['nodes'][n]['y'], x_data['nodes'][n]['x']) < dist_threshold:
+    candidates = [n for n in x_data['nodes']
+                  if 'street_name' in x_data['nodes'][n] and len(x_data['nodes'][n]['street_name']) > 1
+                  ]
+    distances = dict(zip(candidates,
+                         get_distances_to_point((x0, y0), get_coordinates_array(x_data['nodes'], candidates)).tolist()
+                         ))
+
+    for n in candidates:
+        if distances[n] < dist_threshold:
             continue
         for s in x_data['nodes'][n]['street_name']:
             if '_link' in s:
@@ -619,9 +631,7 @@ def get_distance_to_next_intersection(x_data, intersection_diameter):
     if len(other_intersection_nodes) == 0:
         return -1
     else:
-        return min([great_circle_vec_check_for_nan(y0, x0, x_data['nodes'][n]['y'], x_data['nodes'][n]['x'])
-                    for n in other_intersection_nodes]
-                   )
+        return min([distances[n] for n in other_intersection_nodes])
 
 
 def get_list_of_highway_types(x_data, direction):
@@ -10,16 +10,22 @@
 import copy
 from border import get_intersection_with_circle
 from street import add_street_names_to_nodes
+from node_store import NodeStore, NodeIdAllocator
 
 
-def get_nodes_dict(city_paths_nodes, nodes_dict={}):
+def get_nodes_dict(city_paths_nodes, nodes_dict=None):
     """
-    Parse nodes from an osm response and convert them into the osmnx format
+    Parse nodes from an osm response and convert them into the osmnx format.
+    If the nodes dictionary is None, the nodes are returned in a new columnar NodeStore,
+    otherwise they are added to the given dictionary.
     :param city_paths_nodes: list of dictionaries
-    :param nodes_dict: dictionary
-    :return: list of dictionaries
+    :param nodes_dict: dictionary or None
+    :return: NodeStore or dictionary
     """
 
+    if nodes_dict is None:
+        return NodeStore([e for city_paths_node in city_paths_nodes for e in city_paths_node['elements']])
+
     for city_paths_node in city_paths_nodes:
         for element in city_paths_node['elements']:
             if element['type'] == 'node':
@@ -29,14 +35,16 @@ def get_nodes_dict(city_paths_nodes, nodes_dict={}):
     return nodes_dict
 
 
-def get_node_dict_subset_from_list_of_lanes(lanes, nodes_dict, nodes_subset={}):
+def get_node_dict_subset_from_list_of_lanes(lanes, nodes_dict, nodes_subset=None):
     """
     Create a subset of nodes dictionary for nodes referenced in the list of lanes
     :param lanes: list of dictionaries
     :param nodes_dict: dictionary
-    :param nodes_subset: dictionary
+    :param nodes_subset: dictionary to add the nodes to or None for a new dictionary
     :return: dictionary
     """
+    if nodes_subset is None:
+        nodes_subset = {}
     for lane_data in lanes:
         for n in lane_data['nodes']:
             if n in nodes_dict:
@@ -179,20 +187,21 @@ def remove_nodes_outside_of_radius(node_list, nodes_dict, center, radius):
     end_selection = len(node_list)
     starting_node = None
     ending_node = None
+    id_allocator = get_node_id_allocator(nodes_dict)
 
     for i in range(1, len(node_list)):
         n0 = nodes_dict[node_list[i-1]]
         n1 = nodes_dict[node_list[i]]
         if n0['within_selection'] == 'no' and n1['within_selection'] == 'yes':
             start_selection = i
-            starting_node = create_a_new_node_from_existing_one(n0, nodes_dict)
+            starting_node = create_a_new_node_from_existing_one(n0, nodes_dict, id_allocator=id_allocator)
             vector = [(n1['x'], n1['y']), (n0['x'], n0['y'])]
             new_coord = get_intersection_with_circle(vector, center, radius)
             starting_node['x'] = new_coord[0]
             starting_node['y'] = new_coord[1]
         elif n0['within_selection'] == 'yes' and n1['within_selection'] == 'no':
             end_selection = i
-            ending_node = create_a_new_node_from_existing_one(n1, nodes_dict)
+            ending_node = create_a_new_node_from_existing_one(n1, nodes_dict, id_allocator=id_allocator)
             vector = [(n0['x'], n0['y']), (n1['x'], n1['y'])]
             new_coord = get_intersection_with_circle(vector, center, radius)
             ending_node['x'] = new_coord[0]
@@ -211,44 +220,65 @@ def remove_nodes_outside_of_radius(node_list, nodes_dict, center, radius):
     return starting_list + node_list[start_selection:end_selection] + ending_list
 
 
-def create_a_new_node_from_existing_one(node_data, nodes_dict, within_selection='yes'):
+def get_node_id_allocator(nodes_dict):
+    """
+    Get the allocator of synthetic node ids for a nodes dictionary.
+    Node stores and node overlays keep their own allocator.  For a plain dictionary a new allocator is returned,
+    which the caller keeps for all nodes it creates in the dictionary.
+    :param nodes_dict: dictionary
+    :return: NodeIdAllocator
+    """
+    id_allocator = getattr(nodes_dict, 'id_allocator', None)
+    if id_allocator is None:
+        id_allocator = NodeIdAllocator()
+    return id_allocator
+
+
+def allocate_node_id(nodes_dict, id_allocator=None):
+    """
+    Allocate a collision free id for a new synthetic node
+    :param nodes_dict: dictionary
+    :param id_allocator: NodeIdAllocator or None to use the allocator of the dictionary, see get_node_id_allocator
+    :return: integer
+    """
+    if id_allocator is None:
+        id_allocator = get_node_id_allocator(nodes_dict)
+    return id_allocator.allocate(nodes_dict)
+
+
+def create_a_new_node_from_existing_one(node_data, nodes_dict, within_selection='yes', id_allocator=None):
     """
     Create a new node from an existing one for interpolation purposes.
     The new node will have only osmid, within_selection, street_name if applicable
     :param node_data: dictionary
     :param nodes_dict: dictionary
     :param within_selection: 
+    :param id_allocator: NodeIdAllocator or None, see allocate_node_id
     :return: dictionary
     """
-    new_node = {'osmid': node_data['osmid'], 'within_selection': within_selection}
+    new_node = {'osmid': allocate_node_id(nodes_dict, id_allocator), 'within_selection': within_selection}
     if 'street_name' in node_data:
         new_node['street_name'] = copy.deepcopy(node_data['street_name'])
-    for i in range(1, 1000000):
-        new_id = node_data['osmid'] * 100 + i
-        if new_id not in nodes_dict:
-            new_node['osmid'] = new_id
-            break
 
-    nodes_dict[new_id] = new_node
+    nodes_dict[new_node['osmid']] = new_node
 
     return new_node
 
 
-def create_a_node_from_coordinates(point, nodes_dict, street_name=None):
+def create_a_node_from_coordinates(point, nodes_dict, street_name=None, id_allocator=None):
     """
     Create a new node from a point.
     :param point: tuple of coordinates
     :param nodes_dict: dictionary
     :param street_name: set of strings
+    :param id_allocator: NodeIdAllocator or None, see allocate_node_id
     :return: dictionary
     """
-    new_node = {'x': point[0], 'y': point[1], 'street_name': street_name}
-
-    for i in range(1, 1000000):
-        if i not in nodes_dict:
-            new_node['osmid'] = i
-            break
-
-    nodes_dict[i] = new_node
+    new_node = {'x': point[0],
+                'y': point[1],
+                'street_name': street_name,
+                'osmid': allocate_node_id(nodes_dict, id_allocator)
+                }
+    nodes_dict[new_node['osmid']] = new_node
 
     return new_node
@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#######################################################################
+#
+#   This module provides a columnar node store
+#
+#######################################################################
+
+import copy
+import numpy as np
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+synthetic_node_id_base = 10 ** 15
+
+
+class NodeStore(MutableMapping):
+    """
+    Columnar storage of nodes with a dictionary compatible interface.
+    Node ids and coordinates are kept in NumPy arrays in the original order of the nodes.
+    Node ids are looked up by a binary search in a sorted copy of the ids,
+    which costs 16 bytes per node instead of about 100 bytes per node for a dictionary index
+    and allows vectorized lookup of a whole list of nodes.
+    Tags and other node attributes (e.g. street_name) are kept in a sparse side table for the nodes that have them.
+    Nodes added after construction (e.g. interpolated nodes) are kept as plain dictionaries,
+    so that callers can keep modifying them after the insertion.
+    Ids of synthetic nodes are handed out by the allocator of the store, see NodeIdAllocator.
+    store[node_id] returns a NodeView behaving as the osmnx node dictionary {'y', 'x', 'osmid', tags...}.
+    """
+
+    def __init__(self, elements=()):
+        """
+        :param elements: list of OSM elements, elements other than nodes are ignored
+        """
+        node_elements = [e for e in elements if e['type'] == 'node']
+        self.ids = np.array([e['id'] for e in node_elements], dtype=np.int64)
+        self.lon = np.array([e['lon'] for e in node_elements], dtype=np.float64)
+        self.lat = np.array([e['lat'] for e in node_elements], dtype=np.float64)
+        self.attributes = {}
+        for row, e in enumerate(node_elements):
+            if 'tags' in e and e['tags']:
+                self.attributes[row] = dict(e['tags'])
+        self.added = {}
+
+        # Stable sort: for duplicated ids the last occurrence wins as in a dictionary
+        self.sorted_rows = np.argsort(self.ids, kind='mergesort')
+        self.sorted_ids = self.ids[self.sorted_rows]
+        duplicates = self.sorted_ids[:-1] == self.sorted_ids[1:]
+        self.removed_rows = set(self.sorted_rows[:-1][duplicates].tolist())
+        self.id_allocator = NodeIdAllocator()
+
+    def get_row(self, node_id):
+        """
+        Get row of a stored node
+        :param node_id: integer
+        :return: integer row or None if the node is not stored in the columns
+        """
+        if len(self.sorted_ids) == 0:
+            return None
+        try:
+            position = int(self.sorted_ids.searchsorted(node_id, side='right')) - 1
+        except TypeError:
+            return None
+        if position < 0 or self.sorted_ids[position] != node_id:
+            return None
+        row = int(self.sorted_rows[position])
+        if self.removed_rows and row in self.removed_rows:
+            return None
+        return row
+
+    def get_rows(self, node_ids):
+        """
+        Get rows for a list of stored nodes in one vectorized lookup
+        :param node_ids: list of node ids
+        :return: numpy array of rows
+        """
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        positions = self.sorted_ids.searchsorted(node_ids, side='right') - 1
+        if len(node_ids) > 0 and (positions.min() < 0 or np.any(self.sorted_ids[positions] != node_ids)):
+            raise KeyError('Node ids not found')
+        return self.sorted_rows[positions]
+
+    def __getitem__(self, node_id):
+        if node_id in self.added:
+            return self.added[node_id]
+        row = self.get_row(node_id)
+        if row is None:
+            raise KeyError(node_id)
+        return NodeView(self, row)
+
+    def __setitem__(self, node_id, node_data):
+        row = self.get_row(node_id)
+        if row is not None:
+            if isinstance(node_data, NodeView) and node_data.store is self and node_data.row == row:
+                return
+            self.removed_rows.add(row)
+        self.added[node_id] = node_data
+
+    def __delitem__(self, node_id):
+        if node_id in self.added:
+            del self.added[node_id]
+            return
+        row = self.get_row(node_id)
+        if row is None:
+            raise KeyError(node_id)
+        self.removed_rows.add(row)
+
+    def __contains__(self, node_id):
+        return node_id in self.added or self.get_row(node_id) is not None
+
+    def __iter__(self):
+        for row, node_id in enumerate(self.ids.tolist()):
+            if not self.removed_rows or row not in self.removed_rows:
+                yield node_id
+        for node_id in list(self.added):
+            yield node_id
+
+    def __len__(self):
+        return len(self.ids) - len(self.removed_rows) + len(self.added)
+
+    def __repr__(self):
+        return 'NodeStore(%d nodes, %d added)' % (len(self.ids) - len(self.removed_rows), len(self.added))
+
+    def get_coordinates(self, node_ids):
+        """
+        Get coordinates for a list of node ids in one call
+        :param node_ids: list of node ids
+        :return: numpy array of shape (len(node_ids), 2) with x (longitude) and y (latitude) columns
+        """
+        if not self.removed_rows and (not self.added or set(self.added).isdisjoint(node_ids)):
+            rows = self.get_rows(node_ids)
+            return np.column_stack((self.lon[rows], self.lat[rows]))
+
+        return np.array([(self[node_id]['x'], self[node_id]['y']) for node_id in node_ids],
+                        dtype=np.float64
+                        ).reshape(-1, 2)
+
+
+class NodeView(MutableMapping):
+    """
+    Dictionary compatible view of a node stored in a NodeStore.
+    Copying or pickling a view produces a plain dictionary.
+    """
+
+    __slots__ = ('store', 'row')
+
+    coordinate_keys = ('y', 'x', 'osmid')
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    def __getitem__(self, key):
+        if key == 'x':
+            return self.store.lon.item(self.row)
+        if key == 'y':
+            return self.store.lat.item(self.row)
+        if key == 'osmid':
+            return self.store.ids.item(self.row)
+        attributes = self.store.attributes.get(self.row)
+        if attributes is None:
+            raise KeyError(key)
+        return attributes[key]
+
+    def __setitem__(self, key, value):
+        if key == 'x':
+            self.store.lon[self.row] = value
+        elif key == 'y':
+            self.store.lat[self.row] = value
+        elif key == 'osmid':
+            raise KeyError('osmid of a stored node cannot be changed')
+        else:
+            self.store.attributes.setdefault(self.row, {})[key] = value
+
+    def __delitem__(self, key):
+        if key in self.coordinate_keys:
+            raise KeyError('%s of a stored node cannot be removed' % key)
+        attributes = self.store.attributes.get(self.row)
+        if attributes is None:
+            raise KeyError(key)
+        del attributes[key]
+
+    def __contains__(self, key):
+        if key in self.coordinate_keys:
+            return True
+        attributes = self.store.attributes.get(self.row)
+        return attributes is not None and key in attributes
+
+    def __iter__(self):
+        for key in self.coordinate_keys:
+            yield key
+        for key in self.store.attributes.get(self.row, ()):
+            yield key
+
+    def __len__(self):
+        return len(self.coordinate_keys) + len(self.store.attributes.get(self.row, ()))
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+class NodeIdAllocator(object):
+    """
+    Allocator of ids for synthetic nodes, e.g. nodes interpolated at the crop radius.
+    Ids are handed out sequentially from a namespace reserved for synthetic nodes, far above the OSM node ids.
+    Ids already present in the nodes dictionary are skipped, so the ids are collision free,
+    and since the counter never goes back, an allocation takes constant amortized time.
+    An allocator created per intersection hands out the same ids on every run and in every worker process.
+    """
+
+    def __init__(self, first_id=synthetic_node_id_base):
+        """
+        :param first_id: integer
+        """
+        self.next_id = first_id
+
+    def allocate(self, nodes_dict):
+        """
+        Allocate a new node id
+        :param nodes_dict: dictionary of nodes the id must not collide with
+        :return: integer
+        """
+        while self.next_id in nodes_dict:
+            self.next_id += 1
+        node_id = self.next_id
+        self.next_id += 1
+        return node_id
+
+
+class NodeOverlay(MutableMapping):
+    """
+    Copy-on-access overlay over a base node dictionary, e.g. the nodes of a city.
+    A node is copied from the base into the overlay when it is accessed, and new nodes are added to the overlay only,
+    so all changes made while processing an intersection stay in the overlay and the base is never modified.
+    Each overlay has its own allocator of synthetic node ids.
+    Overlays of the same base can be used concurrently, and the nodes created for an intersection
+    are released together with the overlay.
+    """
+
+    def __init__(self, base):
+        """
+        :param base: NodeStore or dictionary of nodes
+        """
+        self.base = base
+        self.local = {}
+        self.removed = set()
+        self.id_allocator = NodeIdAllocator()
+
+    def __getitem__(self, node_id):
+        if node_id in self.local:
+            return self.local[node_id]
+        if node_id in self.removed:
+            raise KeyError(node_id)
+        node_data = copy_node(self.base[node_id])
+        self.local[node_id] = node_data
+        return node_data
+
+    def __setitem__(self, node_id, node_data):
+        self.local[node_id] = node_data
+        self.removed.discard(node_id)
+
+    def __delitem__(self, node_id):
+        if node_id not in self:
+            raise KeyError(node_id)
+        self.local.pop(node_id, None)
+        if node_id in self.base:
+            self.removed.add(node_id)
+
+    def __contains__(self, node_id):
+        return node_id in self.local or (node_id not in self.removed and node_id in self.base)
+
+    def __iter__(self):
+        for node_id in self.base:
+            if node_id not in self.removed:
+                yield node_id
+        for node_id in list(self.local):
+            if node_id not in self.base:
+                yield node_id
+
+    def __len__(self):
+        return len(self.base) - len(self.removed) + len([n for n in self.local if n not in self.base])
+
+    def __repr__(self):
+        return 'NodeOverlay(%d local nodes over %r)' % (len(self.local), self.base)
+
+    def get_coordinates(self, node_ids):
+        """
+        Get coordinates for a list of node ids in one call.
+        Nodes not copied to the overlay are fetched from the base in one bulk lookup.
+        :param node_ids: list of node ids
+        :return: numpy array of shape (len(node_ids), 2) with x (longitude) and y (latitude) columns
+        """
+        coordinates = np.empty((len(node_ids), 2), dtype=np.float64)
+        base_indices = []
+        for i, node_id in enumerate(node_ids):
+            if node_id in self.local:
+                coordinates[i] = (self.local[node_id]['x'], self.local[node_id]['y'])
+            elif node_id in self.removed:
+                raise KeyError(node_id)
+            else:
+                base_indices.append(i)
+
+        if base_indices:
+            coordinates[base_indices] = get_coordinates_array(self.base, [node_ids[i] for i in base_indices])
+
+        return coordinates
+
+
+def copy_node(node_data):
+    """
+    Copy a node into a plain dictionary.  Containers such as the set of street names are copied as well,
+    so that the copy can be modified without affecting the original node.
+    :param node_data: dictionary
+    :return: dictionary
+    """
+    node_copy = dict(node_data)
+    for key, value in node_copy.items():
+        if isinstance(value, (set, dict, list)):
+            node_copy[key] = copy.copy(value)
+    return node_copy
+
+
+def get_coordinates_array(nodes_dict, node_ids):
+    """
+    Get coordinates of a list of nodes as an array.
+    Uses a single bulk lookup if the nodes dictionary supports it.
+    :param nodes_dict: NodeStore, NodeOverlay or dictionary of nodes
+    :param node_ids: list of node ids
+    :return: numpy array of shape (len(node_ids), 2) with x (longitude) and y (latitude) columns
+    """
+    if isinstance(nodes_dict, (NodeStore, NodeOverlay)):
+        return nodes_dict.get_coordinates(node_ids)
+
+    return np.array([(nodes_dict[n]['x'], nodes_dict[n]['y']) for n in node_ids], dtype=np.float64).reshape(-1, 2)
+
+
+def get_node_coordinates(nodes_dict, node_ids):
+    """
+    Get coordinates of a list of nodes.
+    Uses a single bulk lookup if the nodes are kept in a NodeStore or NodeOverlay.
+    :param nodes_dict: NodeStore, NodeOverlay or dictionary of nodes
+    :param node_ids: list of node ids
+    :return: list of coordinates
+    """
+    if isinstance(nodes_dict, (NodeStore, NodeOverlay)):
+        coordinates = nodes_dict.get_coordinates(node_ids)
+        return list(zip(coordinates[:, 0].tolist(), coordinates[:, 1].tolist()))
+
+    return [(nodes_dict[n]['x'], nodes_dict[n]['y']) for n in node_ids]
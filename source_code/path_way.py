@@ -7,7 +7,8 @@
 #######################################################################
 
 from border import shift_list_of_nodes, shift_border, get_compass_bearing, get_compass_rhumb, \
-    great_circle_vec_check_for_nan, cut_border_by_point
+    get_distances_to_point, cut_border_by_point
+from node_store import get_coordinates_array
 import copy
 
 
@@ -296,12 +297,12 @@ def set_direction(paths, x_data, nodes_dict):
             p['tags']['direction'] = 'to_intersection'
             continue
 
-        distance_to_center0 = great_circle_vec_check_for_nan(y, x, nodes_dict[p['nodes'][0]]['y'],
-                                                  nodes_dict[p['nodes'][0]]['x'])
-        distance_to_center1 = great_circle_vec_check_for_nan(y, x,
-                                                  nodes_dict[p['nodes'][-1]]['y'],
-                                                  nodes_dict[p['nodes'][-1]]['x']
-                                                  )
+        distance_to_center0, distance_to_center1 = get_distances_to_point((x, y),
+                                                                          get_coordinates_array(nodes_dict,
+                                                                                                [p['nodes'][0],
+                                                                                                 p['nodes'][-1]]
+                                                                                                )
+                                                                          ).tolist()
 
         if distance_to_center0 > distance_to_center1:
             p['tags']['direction'] = 'to_intersection'
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#######################################################################
+#
+#   This module provides a polyline with cached arc lengths
+#
+#######################################################################
+
+import numpy as np
+import shapely.geometry as geom
+
+
+class Polyline(object):
+    """
+    Immutable polyline with a cached array of coordinates, segment lengths and cumulative arc lengths.
+    Lengths are measured in the plane of the coordinates as in Shapely,
+    so projecting, interpolating and cutting give the same results as the LineString methods,
+    but interpolating and cutting take a binary search over the cumulative lengths
+    instead of walking the line from the beginning.
+    Segment bearings are cached on demand, see border.get_segment_bearings.
+    """
+
+    __slots__ = ('coords', 'points', 'segment_lengths', 'cumulative_lengths', 'line', 'bearings')
+
+    def __init__(self, coordinates):
+        """
+        :param coordinates: list of coordinates or LineString
+        """
+        if isinstance(coordinates, geom.LineString):
+            coordinates = coordinates.coords
+        self.coords = tuple(tuple(p) for p in coordinates)
+        self.points = np.array(self.coords, dtype=np.float64).reshape(-1, 2)
+        self.points.flags.writeable = False
+        d = self.points[1:] - self.points[:-1]
+        self.segment_lengths = np.sqrt(d[:, 0] * d[:, 0] + d[:, 1] * d[:, 1])
+        self.cumulative_lengths = np.concatenate(([0.0], np.cumsum(self.segment_lengths)))
+        self.line = None
+        self.bearings = {}
+
+    def __len__(self):
+        return len(self.coords)
+
+    def __repr__(self):
+        return 'Polyline(%r)' % (self.coords,)
+
+    @property
+    def length(self):
+        return float(self.cumulative_lengths[-1])
+
+    def get_line_string(self):
+        """
+        Get Shapely LineString of the polyline.  The LineString is created once on demand.
+        :return: LineString
+        """
+        if self.line is None:
+            self.line = geom.LineString(self.coords)
+        return self.line
+
+    def project(self, point):
+        """
+        Get distance along the polyline to the point on the polyline nearest to the given point
+        :param point: coordinates or Shapely Point
+        :return: float
+        """
+        if isinstance(point, geom.Point):
+            point = point.coords[0]
+        if len(self.coords) < 2:
+            return 0.0
+
+        p0 = self.points[:-1]
+        d = self.points[1:] - p0
+        squared_lengths = d[:, 0] * d[:, 0] + d[:, 1] * d[:, 1]
+        dx = point[0] - p0[:, 0]
+        dy = point[1] - p0[:, 1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fractions = np.where(squared_lengths > 0.0, (dx * d[:, 0] + dy * d[:, 1]) / squared_lengths, 0.0)
+        fractions = np.clip(fractions, 0.0, 1.0)
+        closest_x = p0[:, 0] + fractions * d[:, 0]
+        closest_y = p0[:, 1] + fractions * d[:, 1]
+        squared_distances = (point[0] - closest_x) ** 2 + (point[1] - closest_y) ** 2
+        i = int(np.argmin(squared_distances))
+        return float(self.cumulative_lengths[i] + fractions[i] * self.segment_lengths[i])
+
+    def get_segment_index(self, distance):
+        """
+        Get index of the segment containing the point at a distance from the beginning
+        :param distance: float
+        :return: integer
+        """
+        i = int(self.cumulative_lengths.searchsorted(distance, side='right')) - 1
+        return min(max(i, 0), len(self.segment_lengths) - 1)
+
+    def interpolate(self, distance, normalized=False):
+        """
+        Get point at a distance along the polyline
+        :param distance: float
+        :param normalized: True if the distance is a fraction of the polyline length
+        :return: coordinates
+        """
+        if normalized:
+            distance = distance * self.length
+        if len(self.coords) < 2 or distance <= 0.0:
+            return self.coords[0]
+        if distance >= self.length:
+            return self.coords[-1]
+
+        i = self.get_segment_index(distance)
+        fraction = (distance - self.cumulative_lengths[i]) / self.segment_lengths[i]
+        x0, y0 = self.coords[i]
+        x1, y1 = self.coords[i + 1]
+        return x0 + float(fraction) * (x1 - x0), y0 + float(fraction) * (y1 - y0)
+
+    def cut(self, distance):
+        """
+        Cut the polyline in two pieces at a distance from the beginning
+        :param distance: float
+        :return: list of one polyline if the distance is beyond the ends, otherwise list of two polylines
+        """
+        if distance <= 0.0 or distance >= self.length:
+            return [self]
+
+        i = int(self.cumulative_lengths.searchsorted(distance, side='left'))
+        if self.cumulative_lengths[i] == distance:
+            return [Polyline(self.coords[:i + 1]), Polyline(self.coords[i:])]
+
+        point = self.interpolate(distance)
+        return [Polyline(self.coords[:i] + (point,)), Polyline((point,) + self.coords[i:])]
+
+    def get_substring(self, start_distance, end_distance):
+        """
+        Get part of the polyline between two distances from the beginning
+        :param start_distance: float
+        :param end_distance: float
+        :return: polyline
+        """
+        head = self.cut(end_distance)[0]
+        return head.cut(start_distance)[-1]
+
+
+def get_polyline(coordinates):
+    """
+    Get a polyline for a list of coordinates, LineString or polyline
+    :param coordinates: list of coordinates, LineString or Polyline
+    :return: Polyline
+    """
+    if isinstance(coordinates, Polyline):
+        return coordinates
+    return Polyline(coordinates)
@@ -81,6 +81,7 @@ def generate_intersection_list(args):
             args['data_dir'] = Name of the data directory where the output should be placed.
             args['crop_radius'] = Crop radius for intersection extraction. Default = 80.
             args['debug'] = (Optional) Boolean parameter indicating whether DEBUG info must be logged.
+            args['cache_dir'] = (Optional) Directory for binary snapshots of the prepared city data.
 
     :returns res:
         Dictionary with resulting info:
@@ -109,7 +110,11 @@ def generate_intersection_list(args):
     if 'debug' in args.keys():
         debug = args['debug']
 
-    city = api.get_data(city_name=city_name)
+    cache_dir = None
+    if 'cache_dir' in args.keys():
+        cache_dir = args['cache_dir']
+
+    city = api.get_data(city_name=city_name, cache_dir=cache_dir)
     cross_streets = api.get_intersecting_streets(city)
     #cross_streets = random.sample(cross_streets, 50)
 
@@ -228,6 +233,7 @@ def extract_intersection(args):
             args['cross_streets'] = List [<street_name_1>, <street_name_2>, ...] pointing to an intersection.
             args['crop_radius'] = Crop radius for intersection extraction. Default = 80.
             args['debug'] = (Optional) Boolean parameter indicating whether DEBUG info must be logged.
+            args['cache_dir'] = (Optional) Directory for binary snapshots of the prepared city data.
 
     :returns res:
         Dictionary with resulting info:
@@ -249,8 +255,12 @@ def extract_intersection(args):
     if 'debug' in args.keys():
         debug = args['debug']
 
+    cache_dir = None
+    if 'cache_dir' in args.keys():
+        cache_dir = args['cache_dir']
+
     #city_area = api.get_data(file_name=osm_file)
-    city_area = api.get_data(city_name=city_name)
+    city_area = api.get_data(city_name=city_name, cache_dir=cache_dir)
     intersecting_streets = api.get_intersecting_streets(city_area)
     intersection_addr = None
 
@@ -285,6 +295,7 @@ def process_intersections(args):
                                          + 'u_turn'.
             args['crop_radius'] = Crop radius for intersection extraction. Default = 80.
             args['debug'] = (Optional) Boolean parameter indicating whether DEBUG info must be logged.
+            args['cache_dir'] = (Optional) Directory for binary snapshots of the prepared city data.
 
     :returns res:
         Dictionary with resulting info:
@@ -313,6 +324,10 @@ def process_intersections(args):
     if 'debug' in args.keys():
         debug = args['debug']
 
+    cache_dir = None
+    if 'cache_dir' in args.keys():
+        cache_dir = args['cache_dir']
+
     with open(intersections_file, 'r') as f:
         reader = csv.reader(f)
         #next(reader)  # skip header
@@ -328,7 +343,7 @@ def process_intersections(args):
             cross_streets = extract_street_names(data[i][0])
             metafiles = literal_eval(data[i][3])
             traces = literal_eval(data[i][4])
-            args2 = {'city_name': city_name, 'osm_file': osm_file, 'cross_streets': cross_streets, 'crop_radius': crop_radius, 'debug': debug}
+            args2 = {'city_name': city_name, 'osm_file': osm_file, 'cross_streets': cross_streets, 'crop_radius': crop_radius, 'debug': debug, 'cache_dir': cache_dir}
             res0 = extract_intersection(args2)
             intersection = res0['intersection']
             guideways = api.get_guideways(intersection)
@@ -357,8 +372,9 @@ def main(argv):
     ignored_directions = ['u_turn']
     crop_radius = 80
     debug = True
+    cache_dir = "cache"
 
-    args = {'city_name': city_name, 'data_dir': data_dir, 'crop_radius': crop_radius, 'debug': debug}
+    args = {'city_name': city_name, 'data_dir': data_dir, 'crop_radius': crop_radius, 'debug': debug, 'cache_dir': cache_dir}
     #generate_intersection_list(args)
 
     if False:
@@ -369,7 +385,7 @@ def main(argv):
     id_list = [2, 4, 5, 7, 10, 11, 14]
     id_list = [4, 5, 6]
 
-    args = {'city_name': city_name, 'maps_dir': maps_dir, 'intersections_file': intersections_file, 'id_list': id_list, 'ignored_directions': ignored_directions, 'crop_radius': crop_radius, 'debug': debug}
+    args = {'city_name': city_name, 'maps_dir': maps_dir, 'intersections_file': intersections_file, 'id_list': id_list, 'ignored_directions': ignored_directions, 'crop_radius': crop_radius, 'debug': debug, 'cache_dir': cache_dir}
     res = process_intersections(args)
 
     for k in res.keys():
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#######################################################################
+#
+#   This module provides lane and guideway dictionaries sharing the OSM tags of their paths
+#
+#######################################################################
+
+try:
+    from collections.abc import Mapping, KeysView, ItemsView, ValuesView
+except ImportError:
+    from collections import Mapping, KeysView, ItemsView, ValuesView
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+class Record(dict):
+    """
+    Dictionary that refers to shared OSM tags instead of copying them.
+    OSM tags are not copied into the record: the record refers to the tags dictionary of its path,
+    which is shared by all lanes of the path.  The tags are visible as keys of the record,
+    assigning a tag key stores the value in the record and never modifies the shared tags.
+    Records are dictionaries, so json serializes them as objects, and yaml as mappings.
+    Copying or pickling a record produces a record of the same type referring to the same tags.
+    """
+
+    __slots__ = ('shared_tags',)
+
+    def __init__(self, data=(), shared_tags=None):
+        """
+        :param data: dictionary or list of key, value pairs
+        :param shared_tags: dictionary of OSM tags or None
+        """
+        dict.__init__(self, data)
+        self.shared_tags = shared_tags
+
+    def __missing__(self, key):
+        if self.shared_tags is not None and key in self.shared_tags:
+            return self.shared_tags[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if dict.__contains__(self, key):
+            return dict.__getitem__(self, key)
+        if self.shared_tags is not None:
+            return self.shared_tags.get(key, default)
+        return default
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if self.shared_tags is not None and key in self.shared_tags:
+            # Detach from the shared tags, so that the key is not visible through them anymore
+            tags = self.shared_tags
+            self.shared_tags = None
+            for k in tags:
+                if not dict.__contains__(self, k):
+                    dict.__setitem__(self, k, tags[k])
+        dict.__delitem__(self, key)
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or (self.shared_tags is not None and key in self.shared_tags)
+
+    def __iter__(self):
+        for key in dict.__iter__(self):
+            yield key
+        if self.shared_tags is not None:
+            for key in self.shared_tags:
+                if not dict.__contains__(self, key):
+                    yield key
+
+    def __len__(self):
+        if self.shared_tags is None:
+            return dict.__len__(self)
+        return dict.__len__(self) + sum(1 for key in self.shared_tags if not dict.__contains__(self, key))
+
+    def __eq__(self, other):
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        if self.shared_tags is None and getattr(other, 'shared_tags', None) is None:
+            return dict.__eq__(self, other)
+        return len(self) == len(other) and all(key in other and other[key] == value for key, value in self.items())
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, dict(self.items()))
+
+    def __reduce__(self):
+        return self.__class__, (), (None, {'shared_tags': self.shared_tags}), None, iter(dict.items(self))
+
+    def keys(self):
+        if self.shared_tags is None:
+            return dict.keys(self)
+        return KeysView(self)
+
+    def items(self):
+        if self.shared_tags is None:
+            return dict.items(self)
+        return ItemsView(self)
+
+    def values(self):
+        if self.shared_tags is None:
+            return dict.values(self)
+        return ValuesView(self)
+
+    def own_keys(self):
+        """
+        Get the keys stored in the record itself, i.e. all keys except the shared tags
+        :return: keys view
+        """
+        return dict.keys(self)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        if key not in self:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        value = self[key]
+        del self[key]
+        return value
+
+    def popitem(self):
+        for key in self:
+            return key, self.pop(key)
+        raise KeyError('popitem(): record is empty')
+
+    def clear(self):
+        dict.clear(self)
+        self.shared_tags = None
+
+    def copy(self):
+        return self.__class__(dict.items(self), shared_tags=self.shared_tags)
+
+    def replace_shared_tags(self, shared_tags, exclude=()):
+        """
+        Refer to another tags dictionary as if its tags were assigned to the record one by one.
+        Keys of the record that the new tags contain are dropped, so that the new tags show through,
+        and the old tags that the new ones do not contain are stored in the record.
+        :param shared_tags: dictionary of OSM tags or None
+        :param exclude: keys that the new tags must not replace
+        :return: None
+        """
+        if self.shared_tags is not None and self.shared_tags is not shared_tags:
+            for key in self.shared_tags:
+                if not dict.__contains__(self, key) and (shared_tags is None or key not in shared_tags):
+                    dict.__setitem__(self, key, self.shared_tags[key])
+        if shared_tags is not None:
+            for key in shared_tags:
+                if dict.__contains__(self, key) and key not in exclude:
+                    dict.__delitem__(self, key)
+        self.shared_tags = shared_tags
+
+
+class Lane(Record):
+    """
+    Lane record.  The keys are the same as in the lane dictionaries.
+    """
+
+    __slots__ = ()
+
+
+class Guideway(Record):
+    """
+    Guideway record.  The keys are the same as in the guideway dictionaries.
+    """
+
+    __slots__ = ()
+
+
+def represent_record(dumper, record):
+    """
+    Represent a record in yaml as a plain mapping including the shared tags
+    :param dumper: yaml dumper
+    :param record: Record
+    :return: yaml node
+    """
+    return dumper.represent_dict(dict(record.items()))
+
+
+if yaml is not None:
+    yaml.add_multi_representer(Record, represent_record)
+    yaml.add_multi_representer(Record, represent_record, Dumper=yaml.SafeDumper)
@@ -9,18 +9,19 @@
 
 import shapely.geometry as geom
 from border import cut_border_by_distance, extend_vector, extend_both_sides_of_a_border
-from lane import get_lane_index_from_right, get_turn_type, intersects
+from lane import get_lane_index_from_right, get_turn_type, LaneGraph
 from log import get_logger
 
 
 logger = get_logger()
 
 
-def is_right_turn_allowed(lane_data, all_lanes):
+def is_right_turn_allowed(lane_data, all_lanes, lane_graph=None):
     """
     Define if it it is OK to turn right from this lane
     :param lane_data: dictionary
     :param all_lanes: list of dictionaries
+    :param lane_graph: LaneGraph of all lanes or None
     :return: True if right turn permitted, False otherwise
     """
 
@@ -39,57 +40,57 @@ def is_right_turn_allowed(lane_data, all_lanes):
     if lane_data['lane_type'] == 'through' \
             and lane_data['direction'] == 'to_intersection' \
             and get_lane_index_from_right(lane_data) == 0 \
-            and len(get_connected_links(lane_data, all_lanes)) > 0:
+            and len(get_connected_links(lane_data, all_lanes, lane_graph=lane_graph)) > 0:
         return True
 
     return False
 
 
-def get_connected_links(origin_lane, all_lanes):
+def get_connected_links(origin_lane, all_lanes, lane_graph=None):
     """
     Get a list of trunk link lanes starting from the given origin lane.
     :param origin_lane: dictionary
     :param all_lanes: list of dictionaries
+    :param lane_graph: LaneGraph of all lanes or None
     :return: list of dictionaries
     """
     if 'walk' in origin_lane['lane_type'] or 'rail' in origin_lane['lane_type']:
         return []
+    if lane_graph is None:
+        lane_graph = LaneGraph(all_lanes)
 
-    return [l for l in all_lanes
-            if 'walk' not in l['lane_type']
-            and 'rail' not in l['lane_type']
-            and 'highway' in l['path'][0]['tags']
-            and 'link' in l['path'][0]['tags']['highway']
-            and l['nodes'][0] in origin_lane['nodes']
-            ]
+    return lane_graph.get_connected_links(origin_lane)
 
 
-def get_link(origin_lane, all_lanes):
+def get_link(origin_lane, all_lanes, lane_graph=None):
     """
     Check if a link for a turn exists for a lane and return it, or None if no link found
     :param origin_lane: dictionary
     :param all_lanes: list of dictionaries
+    :param lane_graph: LaneGraph of all lanes or None
     :return: dictionary or None
     """
 
-    links = get_connected_links(origin_lane, all_lanes)
+    links = get_connected_links(origin_lane, all_lanes, lane_graph=lane_graph)
     if len(links) > 0:
         return links[0]
     else:
         return None
 
 
-def get_link_destination_lane(link_lane, all_lanes):
+def get_link_destination_lane(link_lane, all_lanes, lane_graph=None):
     """
     Get destination lane for a link
     :param link_lane: dictionary
     :param all_lanes: list of dictionaries
+    :param lane_graph: LaneGraph of all lanes or None
     :return: dictionary
     """
-    res = [l for l in all_lanes
-           if link_lane['nodes'][-1] in l['nodes']
-           and link_lane['lane_id'] == l['lane_id']
-           and l['direction'] == 'from_intersection'
+    if lane_graph is None:
+        lane_graph = LaneGraph(all_lanes)
+
+    res = [l for l in lane_graph.get_exit_lanes_through_node(link_lane['nodes'][-1])
+           if link_lane['lane_id'] == l['lane_id']
            and 'link' not in l['path'][0]['tags']['highway']
            ]
 
@@ -137,7 +138,7 @@ def get_right_turn_border(origin_border, link_border, destination_border):
     return list(origin_line1.coords) + link_border[1:-1] + list(line2.coords)
 
 
-def get_destination_lanes_for_right_turn(origin_lane, all_lanes):
+def get_destination_lanes_for_right_turn(origin_lane, all_lanes, lane_graph=None):
     """
     Identifying destination lanes (possibly more than one).
     Assuming that the origin and destination lanes must have the same lane index from right,
@@ -146,20 +147,21 @@ def get_destination_lanes_for_right_turn(origin_lane, all_lanes):
     So we identify the destination lane by the index from right rather than by the lane id.
     :param origin_lane: lane dictionary of a left turn
     :param all_lanes: list of dictionaries
+    :param lane_graph: LaneGraph of all lanes or None
     :return: list of valid lane destinations for the left turn
     """
 
     if origin_lane['name'] == 'no_name':
         return []
-    if not is_right_turn_allowed(origin_lane, all_lanes):
+    if lane_graph is None:
+        lane_graph = LaneGraph(all_lanes)
+    if not is_right_turn_allowed(origin_lane, all_lanes, lane_graph=lane_graph):
         return []
 
-    destination_index = get_lane_index_from_right(origin_lane)
-    return [l for l in all_lanes
+    destination_index = lane_graph.get_index_from_right(origin_lane)
+    return [l for l in lane_graph.get_exit_lanes_by_index_from_right(destination_index)
             if l['name'] != origin_lane['name']
             and l['name'] != 'no_name'
-            and l['direction'] == 'from_intersection'
-            and destination_index == get_lane_index_from_right(l)
-            and intersects(origin_lane, l, all_lanes)
+            and lane_graph.intersects(origin_lane, l)
             and get_turn_type(origin_lane, l) == 'right_turn'
             ]
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#######################################################################
+#
+#   This module provides an on-disk cache of prepared city data
+#
+#######################################################################
+
+import os
+import hashlib
+import datetime
+import tempfile
+import pickle
+from log import get_logger
+
+
+logger = get_logger()
+
+snapshot_version = 3
+
+
+def get_file_snapshot_key(file_name, block_size=1 << 20):
+    """
+    Get snapshot key for an OSM file.  The key is a hash of the file content,
+    so that a modified file never matches an old snapshot.
+    :param file_name: string
+    :param block_size: integer number of bytes read at a time
+    :return: string or None if the file cannot be read
+    """
+    sha = hashlib.sha1()
+    try:
+        with open(file_name, 'rb') as f:
+            block = f.read(block_size)
+            while block:
+                sha.update(block)
+                block = f.read(block_size)
+    except (IOError, OSError):
+        logger.exception('Unable to read file %s' % file_name)
+        return None
+
+    return 'file_' + sha.hexdigest()
+
+
+def get_city_snapshot_key(city_name, data_timestamp=None):
+    """
+    Get snapshot key for a city downloaded from OSM.  The online data has no content hash before it is downloaded,
+    so the key is built from the city name and a data timestamp.  By default the timestamp is the current date,
+    i.e. city snapshots are refreshed daily.
+    :param city_name: city name like 'Campbell, California, USA'
+    :param data_timestamp: string or None
+    :return: string
+    """
+    if data_timestamp is None:
+        data_timestamp = datetime.date.today().isoformat()
+
+    sha = hashlib.sha1((u'%s|%s' % (city_name, data_timestamp)).encode('utf-8'))
+    return 'city_' + sha.hexdigest()
+
+
+def get_snapshot_file_name(cache_dir, key):
+    """
+    Get snapshot file name
+    :param cache_dir: string
+    :param key: string
+    :return: string
+    """
+    return os.path.join(cache_dir, key + '.snapshot')
+
+
+def load_snapshot(cache_dir, key):
+    """
+    Load city data from a snapshot.
+    Returns None if the snapshot does not exist, cannot be read or was written by another snapshot version.
+    :param cache_dir: string
+    :param key: string
+    :return: city data dictionary or None
+    """
+    file_name = get_snapshot_file_name(cache_dir, key)
+    if not os.path.isfile(file_name):
+        return None
+
+    try:
+        with open(file_name, 'rb') as f:
+            snapshot = pickle.load(f)
+    except Exception:
+        logger.exception('Unable to load snapshot %s' % file_name)
+        return None
+
+    if not isinstance(snapshot, dict) or snapshot.get('version') != snapshot_version or snapshot.get('key') != key:
+        logger.warning('Ignoring stale snapshot %s' % file_name)
+        return None
+
+    logger.debug('Loaded snapshot %s' % file_name)
+    return snapshot['city_data']
+
+
+def save_snapshot(cache_dir, key, city_data):
+    """
+    Save city data to a snapshot.  The snapshot is written to a temporary file first and then renamed,
+    so that a restarted or concurrent job never reads a partially written snapshot.
+    :param cache_dir: string
+    :param key: string
+    :param city_data: dictionary
+    :return: snapshot file name or None if unable to save
+    """
+    file_name = get_snapshot_file_name(cache_dir, key)
+    snapshot = {'version': snapshot_version, 'key': key, 'city_data': city_data}
+    temp_file_name = None
+
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        handle, temp_file_name = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as f:
+            pickle.dump(snapshot, f, pickle.HIGHEST_PROTOCOL)
+        replace_file(temp_file_name, file_name)
+    except Exception:
+        # The snapshot is optional, so a failure to write it never fails loading the data
+        logger.exception('Unable to save snapshot %s' % file_name)
+        if temp_file_name is not None and os.path.exists(temp_file_name):
+            try:
+                os.remove(temp_file_name)
+            except OSError:
+                logger.exception('Unable to remove temporary snapshot %s' % temp_file_name)
+        return None
+
+    logger.debug('Saved snapshot %s' % file_name)
+    return file_name
+
+
+def replace_file(source_file_name, target_file_name):
+    """
+    Rename a file replacing the target file if it exists.
+    os.rename fails on Windows if the target exists, and os.replace is missing in Python 2.
+    :param source_file_name: string
+    :param target_file_name: string
+    :return: None
+    """
+    if hasattr(os, 'replace'):
+        os.replace(source_file_name, target_file_name)
+    else:
+        if os.path.exists(target_file_name):
+            os.remove(target_file_name)
+        os.rename(source_file_name, target_file_name)
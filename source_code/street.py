@@ -13,7 +13,7 @@ from border import get_distance_between_nodes, get_compass_rhumb, get_border_len
 from turn import shorten_border_for_crosswalk
 from railway import split_track_by_node_index
 from lane import get_most_right_lane, get_most_left_lane, get_sorted_lane_subset, get_lane_index_from_right, \
-    get_lane_index_from_left
+    get_lane_index_from_left, CrosswalkIndex
 from log import get_logger
 
 
@@ -161,6 +161,7 @@ def get_lanes_close_to_the_intersection(x_data, crosswalk_width=1.82):
     :return: list of lane dictionaries
     """
     close_lanes = []
+    crosswalk_index = None
     for lane_data in x_data['merged_lanes']:
         if [n for n in lane_data['nodes'] if n in x_data['x_nodes']]:
             close_lanes.append(lane_data)
@@ -175,11 +176,14 @@ def get_lanes_close_to_the_intersection(x_data, crosswalk_width=1.82):
             close_lanes.append(lane_data)
             continue
 
+        if crosswalk_index is None:
+            crosswalk_index = CrosswalkIndex(x_data['merged_lanes'], 5*crosswalk_width)
         median = shorten_border_for_crosswalk(lane_data['median'],
                                               lane_data['name'],
                                               x_data['merged_lanes'],
                                               crosswalk_width=5*crosswalk_width,
-                                              destination=lane_data['direction']
+                                              destination=lane_data['direction'],
+                                              crosswalk_index=crosswalk_index
                                               )
         if get_border_length(median) < lane_data['length']:
             close_lanes.append(lane_data)
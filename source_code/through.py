@@ -8,7 +8,7 @@
 
 
 from border import get_angle_between_bearings, get_distance_between_points
-from lane import get_lane_index_from_right
+from lane import LaneGraph
 
 
 def is_through_allowed(lane_data):
@@ -27,29 +27,28 @@ def is_through_allowed(lane_data):
     return False
 
 
-def get_destination_lane(lane_data, all_lanes):
+def get_destination_lane(lane_data, all_lanes, lane_graph=None):
     """
     Get destination lane for through driving
     :param lane_data: dictionary
     :param all_lanes: list of dictionaries
+    :param lane_graph: LaneGraph of all lanes or None
     :return: dictionary
     """
+    if lane_graph is None:
+        lane_graph = LaneGraph(all_lanes)
 
     # Try common node first
-    res = [l for l in all_lanes
-           if lane_data['nodes'][-1] == l['nodes'][0]
-           and lane_data['lane_id'] == l['lane_id']
-           and l['direction'] == 'from_intersection'
+    res = [l for l in lane_graph.get_exit_lanes_starting_at_node(lane_data['nodes'][-1])
+           if lane_data['lane_id'] == l['lane_id']
            and - 30.0 < get_angle_between_bearings(lane_data['bearing'], l['bearing']) < 30.0
            ]
     if len(res) > 0:
         return res[0]
 
     # Try same street name
-    res = [l for l in all_lanes
-           if lane_data['name'] == l['name']
-           and lane_data['lane_id'] == l['lane_id']
-           and l['direction'] == 'from_intersection'
+    res = [l for l in lane_graph.get_exit_lanes_by_name(lane_data['name'])
+           if lane_data['lane_id'] == l['lane_id']
            and - 60.0 < get_angle_between_bearings(lane_data['bearing'], l['bearing']) < 60.0
            and get_distance_between_points(lane_data['median'][-1], l['median'][0]) < 15.0
            ]
@@ -57,10 +56,8 @@ def get_destination_lane(lane_data, all_lanes):
         return res[0]
 
     # Try all other possible options
-    res = [l for l in all_lanes
+    res = [l for l in lane_graph.get_exit_lanes_by_index_from_right(int(lane_data['lane_id'][0]) - 1)
            if -30.0 < get_angle_between_bearings(lane_data['bearing'], l['bearing']) < 30.0
-           and int(lane_data['lane_id'][0]) - 1 == get_lane_index_from_right(l)
-           and l['direction'] == 'from_intersection'
            and get_distance_between_points(lane_data['median'][-1], l['median'][0]) < 10.0
            ]
     if len(res) > 0:
@@ -8,18 +8,17 @@
 
 import copy
 import math
+import numpy as np
 import shapely.geometry as geom
-import nvector as nv
-from lane import add_space_for_crosswalk
+from lane import CrosswalkIndex, LaneGraph
 from border import cut_border_by_polygon, get_turn_angle, to_rad, extend_vector, get_compass, \
-    shift_by_bearing_and_distance, drop_small_edges, great_circle_vec_check_for_nan, get_angle_between_bearings
+    drop_small_edges, great_circle_vec_check_for_nan, get_compass_bearings, get_angles_between_bearings, \
+    get_point_by_azimuth, shift_points_by_bearing_and_distance
 from log import get_logger
 
 
 logger = get_logger()
 
-nv_frame = nv.FrameE(a=6371e3, f=0)
-
 
 def shorten_border_for_crosswalk(input_border,
                                  street_name,
@@ -27,18 +26,22 @@ def shorten_border_for_crosswalk(input_border,
                                  crosswalk_width=10,
                                  destination='from_intersection',
                                  exclude_links=True,
-                                 exclude_parallel=True
+                                 exclude_parallel=True,
+                                 crosswalk_index=None
                                  ):
     """
     Remove the portion of the input border overlapping with any crosswalk crossing the input border.
     Scan all lanes with street names other than the street the input border belongs to,
     and identify crosswalks related to each lane.
+    Crosswalk polygons are taken from the crosswalk index, only the polygons near the border are cut out.
     :param input_border: list of coordinates
     :param street_name: string
     :param lanes: list of dictionaries
     :param crosswalk_width: float
     :param destination: string
     :param exclude_links: True if exclude links, False otherwise
+    :param exclude_parallel: True if exclude lanes almost parallel to the border, False otherwise
+    :param crosswalk_index: CrosswalkIndex of the lanes for the crosswalk width or None
     :return: list of coordinates
     """
     border = copy.deepcopy(input_border)
@@ -47,35 +50,40 @@ def shorten_border_for_crosswalk(input_border,
     else:
         multi_string_index = 0
 
-    for l in lanes:
-        if l['name'] == 'no_name' or l['name'] == street_name:
-            continue
-        if exclude_links and 'link' in l['name']:
-            continue
-        if 'median' in l:
-            border_type = 'median'
-        else:
-            border_type = 'left_border'
+    if crosswalk_index is None:
+        crosswalk_index = CrosswalkIndex(lanes, crosswalk_width)
+
+    crossing_lanes = crosswalk_index.get_crossing_lanes(street_name, exclude_links=exclude_links)
+    if not crossing_lanes:
+        return border
+
+    border_bearing = get_compass_bearings(np.array([input_border[0]], dtype=np.float64),
+                                          np.array([input_border[-1]], dtype=np.float64)
+                                          )
+    bearing_deltas = np.abs(get_angles_between_bearings(crosswalk_index.bearings[crossing_lanes],
+                                                        border_bearing
+                                                        )
+                            ).tolist()
 
-        bearing_delta = abs(get_angle_between_bearings(get_compass(l[border_type][-2], l[border_type][-1]),
-                                                       get_compass(input_border[0], input_border[-1])
-                                                       )
-                            )
+    candidates = None
+    for i, bearing_delta in zip(crossing_lanes, bearing_deltas):
         if bearing_delta > 90.0:
             bearing_delta = (180.0 - bearing_delta) % 180.0
         if bearing_delta < 30.0:
             if exclude_parallel:
                 logger.debug("Processing %s, excluding %s for shortening: almost parallel %r"
-                             % (street_name, l['name'], bearing_delta)
+                             % (street_name, crosswalk_index.lanes[i]['name'], bearing_delta)
                              )
                 continue
 
-        lb, rb = add_space_for_crosswalk(l, crosswalk_width=crosswalk_width)
-        coord = lb + rb[::-1]
-        polygon = geom.Polygon(coord)
-        temp = cut_border_by_polygon(border, polygon, multi_string_index)
-        if temp is not None:
-            border = temp
+        # The border only gets shorter, so the polygons near the input border are the only candidates
+        if candidates is None:
+            candidates = crosswalk_index.query(border)
+        if i in candidates and crosswalk_index.prepared_polygons[i].intersects(geom.LineString(border)):
+            temp = cut_border_by_polygon(border, crosswalk_index.polygons[i], multi_string_index)
+            if temp is not None:
+                border = drop_small_edges(temp)
+        else:
             border = drop_small_edges(border)
 
     return border
@@ -114,9 +122,7 @@ def construct_turn_arc_with_initial_angle(origin_border,
         last_origin_point = vector1[1]
 
     azimuth = (get_compass(intersection_point, last_origin_point) - initial_angle + 360) % 360
-    point = nv_frame.GeoPoint(latitude=last_origin_point[1], longitude=last_origin_point[0], degrees=True)
-    result, _azimuthb = point.geo_point(distance=100.0, azimuth=azimuth, degrees=True)
-    first_orin_point = (result.longitude_deg, result.latitude_deg)
+    first_orin_point = get_point_by_azimuth(last_origin_point, azimuth, distance=100.0)
     angled_origin_border = [first_orin_point, last_origin_point]
 
     return construct_turn_arc(angled_origin_border,
@@ -135,47 +141,88 @@ def construct_turn_arc(origin_border, destination_border, number_of_points=12, t
     :param turn_direction: -1 if left turn otherwise 1
     :return: list of coordinates
     """
+    return construct_turn_arcs([(origin_border, destination_border)],
+                               number_of_points=number_of_points,
+                               turn_direction=turn_direction
+                               )[0]
 
-    intersection_point, vector1, vector2 = get_turn_angle(origin_border, destination_border)
-
-    if intersection_point is None:
-        logger.debug('Origin %r' % origin_border)
-        logger.debug('Destin %r' % destination_border)
-        logger.debug('Cannot find intersection point')
-        return None
-
-    from_origin_to_intersection = great_circle_vec_check_for_nan(intersection_point[1], intersection_point[0],
-                                                                 vector1[1][1], vector1[1][0])
-    from_destination_to_intersection = great_circle_vec_check_for_nan(intersection_point[1], intersection_point[0],
-                                                                      vector2[1][1], vector2[1][0])
 
-    bearing1 = get_compass(vector1[1], vector1[0])
-    bearing2 = get_compass(vector2[0], vector2[1])
-    angle = ((turn_direction*(bearing2 - bearing1) + 360) % 360)
-
-    if from_origin_to_intersection < from_destination_to_intersection:
-        distance_to_starting_point = from_origin_to_intersection
-        dist_delta = 0.0
-    else:
-        distance_to_starting_point = from_destination_to_intersection
-        dist_delta = from_origin_to_intersection - from_destination_to_intersection
+def construct_turn_arcs(borders, number_of_points=12, turn_direction=-1.0):
+    """
+    Construct turn arcs for a list of origin and destination borders, e.g. for the left, median and right borders
+    of a guideway.  The arc points of all borders are calculated in one vectorized call.
+    Fewer points give a coarser arc at a lower cost.
+    :param borders: list of tuples (origin border, destination border)
+    :param number_of_points: integer, number of arc segments
+    :param turn_direction: -1 if left turn otherwise 1
+    :return: list of arcs, each arc is a list of coordinates or None if the arc cannot be constructed
+    """
+    steps = np.arange(number_of_points + 1, dtype=np.float64)
+    arcs = [None]*len(borders)
+    arc_indices = []
+    arc_points = []
+    arc_shifts = []
+    direction_references = []
+
+    for k, (origin_border, destination_border) in enumerate(borders):
+        intersection_point, vector1, vector2 = get_turn_angle(origin_border, destination_border)
+
+        if intersection_point is None:
+            logger.debug('Origin %r' % origin_border)
+            logger.debug('Destin %r' % destination_border)
+            logger.debug('Cannot find intersection point')
+            continue
 
-    radius = distance_to_starting_point / math.tan(to_rad(angle / 2.0))
-    shift = [turn_direction * 2.0 * radius * (math.sin(to_rad(angle / 2.0 * i / float(number_of_points)))) ** 2
-             for i in range(0, number_of_points + 1)
-             ]
+        from_origin_to_intersection = great_circle_vec_check_for_nan(intersection_point[1], intersection_point[0],
+                                                                     vector1[1][1], vector1[1][0])
+        from_destination_to_intersection = great_circle_vec_check_for_nan(intersection_point[1],
+                                                                          intersection_point[0],
+                                                                          vector2[1][1], vector2[1][0])
 
-    vec = [origin_border[-1], intersection_point]
-    vector = [extend_vector(vec,
-                            length=dist_delta + radius * (math.sin(to_rad(angle * i / float(number_of_points)))),
-                            backward=False
-                            )[1]
-              for i in range(0, number_of_points + 1)
-              ]
+        bearing1 = get_compass(vector1[1], vector1[0])
+        bearing2 = get_compass(vector2[0], vector2[1])
+        angle = ((turn_direction*(bearing2 - bearing1) + 360) % 360)
 
-    return [shift_by_bearing_and_distance(vector[i], shift[i], vec, bearing_delta=turn_direction*90.0)
-            for i in range(0, number_of_points + 1)
-            ]
+        if from_origin_to_intersection < from_destination_to_intersection:
+            distance_to_starting_point = from_origin_to_intersection
+            dist_delta = 0.0
+        else:
+            distance_to_starting_point = from_destination_to_intersection
+            dist_delta = from_origin_to_intersection - from_destination_to_intersection
+
+        radius = distance_to_starting_point / math.tan(to_rad(angle / 2.0))
+        arc_shifts.append(turn_direction * 2.0 * radius
+                          * np.sin(to_rad(angle / 2.0 * steps / float(number_of_points))) ** 2
+                          )
+
+        # Points along the vector from the end of the origin border through the intersection point, see extend_vector
+        vec = [origin_border[-1], intersection_point]
+        current_distance = great_circle_vec_check_for_nan(vec[0][1], vec[0][0], vec[1][1], vec[1][0])
+        if current_distance < 0.01:
+            arc_points.append(np.tile(np.array(vec[1], dtype=np.float64), (number_of_points + 1, 1)))
+        else:
+            scale = (dist_delta + radius * np.sin(to_rad(angle * steps / float(number_of_points)))) / current_distance
+            arc_points.append(np.column_stack((vec[0][0] + (vec[1][0] - vec[0][0]) * scale,
+                                               vec[0][1] + (vec[1][1] - vec[0][1]) * scale
+                                               )))
+        direction_references.append(np.array(vec, dtype=np.float64))
+        arc_indices.append(k)
+
+    if not arc_indices:
+        return arcs
+
+    shifted = shift_points_by_bearing_and_distance(np.concatenate(arc_points),
+                                                   np.concatenate(arc_shifts),
+                                                   np.repeat(np.array(direction_references),
+                                                             number_of_points + 1,
+                                                             axis=0
+                                                             ),
+                                                   bearing_delta=turn_direction*90.0
+                                                   ).tolist()
+    for j, k in enumerate(arc_indices):
+        arcs[k] = [tuple(p) for p in shifted[j*(number_of_points + 1):(j + 1)*(number_of_points + 1)]]
+
+    return arcs
 
 
 def get_turn_border(origin_lane,
@@ -183,7 +230,9 @@ def get_turn_border(origin_lane,
                     all_lanes,
                     border_type='left',
                     turn_direction=1,
-                    use_shaped_border=False
+                    use_shaped_border=False,
+                    number_of_points=12,
+                    lane_graph=None
                     ):
     """
     Create a border for a left or rigth guideway.  U-turn guideways are constructed by a separate function
@@ -193,54 +242,94 @@ def get_turn_border(origin_lane,
     :param border_type: string either 'left' ot 'right'
     :param turn_direction: -1 if left turn, otherwise 1
     :param use_shaped_border: True if apply a shaped border for turning lane, otherwise False
+    :param number_of_points: integer, number of turn arc segments
+    :param lane_graph: LaneGraph of all lanes or None
     :return: list of coordinates
     """
-    shaped_border = border_type + '_shaped_border'
-    non_shaped_border = border_type + '_border'
-
-    if border_type == 'median':
-        non_shaped_border = 'median'
-        origin_border = origin_lane['median']
-    elif not use_shaped_border:
-        origin_border = origin_lane[non_shaped_border]
-    elif shaped_border not in origin_lane or origin_lane[shaped_border] is None:
-        origin_border = origin_lane[non_shaped_border]
-    else:
-        origin_border = origin_lane[shaped_border]
-
-    destination_border = destination_lane[non_shaped_border]
-
+    return get_turn_borders(origin_lane,
+                            destination_lane,
+                            all_lanes,
+                            border_types=[border_type],
+                            turn_direction=turn_direction,
+                            use_shaped_border=use_shaped_border,
+                            number_of_points=number_of_points,
+                            lane_graph=lane_graph
+                            )[0]
+
+
+def get_turn_borders(origin_lane,
+                     destination_lane,
+                     all_lanes,
+                     border_types=('left', 'right', 'median'),
+                     turn_direction=1,
+                     use_shaped_border=False,
+                     number_of_points=12,
+                     lane_graph=None
+                     ):
+    """
+    Create borders for a left or right guideway.  The turn arcs of all borders are constructed together.
+    :param origin_lane: dictionary
+    :param destination_lane: dictionary
+    :param all_lanes: list of dictionaries
+    :param border_types: list of strings, each either 'left', 'right' or 'median'
+    :param turn_direction: -1 if left turn, otherwise 1
+    :param use_shaped_border: True if apply a shaped border for turning lane, otherwise False
+    :param number_of_points: integer, number of turn arc segments
+    :param lane_graph: LaneGraph of all lanes or None
+    :return: list of borders in the order of border types, a border is a list of coordinates or None
+    """
     if turn_direction > 0:
         crosswalk_width = origin_lane['crosswalk_width']
     else:
         crosswalk_width = 5*origin_lane['crosswalk_width']
 
-    shorten_origin_border = shorten_border_for_crosswalk(origin_border,
-                                                         origin_lane['name'],
-                                                         all_lanes,
-                                                         destination='to_intersection',
-                                                         crosswalk_width=crosswalk_width
-                                                         )
-    shorten_destination_border = shorten_border_for_crosswalk(destination_border,
-                                                              destination_lane['name'],
-                                                              all_lanes,
-                                                              destination='from_intersection',
-                                                              crosswalk_width=crosswalk_width
-                                                              )
-
-    if turn_direction < 0:
-        turn_arc = construct_turn_arc(shorten_origin_border,
-                                      shorten_destination_border,
-                                      turn_direction=turn_direction,
-                                      )
-    else:
-        turn_arc = construct_turn_arc(shorten_origin_border,
-                                      shorten_destination_border,
-                                      turn_direction=turn_direction,
-                                      )
-
-    if turn_arc is None:
-        logger.debug('Turn arc failed. Origin id %d, Dest id %d' % (origin_lane['id'], destination_lane['id']))
-        return None
-
-    return shorten_origin_border + turn_arc[1:-1] + shorten_destination_border
+    if lane_graph is None:
+        lane_graph = LaneGraph(all_lanes)
+    crosswalk_index = lane_graph.get_crosswalk_index(crosswalk_width)
+
+    shorten_borders = []
+    for border_type in border_types:
+        shaped_border = border_type + '_shaped_border'
+        non_shaped_border = border_type + '_border'
+
+        if border_type == 'median':
+            non_shaped_border = 'median'
+            origin_border = origin_lane['median']
+        elif not use_shaped_border:
+            origin_border = origin_lane[non_shaped_border]
+        elif shaped_border not in origin_lane or origin_lane[shaped_border] is None:
+            origin_border = origin_lane[non_shaped_border]
+        else:
+            origin_border = origin_lane[shaped_border]
+
+        destination_border = destination_lane[non_shaped_border]
+
+        shorten_origin_border = shorten_border_for_crosswalk(origin_border,
+                                                             origin_lane['name'],
+                                                             all_lanes,
+                                                             destination='to_intersection',
+                                                             crosswalk_width=crosswalk_width,
+                                                             crosswalk_index=crosswalk_index
+                                                             )
+        shorten_destination_border = shorten_border_for_crosswalk(destination_border,
+                                                                  destination_lane['name'],
+                                                                  all_lanes,
+                                                                  destination='from_intersection',
+                                                                  crosswalk_width=crosswalk_width,
+                                                                  crosswalk_index=crosswalk_index
+                                                                  )
+        shorten_borders.append((shorten_origin_border, shorten_destination_border))
+
+    turn_arcs = construct_turn_arcs(shorten_borders,
+                                    number_of_points=number_of_points,
+                                    turn_direction=turn_direction
+                                    )
+
+    borders = []
+    for (shorten_origin_border, shorten_destination_border), turn_arc in zip(shorten_borders, turn_arcs):
+        if turn_arc is None:
+            logger.debug('Turn arc failed. Origin id %d, Dest id %d' % (origin_lane['id'], destination_lane['id']))
+            borders.append(None)
+        else:
+            borders.append(shorten_origin_border + turn_arc[1:-1] + shorten_destination_border)
+    return borders
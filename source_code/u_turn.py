@@ -9,7 +9,7 @@
 
 import math
 import shapely.geometry as geom
-from lane import get_lane_index_from_left
+from lane import get_lane_index_from_left, LaneGraph
 from turn import shorten_border_for_crosswalk
 from border import get_angle_between_bearings, shift_by_bearing_and_distance, cut_border_by_distance,\
     get_distance_between_points, get_compass, extend_vector, to_rad, extend_origin_border, extend_destination_border,\
@@ -39,22 +39,22 @@ def is_u_turn_allowed(origin_lane, x_data):
     return True
 
 
-def get_destination_lanes_for_u_turn(origin_lane, all_lanes):
+def get_destination_lanes_for_u_turn(origin_lane, all_lanes, lane_graph=None):
     """
     Identifying the destination lane for the u-turn.
     Assuming that the origin and destination lanes must have the index from left equal to zero.
     :param origin_lane: lane dictionary of a left turn
     :param all_lanes: list of dictionaries
+    :param lane_graph: LaneGraph of all lanes or None
     :return: list of valid lane destinations for the left turn
     """
     if origin_lane['name'] == 'no_name':
         return []
+    if lane_graph is None:
+        lane_graph = LaneGraph(all_lanes)
 
-    return [l for l in all_lanes
-            if l['name'] == origin_lane['name']
-            and l['direction'] == 'from_intersection'
-            and get_lane_index_from_left(l) == 0
-            and abs(get_angle_between_bearings(origin_lane['bearing'], l['bearing'])) > 150.0
+    return [l for l in lane_graph.get_opposite_lanes(origin_lane)
+            if abs(get_angle_between_bearings(origin_lane['bearing'], l['bearing'])) > 150.0
             and get_distance_between_points(l['left_border'][0], origin_lane['left_border'][-1]) < 25.0
             and get_distance_between_points(l['left_border'][0], l['left_border'][-1]) > 25.0
             ]
@@ -86,13 +86,14 @@ def get_u_turn_radius_and_landing_border(origin_border, destination_border):
     return get_distance_between_points(origin_border[-1], pt)/2.0, list(landing_line.coords)
 
 
-def get_u_turn_border(origin_lane, destination_lane, all_lanes, border_type='left'):
+def get_u_turn_border(origin_lane, destination_lane, all_lanes, border_type='left', lane_graph=None):
     """
     Construct a border of a u-turn guideway
     :param origin_lane: dictionary
     :param destination_lane: dictionary
     :param all_lanes: list of dictionaries
     :param border_type: string: either 'left' or 'right' or 'median'
+    :param lane_graph: LaneGraph of all lanes or None
     :return: list of coordinates
     """
 
@@ -104,33 +105,39 @@ def get_u_turn_border(origin_lane, destination_lane, all_lanes, border_type='lef
         origin_border = origin_lane[border_type + '_border']
 
     cut_size = origin_lane['crosswalk_width']*5.0
+    if lane_graph is None:
+        lane_graph = LaneGraph(all_lanes)
 
     shorten_origin_border = shorten_border_for_crosswalk(origin_border,
                                                          origin_lane['name'],
                                                          all_lanes,
                                                          destination='to_intersection',
-                                                         crosswalk_width=cut_size
+                                                         crosswalk_width=cut_size,
+                                                         crosswalk_index=lane_graph.get_crosswalk_index(cut_size)
                                                          )
     shorten_origin_border = extend_origin_border(shorten_origin_border, length=cut_size, relative=True)
     shorten_origin_border = shorten_border_for_crosswalk(shorten_origin_border,
                                                          origin_lane['name'],
                                                          all_lanes,
                                                          destination='to_intersection',
-                                                         crosswalk_width=0.0
+                                                         crosswalk_width=0.0,
+                                                         crosswalk_index=lane_graph.get_crosswalk_index(0.0)
                                                          )
 
     shorten_destination_border = shorten_border_for_crosswalk(destination_border,
                                                               destination_lane['name'],
                                                               all_lanes,
                                                               destination='from_intersection',
-                                                              crosswalk_width=cut_size
+                                                              crosswalk_width=cut_size,
+                                                              crosswalk_index=lane_graph.get_crosswalk_index(cut_size)
                                                               )
     shorten_destination_border = extend_destination_border(shorten_destination_border, length=cut_size, relative=True)
     shorten_destination_border = shorten_border_for_crosswalk(shorten_destination_border,
                                                               destination_lane['name'],
                                                               all_lanes,
                                                               destination='from_intersection',
-                                                              crosswalk_width=0.0
+                                                              crosswalk_width=0.0,
+                                                              crosswalk_index=lane_graph.get_crosswalk_index(0.0)
                                                               )
 
     turn_arc = construct_u_turn_arc(shorten_origin_border, shorten_destination_border)